@@ -0,0 +1,174 @@
+# almacenamiento.py
+"""
+Dónde se guardan los PDFs generados. Dos backends con la misma interfaz:
+- "supabase" (por defecto): bucket de Supabase Storage (ver storage_supabase).
+- "local": carpeta SALIDA_PDFS; la API los sirve en GET /pdf/{folio}.
+Se elige con ALMACENAMIENTO=supabase|local.
+"""
+import os
+import uuid
+import hashlib
+import threading
+import datetime as dt
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import metricas
+import storage_supabase
+
+ALMACENAMIENTO = os.getenv("ALMACENAMIENTO", "supabase").strip().lower()
+SALIDA_PDFS = os.getenv("SALIDA_PDFS", "out")
+# Bytes por bloque al leer objetos (leer())
+TAMANO_BLOQUE = 256 * 1024
+
+class Almacenamiento:
+    """
+    Interfaz de los backends. `guardar()` devuelve un Future con la URL pública del
+    objeto, o None si el backend no tiene una propia (el PDF se sirve en /pdf/{folio}).
+    """
+    nombre = ""
+
+    def guardar(self, data: bytes, nombre: str, solo_si_cambia: bool = False) -> Future:
+        raise NotImplementedError
+
+    def eliminar(self, nombre: str) -> bool:
+        raise NotImplementedError
+
+    def eliminar_varios(self, nombres: Iterable[str]) -> int:
+        """Elimina varios objetos (los que no existen se ignoran); devuelve cuántos se borraron."""
+        return sum(self.eliminar(n) for n in nombres)
+
+    def listar(self) -> Iterator[dict]:
+        """Objetos guardados como dicts con al menos `name` y `created_at` (ISO 8601)."""
+        raise NotImplementedError
+
+    def leer(self, nombre: str) -> Iterator[bytes]:
+        """Contenido del objeto por bloques. FileNotFoundError (al llamar) si no existe."""
+        raise NotImplementedError
+
+    def ruta_local(self, nombre: str) -> Optional[Path]:
+        """Ruta en disco del objeto si este backend la tiene (para servirlo directo)."""
+        return None
+
+    def close(self):
+        pass
+
+class AlmacenamientoSupabase(Almacenamiento):
+    nombre = "supabase"
+
+    def __init__(self, uploader: Optional[storage_supabase.SupabaseUploader] = None):
+        self._uploader = uploader
+
+    @property
+    def uploader(self) -> storage_supabase.SupabaseUploader:
+        return self._uploader or storage_supabase.get_uploader()
+
+    def guardar(self, data: bytes, nombre: str, solo_si_cambia: bool = False) -> Future:
+        if solo_si_cambia:
+            return self.uploader.subir_si_cambia(data, dest_name=nombre)
+        return self.uploader.subir(data, dest_name=nombre)
+
+    def eliminar(self, nombre: str) -> bool:
+        return storage_supabase.delete_object(nombre)
+
+    def eliminar_varios(self, nombres: Iterable[str]) -> int:
+        return self.uploader.eliminar_varios(nombres)
+
+    def listar(self) -> Iterator[dict]:
+        return self.uploader.listar_objetos()
+
+    def leer(self, nombre: str) -> Iterator[bytes]:
+        return self.uploader.descargar(nombre)
+
+class AlmacenamientoLocal(Almacenamiento):
+    """PDFs en una carpeta local. Las escrituras son atómicas (archivo temporal + rename)."""
+    nombre = "local"
+
+    def __init__(self, directorio: str = SALIDA_PDFS):
+        self.directorio = Path(directorio).resolve()
+        self.directorio.mkdir(parents=True, exist_ok=True)
+
+    def ruta_local(self, nombre: str) -> Optional[Path]:
+        ruta = (self.directorio / nombre).resolve()
+        # Un pdf_path manipulado no debe salir de la carpeta
+        if ruta.parent != self.directorio:
+            return None
+        return ruta
+
+    def _guardar(self, data: bytes, nombre: str, solo_si_cambia: bool):
+        ruta = self.ruta_local(nombre)
+        if ruta is None:
+            raise ValueError(f"Nombre de objeto inválido: {nombre}")
+        with metricas.medir_etapa("upload"):
+            if solo_si_cambia and ruta.is_file() and ruta.stat().st_size == len(data):
+                if hashlib.sha256(ruta.read_bytes()).digest() == hashlib.sha256(data).digest():
+                    return
+            tmp = ruta.with_name(f".{ruta.name}.{uuid.uuid4().hex}.tmp")
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, ruta)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+
+    def guardar(self, data: bytes, nombre: str, solo_si_cambia: bool = False) -> Future:
+        fut: Future = Future()
+        try:
+            self._guardar(data, nombre, solo_si_cambia)
+            fut.set_result(None)
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def eliminar(self, nombre: str) -> bool:
+        ruta = self.ruta_local(nombre)
+        if ruta is None or not ruta.is_file():
+            return False
+        ruta.unlink()
+        return True
+
+    def leer(self, nombre: str) -> Iterator[bytes]:
+        ruta = self.ruta_local(nombre)
+        if ruta is None or not ruta.is_file():
+            raise FileNotFoundError(nombre)
+        f = open(ruta, "rb")
+
+        def bloques():
+            with f:
+                while True:
+                    bloque = f.read(TAMANO_BLOQUE)
+                    if not bloque:
+                        return
+                    yield bloque
+        return bloques()
+
+    def listar(self) -> Iterator[dict]:
+        with os.scandir(self.directorio) as entradas:
+            for e in entradas:
+                if e.is_file() and not e.name.startswith("."):
+                    st = e.stat()
+                    creado = dt.datetime.fromtimestamp(st.st_mtime, dt.timezone.utc)
+                    yield {"name": e.name, "created_at": creado.isoformat(), "size": st.st_size}
+
+BACKENDS = {"supabase": AlmacenamientoSupabase, "local": AlmacenamientoLocal}
+
+_almacenamiento: Optional[Almacenamiento] = None
+_almacenamiento_pid: Optional[int] = None
+_almacenamiento_lock = threading.Lock()
+
+def crear_almacenamiento(nombre: str = ALMACENAMIENTO) -> Almacenamiento:
+    try:
+        return BACKENDS[nombre]()
+    except KeyError:
+        raise ValueError(f"ALMACENAMIENTO desconocido '{nombre}' (opciones: {', '.join(BACKENDS)})")
+
+def get_almacenamiento() -> Almacenamiento:
+    """Backend compartido por el proceso (se crea al primer uso y tras un fork)."""
+    global _almacenamiento, _almacenamiento_pid
+    with _almacenamiento_lock:
+        if _almacenamiento is None or _almacenamiento_pid != os.getpid():
+            _almacenamiento = crear_almacenamiento()
+            _almacenamiento_pid = os.getpid()
+        return _almacenamiento
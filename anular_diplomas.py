@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Anulación masiva de diplomas (estado ANULADO) y borrado de sus PDFs.
+- Se eligen por curso, por alumno o por lista de folios (combinables); solo cambian los VALIDO.
+- El estado cambia con un UPDATE por selección (uno por lote de folios si es una lista),
+  en la misma transacción que las estadísticas del panel.
+- Tras el commit se invalida la caché de verificación y los PDFs se borran del
+  almacenamiento por lotes (en Supabase, con el borrado múltiple y varios lotes a la vez).
+  La fila se conserva: /pdf/{folio} responde 410 y la verificación muestra ANULADO.
+La API lo expone en POST /admin/anular-action; desde la terminal:
+
+    python anular_diplomas.py --curso_id 3
+    python anular_diplomas.py --folios folios.txt --conservar-pdfs
+"""
+import sys
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import db_pool
+import metricas
+import estadisticas
+import almacenamiento
+import cache_verificacion
+
+# Folios por sentencia IN
+LOTE_FOLIOS = 500
+
+DIPLOMAS_ANULADOS = metricas.Contador("diplomas_anulados_total", "Diplomas anulados")
+
+SQL_SELECCION = "SELECT folio, curso_id, pdf_path FROM diploma WHERE estado = 'VALIDO' AND {filtro} FOR UPDATE"
+SQL_ANULAR = "UPDATE diploma SET estado = 'ANULADO' WHERE estado = 'VALIDO' AND {filtro}"
+
+@dataclass
+class ResultadoAnulacion:
+    folios: List[str] = field(default_factory=list)
+    pdfs_borrados: int = 0
+    # Si falló el borrado en el almacenamiento (los diplomas sí quedaron anulados)
+    error_almacenamiento: Optional[str] = None
+
+    @property
+    def anulados(self) -> int:
+        return len(self.folios)
+
+def limpiar_folios(folios: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(f.strip() for f in folios if f and f.strip()))
+
+def _filtros(curso_id: Optional[int], alumno_id: Optional[int],
+             folios: Optional[List[str]]) -> Iterator[Tuple[str, tuple]]:
+    """(condición, parámetros) de cada sentencia: una sola, o una por lote de folios."""
+    condiciones, params = [], []
+    if curso_id is not None:
+        condiciones.append("curso_id = %s")
+        params.append(curso_id)
+    if alumno_id is not None:
+        condiciones.append("alumno_id = %s")
+        params.append(alumno_id)
+    if folios is None:
+        if not condiciones:
+            raise ValueError("Indica un curso, un alumno o una lista de folios")
+        yield " AND ".join(condiciones), tuple(params)
+        return
+    for i in range(0, len(folios), LOTE_FOLIOS):
+        lote = folios[i:i + LOTE_FOLIOS]
+        yield " AND ".join([*condiciones, f"folio IN ({', '.join(['%s'] * len(lote))})"]), (*params, *lote)
+
+def anular(conn, curso_id: Optional[int] = None, alumno_id: Optional[int] = None,
+           folios: Optional[Iterable[str]] = None, borrar_pdfs: bool = True) -> ResultadoAnulacion:
+    """Anula los diplomas VALIDO de la selección y, con `borrar_pdfs`, elimina sus PDFs."""
+    if folios is not None:
+        folios = limpiar_folios(folios)
+    estadisticas.asegurar_tablas(conn)
+    filas = []
+    cur = conn.cursor(dictionary=True)
+    try:
+        for filtro, params in _filtros(curso_id, alumno_id, folios):
+            cur.execute(SQL_SELECCION.format(filtro=filtro), params)
+            filas.extend(cur.fetchall())
+            cur.execute(SQL_ANULAR.format(filtro=filtro), params)
+        estadisticas.sumar(cur, diplomas_anulados=len(filas))
+        estadisticas.sumar_cursos(cur, anulados=Counter(f["curso_id"] for f in filas))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    resultado = ResultadoAnulacion(folios=[f["folio"] for f in filas])
+    if not filas:
+        return resultado
+    DIPLOMAS_ANULADOS.inc(len(filas))
+    cache_verificacion.invalidar_folio(*resultado.folios)
+    estadisticas.invalidar_cache()
+    print(f"[Anular] {len(filas)} diploma(s) anulados.")
+
+    if borrar_pdfs:
+        nombres = [f["pdf_path"] for f in filas if f["pdf_path"]]
+        try:
+            resultado.pdfs_borrados = almacenamiento.get_almacenamiento().eliminar_varios(nombres)
+            print(f"[Anular] {resultado.pdfs_borrados} PDF(s) eliminados del almacenamiento.")
+        except Exception as e:
+            # Lo que quede se puede borrar a mano; el estado ya está confirmado
+            resultado.error_almacenamiento = str(e)
+            print(f"⚠️ [Anular] No se pudieron eliminar los PDFs: {e}")
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Anula diplomas en bloque y elimina sus PDFs")
+    parser.add_argument("--curso_id", type=int, help="Todos los diplomas vigentes del curso")
+    parser.add_argument("--alumno_id", type=int, help="Todos los diplomas vigentes del alumno")
+    parser.add_argument("--folios", metavar="ARCHIVO", help="Archivo con un folio por línea ('-' = entrada estándar)")
+    parser.add_argument("--conservar-pdfs", action="store_true", help="Solo cambia el estado; no borra los PDFs")
+    args = parser.parse_args()
+
+    folios = None
+    if args.folios:
+        fuente = sys.stdin if args.folios == "-" else open(args.folios, encoding="utf-8")
+        with fuente:
+            folios = fuente.read().split()
+    if args.curso_id is None and args.alumno_id is None and folios is None:
+        parser.error("indica --curso_id, --alumno_id o --folios")
+
+    conn = db_pool.get_connection()
+    try:
+        resultado = anular(conn, args.curso_id, args.alumno_id, folios, borrar_pdfs=not args.conservar_pdfs)
+    finally:
+        if conn and conn.is_connected(): conn.close()
+    if not resultado.anulados:
+        print("No hay diplomas vigentes que coincidan.")
+    return 1 if resultado.error_almacenamiento else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
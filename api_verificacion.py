@@ -1,18 +1,35 @@
 # api_verificacion.py - VERSIÓN CON CARGA DE CSV Y GENERACIÓN WEB
 import os
+import time
 import mysql.connector
-import csv
-import io
-from fastapi import FastAPI, Request, Query, HTTPException, Form, UploadFile, File, BackgroundTasks
-from fastapi.responses import HTMLResponse, PlainTextResponse, FileResponse, RedirectResponse
+import tempfile
+from fastapi import FastAPI, Request, Query, HTTPException, Form, UploadFile, File
+from fastapi.responses import HTMLResponse, PlainTextResponse, FileResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from datetime import datetime
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from pydantic import BaseModel
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Importamos la lógica de generación de diplomas como un módulo
-import generar_diplomas as gen
+# La generación de diplomas corre en worker_diplomas.py; aquí solo se encola
+import trabajos
+import db_pool
+import cache_verificacion
+import importar_alumnos
+import metricas
+import estadisticas
+import reporte_diplomas
+import verificar_pdf
+import almacenamiento
+import descarga_pdf
+import diferido
+import zip_curso
+import anular_diplomas
+import concurrencia
 
 # ✅ CARGAR VARIABLES DE ENTORNO DESDE .env
 load_dotenv()
@@ -23,18 +40,55 @@ load_dotenv()
 
 app = FastAPI(title="Diplomas Proyecto", version="2.0.0")
 
-templates = Jinja2Templates(directory="templates")
+class PlantillasMedidas(Jinja2Templates):
+    """Jinja2Templates que registra el tiempo de render de cada plantilla."""
+    def TemplateResponse(self, *args, **kwargs):
+        nombre = args[0] if args and isinstance(args[0], str) else kwargs.get("name", "desconocida")
+        with metricas.HTTP_PLANTILLA_SEGUNDOS.medir(plantilla=nombre):
+            return super().TemplateResponse(*args, **kwargs)
 
-# Variables de entorno
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = int(os.getenv("DB_PORT", "3306")) if os.getenv("DB_PORT") else 3306
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_NAME = os.getenv("DB_NAME")
+templates = PlantillasMedidas(directory="templates")
 
+# Variables de entorno (las de la BD se leen en db_pool)
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
+# Si se define, /metrics exige ?token=METRICS_TOKEN
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Consultas a la BD a la vez desde los endpoints públicos; si no hay cupo en DB_ESPERA_MAX
+# segundos se responde 503 con Retry-After: DB_RETRY_AFTER
+DB_CONCURRENCIA = int(os.getenv("DB_CONCURRENCIA", str(db_pool.DB_POOL_SIZE)))
+DB_ESPERA_MAX = float(os.getenv("DB_ESPERA_MAX", "0.25"))
+DB_RETRY_AFTER = int(os.getenv("DB_RETRY_AFTER", "2"))
+# Máximo de folios por solicitud a POST /api/verificar
+VERIFICAR_LOTE_MAX = int(os.getenv("VERIFICAR_LOTE_MAX", "500"))
+# Tamaño máximo del PDF en POST /api/verificar-pdf
+VERIFICAR_PDF_MAX_MB = float(os.getenv("VERIFICAR_PDF_MAX_MB", "20"))
+
+LIMITE_BD = concurrencia.LimiteConcurrencia("bd_publica", DB_CONCURRENCIA, DB_ESPERA_MAX, DB_RETRY_AFTER)
+# Consultas idénticas simultáneas (mismo folio, misma CURP) comparten una sola ida a la BD
+CONSULTAS_COALESCIDAS = metricas.Contador("http_consultas_coalescidas_total", "Solicitudes que esperaron una consulta idéntica en curso", ["endpoint"])
+VUELOS_FOLIO = concurrencia.UnSoloVuelo(CONSULTAS_COALESCIDAS, endpoint="folio")
+VUELOS_CURP = concurrencia.UnSoloVuelo(CONSULTAS_COALESCIDAS, endpoint="ingresar")
+
+@app.exception_handler(concurrencia.Saturado)
+def bd_saturada(request: Request, exc: concurrencia.Saturado):
+    return PlainTextResponse("Servicio saturado, intenta de nuevo en unos segundos.", status_code=503,
+                             headers={"Retry-After": str(exc.reintentar_en)})
+
+@app.middleware("http")
+async def medir_solicitudes(request: Request, call_next):
+    t0 = time.perf_counter()
+    codigo = 500
+    try:
+        response = await call_next(request)
+        codigo = response.status_code
+        return response
+    finally:
+        # Se usa la plantilla de la ruta (/verificar/{folio}) para no crear una serie por folio
+        ruta = getattr(request.scope.get("route"), "path", "sin_ruta")
+        metricas.HTTP_DURACION.observar(time.perf_counter() - t0, ruta=ruta)
+        metricas.HTTP_SOLICITUDES.inc(ruta=ruta, metodo=request.method, codigo=codigo)
 
 # =============================
 # FUNCIONES AUXILIARES
@@ -42,14 +96,75 @@ ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
 
 def get_db_connection():
     try:
-        return mysql.connector.connect(
-            host=DB_HOST, port=DB_PORT, user=DB_USER,
-            password=DB_PASSWORD, database=DB_NAME
-        )
+        return db_pool.get_connection()
     except mysql.connector.Error as e:
         print(f"❌ Error de conexión MySQL: {e}")
         return None
 
+SQL_DIPLOMA = "SELECT d.*, a.nombre AS alumno, a.curp, e.nombre AS escuela, IFNULL(c.nombre, '—') AS curso FROM diploma d JOIN alumno a ON d.alumno_id = a.alumno_id LEFT JOIN curso c ON d.curso_id = c.curso_id LEFT JOIN escuela e ON a.escuela_id = e.escuela_id"
+SQL_DIPLOMA_POR_FOLIO = SQL_DIPLOMA + " WHERE d.folio = %s"
+
+def _firma_diplomas():
+    conn = db_pool.get_connection()
+    try:
+        return estadisticas.firma_diplomas(conn)
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+# Anulaciones y folios nuevos de otros procesos vacían la caché en a lo más VERIFICACION_CACHE_SYNC s
+cache_verificacion.VERIFICACION.sincronizar_con(_firma_diplomas, cache_verificacion.VERIFICACION_CACHE_SYNC)
+
+def _consultar_diploma(folio: str, endpoint: str):
+    epoca = cache_verificacion.VERIFICACION.epoca
+    with LIMITE_BD.ocupar(), metricas.HTTP_DB_SEGUNDOS.medir(endpoint=endpoint):
+        conn = get_db_connection()
+        if not conn:
+            raise ConnectionError("No se pudo conectar a la base de datos")
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute(SQL_DIPLOMA_POR_FOLIO, (folio,))
+            diploma = cur.fetchone()
+        finally:
+            if conn and conn.is_connected(): conn.close()
+    cache_verificacion.VERIFICACION.set(folio, diploma, epoca)
+    return diploma
+
+def buscar_diploma(folio: str, endpoint: str):
+    """
+    Diploma por folio (pasando por la caché) o None. Las búsquedas simultáneas del mismo
+    folio hacen una sola consulta. Lanza ConnectionError si no hay BD y Saturado sin cupo.
+    """
+    encontrado, diploma = cache_verificacion.VERIFICACION.get(folio)
+    if encontrado:
+        return diploma
+    return VUELOS_FOLIO.ejecutar(folio, _consultar_diploma, folio, endpoint)
+
+def buscar_diplomas(folios: List[str], endpoint: str) -> Dict[str, Optional[dict]]:
+    """Varios folios con una sola consulta IN para los que no están en la caché."""
+    resultado, faltantes = {}, []
+    for folio in folios:
+        encontrado, diploma = cache_verificacion.VERIFICACION.get(folio)
+        if encontrado:
+            resultado[folio] = diploma
+        else:
+            faltantes.append(folio)
+    if faltantes:
+        epoca = cache_verificacion.VERIFICACION.epoca
+        with LIMITE_BD.ocupar(), metricas.HTTP_DB_SEGUNDOS.medir(endpoint=endpoint):
+            conn = get_db_connection()
+            if not conn:
+                raise ConnectionError("No se pudo conectar a la base de datos")
+            try:
+                cur = conn.cursor(dictionary=True)
+                cur.execute(f"{SQL_DIPLOMA} WHERE d.folio IN ({', '.join(['%s'] * len(faltantes))})", faltantes)
+                filas = {row["folio"]: row for row in cur.fetchall()}
+            finally:
+                if conn and conn.is_connected(): conn.close()
+        for folio in faltantes:
+            resultado[folio] = filas.get(folio)
+            cache_verificacion.VERIFICACION.set(folio, resultado[folio], epoca)
+    return resultado
+
 def check_admin(token: str):
     if token != ADMIN_TOKEN:
         raise PermissionError("Token inválido o no autorizado.")
@@ -64,42 +179,147 @@ def home(request: Request):
         "request": request, "title": "Portal Escolar · Acceso Alumnos", "now": datetime.now().year
     })
 
+SQL_DIPLOMAS_POR_CURP = "SELECT IFNULL(c.nombre, '—') AS curso, d.folio, d.estado, d.fecha_emision, d.pdf_url FROM diploma d JOIN alumno a ON d.alumno_id = a.alumno_id LEFT JOIN curso c ON d.curso_id = c.curso_id WHERE a.curp = %s ORDER BY d.fecha_emision DESC"
+
+def diplomas_por_curp(curp: str) -> List[dict]:
+    """Diplomas del alumno para el portal. El resultado se comparte entre solicitudes simultáneas: no modificarlo."""
+    with LIMITE_BD.ocupar(), metricas.HTTP_DB_SEGUNDOS.medir(endpoint="ingresar"):
+        conn = get_db_connection()
+        if not conn:
+            raise ConnectionError("No se pudo conectar a la base de datos")
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute(SQL_DIPLOMAS_POR_CURP, (curp,))
+            diplomas = cur.fetchall()
+        finally:
+            if conn and conn.is_connected(): conn.close()
+    for d in diplomas:
+        if not (d.get("pdf_url") and d["pdf_url"].startswith(("http", "/pdf/"))):
+            d["pdf_url"] = None
+    return diplomas
+
 @app.get("/ingresar", response_class=HTMLResponse)
 def ingresar(request: Request, curp: str = Query(None)):
     if not curp:
         return templates.TemplateResponse("portal.html", {"request": request, "title": "Portal de Alumnos", "now": datetime.now().year})
-    conn = get_db_connection()
-    if not conn:
-        return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Error de conexión", "mensaje": "No se pudo conectar a la base de datos.", "color": "var(--bad)"})
     try:
-        cur = conn.cursor(dictionary=True)
-        query = "SELECT IFNULL(c.nombre, '—') AS curso, d.folio, d.estado, d.fecha_emision, d.pdf_url FROM diploma d JOIN alumno a ON d.alumno_id = a.alumno_id LEFT JOIN curso c ON d.curso_id = c.curso_id WHERE a.curp = %s ORDER BY d.fecha_emision DESC"
-        cur.execute(query, (curp,))
-        diplomas = cur.fetchall()
-        for d in diplomas:
-            if not (d.get("pdf_url") and d["pdf_url"].startswith("http")):
-                d["pdf_url"] = None
-        return templates.TemplateResponse("portal.html", {"request": request, "curp": curp, "diplomas": diplomas, "title": "Portal de Alumnos", "now": datetime.now().year})
-    finally:
-        if conn and conn.is_connected(): conn.close()
+        diplomas = VUELOS_CURP.ejecutar(curp, diplomas_por_curp, curp)
+    except ConnectionError:
+        return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Error de conexión", "mensaje": "No se pudo conectar a la base de datos.", "color": "var(--bad)"})
+    return templates.TemplateResponse("portal.html", {"request": request, "curp": curp, "diplomas": diplomas, "title": "Portal de Alumnos", "now": datetime.now().year})
 
 
 @app.get("/verificar/{folio}", response_class=HTMLResponse)
 def verificar(request: Request, folio: str):
-    conn = get_db_connection()
-    if not conn:
+    try:
+        diploma = buscar_diploma(folio, "verificar")
+    except ConnectionError:
         return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Error de conexión", "mensaje": "No se pudo conectar a la base de datos.", "color": "var(--bad)"})
+    if not diploma:
+        return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "No encontrado", "mensaje": f"El folio <code>{folio}</code> no existe.", "color": "var(--bad)"})
+    diploma = dict(diploma)
+    if not diploma.get("hash_sha256") and diploma.get("estado") != "ANULADO":
+        # Folio reservado en modo diferido: se genera ahora para poder mostrar el hash
+        pdf = diferido.asegurar_pdf(folio)
+        if pdf:
+            diploma.update(hash_sha256=pdf.sha256, pdf_url=pdf.pdf_url)
+    diploma["download_url"] = diploma["pdf_url"] if (diploma.get("pdf_url") or "").startswith(("http", "/pdf/")) else None
+    return templates.TemplateResponse("verificacion.html", {"request": request, "diploma": diploma, "title": f"Verificación - {diploma['alumno']}"})
+
+@app.api_route("/pdf/{folio}", methods=["GET", "HEAD"])
+def descargar_pdf(request: Request, folio: str):
+    """Sirve el PDF desde disco si el almacenamiento es local; si no, redirige a su URL pública."""
     try:
-        cur = conn.cursor(dictionary=True)
-        query = "SELECT d.*, a.nombre AS alumno, a.curp, e.nombre AS escuela, IFNULL(c.nombre, '—') AS curso FROM diploma d JOIN alumno a ON d.alumno_id = a.alumno_id LEFT JOIN curso c ON d.curso_id = c.curso_id LEFT JOIN escuela e ON a.escuela_id = e.escuela_id WHERE d.folio = %s"
-        cur.execute(query, (folio,))
-        diploma = cur.fetchone()
-        if not diploma:
-            return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "No encontrado", "mensaje": f"El folio <code>{folio}</code> no existe.", "color": "var(--bad)"})
-        diploma["download_url"] = diploma["pdf_url"] if diploma.get("pdf_url", "").startswith("http") else None
-        return templates.TemplateResponse("verificacion.html", {"request": request, "diploma": diploma, "title": f"Verificación - {diploma['alumno']}"})
-    finally:
-        if conn and conn.is_connected(): conn.close()
+        diploma = buscar_diploma(folio, "pdf")
+    except ConnectionError:
+        raise HTTPException(status_code=503, detail="No se pudo conectar a la base de datos")
+    if not diploma:
+        raise HTTPException(status_code=404, detail="Folio no encontrado")
+    if diploma.get("estado") == "ANULADO":
+        raise HTTPException(status_code=410, detail="Diploma anulado")
+    if not diploma.get("hash_sha256"):
+        pdf = diferido.asegurar_pdf(folio)
+        if not pdf:
+            raise HTTPException(status_code=404, detail="Folio no encontrado")
+        diploma = {**diploma, "hash_sha256": pdf.sha256, "pdf_url": pdf.pdf_url, "pdf_path": pdf.pdf_path}
+        if pdf.pdf_bytes is not None and almacenamiento.get_almacenamiento().ruta_local(pdf.pdf_path) is None:
+            # Recién renderizado y sin copia en disco: se sirve desde memoria esta vez
+            return descarga_pdf.respuesta_bytes(pdf.pdf_bytes, pdf.sha256, f"diploma_{folio}.pdf")
+    ruta = almacenamiento.get_almacenamiento().ruta_local(diploma["pdf_path"]) if diploma.get("pdf_path") else None
+    if ruta and ruta.is_file():
+        return descarga_pdf.respuesta_pdf(request, ruta, diploma.get("hash_sha256"), f"diploma_{folio}.pdf")
+    pdf_url = diploma.get("pdf_url") or ""
+    # Evita redirigir a esta misma ruta si el archivo local no existe
+    if pdf_url.startswith("http") and not pdf_url.endswith(f"/pdf/{folio}"):
+        return RedirectResponse(url=pdf_url, status_code=302)
+    raise HTTPException(status_code=404, detail="PDF no disponible")
+
+class SolicitudVerificacion(BaseModel):
+    folios: List[str]
+
+@app.post("/api/verificar")
+def verificar_lote(solicitud: SolicitudVerificacion):
+    """Verifica hasta VERIFICAR_LOTE_MAX folios en una sola llamada (JSON)."""
+    folios = list(dict.fromkeys(f.strip() for f in solicitud.folios if f and f.strip()))
+    if len(folios) > VERIFICAR_LOTE_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {VERIFICAR_LOTE_MAX} folios por solicitud")
+    try:
+        diplomas = buscar_diplomas(folios, "verificar_lote") if folios else {}
+    except ConnectionError:
+        raise HTTPException(status_code=503, detail="No se pudo conectar a la base de datos")
+    resultados = []
+    for folio in folios:
+        d = diplomas.get(folio)
+        if not d:
+            resultados.append({"folio": folio, "encontrado": False})
+            continue
+        resultados.append({
+            "folio": folio,
+            "encontrado": True,
+            "estado": d["estado"],
+            "alumno": d["alumno"],
+            "curso": d["curso"],
+            "escuela": d["escuela"],
+            "fecha_emision": d["fecha_emision"].isoformat() if d.get("fecha_emision") else None,
+            # None si el PDF aún no se genera (modo diferido)
+            "hash_sha256": d.get("hash_sha256"),
+        })
+    return {"total": len(resultados), "encontrados": sum(r["encontrado"] for r in resultados), "resultados": resultados}
+
+@app.post("/api/verificar-pdf")
+async def verificar_archivo(request: Request):
+    """
+    Dice si el PDF subido es un diploma emitido sin modificar (SHA-256 contra hash_sha256).
+    Acepta multipart (campo `file`) o el PDF como cuerpo. El hash se calcula mientras llega
+    el cuerpo, sin guardarlo: si el archivo supera VERIFICAR_PDF_MAX_MB se responde 413 sin
+    leer el resto.
+    """
+    max_bytes = int(VERIFICAR_PDF_MAX_MB * 1024 * 1024)
+    demasiado_grande = HTTPException(status_code=413, detail=f"El archivo supera {VERIFICAR_PDF_MAX_MB:g} MB")
+    largo = request.headers.get("content-length", "")
+    if largo.isdigit() and int(largo) > max_bytes + verificar_pdf.MARGEN_MULTIPART:
+        raise demasiado_grande
+    try:
+        h = verificar_pdf.HashCuerpo(request.headers.get("content-type", ""), max_bytes)
+        async for bloque in request.stream():
+            h.alimentar(bloque)
+        sha = h.hexdigest()
+    except verificar_pdf.ArchivoDemasiadoGrande:
+        raise demasiado_grande
+    except verificar_pdf.CuerpoInvalido as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return await run_in_threadpool(_dictamen_archivo, sha)
+
+def _dictamen_archivo(sha: str) -> dict:
+    with LIMITE_BD.ocupar(), metricas.HTTP_DB_SEGUNDOS.medir(endpoint="verificar_pdf"):
+        conn = get_db_connection()
+        if not conn:
+            raise HTTPException(status_code=503, detail="No se pudo conectar a la base de datos")
+        try:
+            diploma = verificar_pdf.buscar_por_hash(conn, [sha]).get(sha)
+        finally:
+            if conn and conn.is_connected(): conn.close()
+    return verificar_pdf.dictamen(sha, diploma)
 
 # =============================
 # SISTEMA DE ACCESO ADMIN
@@ -120,22 +340,18 @@ def admin_auth(username: str = Form(...), password: str = Form(...)):
 def admin_panel(request: Request, token: str = Query(...)):
     try:
         check_admin(token)
-        conn = get_db_connection()
         stats = {}
-        if conn:
-            try:
-                cur = conn.cursor(dictionary=True)
-                cur.execute("SELECT COUNT(*) as total FROM alumno")
-                stats['total_alumnos'] = cur.fetchone()['total']
-                cur.execute("SELECT COUNT(*) as total FROM diploma")
-                stats['total_diplomas'] = cur.fetchone()['total']
-                cur.execute("SELECT COUNT(*) as total FROM curso")
-                stats['total_cursos'] = cur.fetchone()['total']
-                stats['sistema_estado'] = "✅"
-            finally:
-                if conn.is_connected(): conn.close()
-        else:
-            stats['sistema_estado'] = "❌"
+        with metricas.HTTP_DB_SEGUNDOS.medir(endpoint="admin_panel"):
+            conn = get_db_connection()
+            if conn:
+                try:
+                    # Contadores mantenidos por el importador y el generador (ver estadisticas.py)
+                    stats.update(estadisticas.leer(conn))
+                    stats['sistema_estado'] = "✅"
+                finally:
+                    if conn.is_connected(): conn.close()
+            else:
+                stats['sistema_estado'] = "❌"
         return templates.TemplateResponse("admin-panel.html", {"request": request, "token": token, **stats, "admin_username": ADMIN_USERNAME, "now": datetime.now().year})
     except PermissionError:
         return RedirectResponse(url="/admin-login?error=Acceso+no+autorizado", status_code=302)
@@ -150,7 +366,7 @@ def admin_logout():
 # =======================================================
 
 @app.post("/admin/upload-alumnos", response_class=HTMLResponse)
-async def upload_alumnos_csv(request: Request, token: str = Query(...), file: UploadFile = File(...)):
+def upload_alumnos_csv(request: Request, token: str = Query(...), file: UploadFile = File(...)):
     try:
         check_admin(token)
     except PermissionError:
@@ -159,71 +375,228 @@ async def upload_alumnos_csv(request: Request, token: str = Query(...), file: Up
     if not file.filename.endswith('.csv'):
         return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Error de Archivo", "mensaje": "El archivo debe ser de tipo CSV."})
 
-    content = await file.read()
-    stream = io.StringIO(content.decode("utf-8"))
-    reader = csv.DictReader(stream)
+    conn = get_db_connection()
+    if not conn:
+        return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Error de conexión", "mensaje": "No se pudo conectar a la base de datos.", "color": "var(--bad)"})
+    try:
+        # El CSV debe tener: nombre, curp, escuela_id y opcionalmente grado_id, profesor_id
+        with metricas.HTTP_DB_SEGUNDOS.medir(endpoint="upload_alumnos"):
+            resultado = importar_alumnos.importar_csv(file.file, conn)
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+    titulo, color, encabezado = "Resultado de Carga", None, "Carga completada."
+    if resultado.error_codificacion:
+        # Los bloques anteriores al byte inválido sí quedaron guardados
+        titulo, color, encabezado = "Carga incompleta", "var(--bad)", f"<strong>{resultado.error_codificacion}</strong>"
+    mensaje = f"{encabezado}<br>Filas leídas: {resultado.filas}<br>Alumnos nuevos: {resultado.nuevos}<br>Alumnos actualizados: {resultado.actualizados}"
+    if resultado.progreso:
+        mensaje += "<br><br><strong>Progreso:</strong><br>" + "<br>".join(resultado.progreso)
+    if resultado.errores:
+        mensaje += f"<br><br><strong>Errores ({resultado.total_errores}):</strong><br>" + "<br>".join(resultado.errores)
+        if resultado.total_errores > len(resultado.errores):
+            mensaje += f"<br>… y {resultado.total_errores - len(resultado.errores)} más."
 
-    alumnos_nuevos = 0
-    alumnos_actualizados = 0
-    errores = []
+    return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": titulo, "mensaje": mensaje, "color": color})
+
+
+@app.post("/admin/generar-diplomas-action", response_class=HTMLResponse)
+def generar_diplomas_action(request: Request, token: str = Query(...), curso_id: int = Form(...)):
+    """ Encola la generación de diplomas de un curso; la ejecuta worker_diplomas.py. """
+    try:
+        check_admin(token)
+    except PermissionError:
+        return RedirectResponse(url="/admin-login?error=Token+inválido", status_code=302)
 
     conn = get_db_connection()
+    if not conn:
+        return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Error de conexión", "mensaje": "No se pudo conectar a la base de datos.", "color": "var(--bad)"})
     try:
-        cur = conn.cursor(dictionary=True)
-        for i, row in enumerate(reader):
-            try:
-                # El CSV debe tener: nombre, curp, escuela_id, grado_id, profesor_id
-                cur.execute("SELECT alumno_id FROM alumno WHERE curp = %s", (row['curp'],))
-                existe = cur.fetchone()
-                if existe:
-                    cur.execute("UPDATE alumno SET nombre=%s, escuela_id=%s, grado_id=%s, profesor_id=%s WHERE curp=%s",
-                                (row['nombre'], row['escuela_id'], row['grado_id'], row['profesor_id'], row['curp']))
-                    alumnos_actualizados += 1
-                else:
-                    cur.execute("INSERT INTO alumno (nombre, curp, escuela_id, grado_id, profesor_id, fecha_reg) VALUES (%s, %s, %s, %s, %s, NOW())",
-                                (row['nombre'], row['curp'], row['escuela_id'], row['grado_id'], row['profesor_id']))
-                    alumnos_nuevos += 1
-            except Exception as e:
-                errores.append(f"Error en fila {i+2}: {e}")
-        conn.commit()
+        trabajo_id = trabajos.crear_trabajo(conn, curso_id)
     finally:
         if conn and conn.is_connected(): conn.close()
 
-    mensaje = f"Carga completada.<br>Alumnos nuevos: {alumnos_nuevos}<br>Alumnos actualizados: {alumnos_actualizados}"
-    if errores:
-        mensaje += "<br><br><strong>Errores:</strong><br>" + "<br>".join(errores)
+    estado_url = f"/admin/jobs/{trabajo_id}?token={token}"
+    mensaje = (f"La generación de diplomas para el curso <strong>{curso_id}</strong> quedó en cola como el trabajo <strong>#{trabajo_id}</strong>.<br>"
+               f"Consulta el avance en <a href=\"{estado_url}\">{estado_url}</a>.")
+    return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Proceso Iniciado", "mensaje": mensaje})
 
-    return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Resultado de Carga", "mensaje": mensaje})
 
+@app.post("/admin/anular-action", response_class=HTMLResponse)
+def anular_action(request: Request, token: str = Query(...), curso_id: str = Form(""), alumno_id: str = Form(""),
+                  folios: str = Form(""), conservar_pdfs: bool = Form(False)):
+    """ Anula en bloque los diplomas vigentes de un curso, un alumno o una lista de folios. """
+    try:
+        check_admin(token)
+    except PermissionError:
+        return RedirectResponse(url="/admin-login?error=Token+inválido", status_code=302)
+    try:
+        curso = int(curso_id) if curso_id.strip() else None
+        alumno = int(alumno_id) if alumno_id.strip() else None
+    except ValueError:
+        return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Datos inválidos", "mensaje": "El curso y el alumno deben ser números.", "color": "var(--bad)"})
+    lista = folios.replace(",", " ").split() or None
+    if curso is None and alumno is None and lista is None:
+        return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Datos incompletos", "mensaje": "Indica un curso, un alumno o una lista de folios.", "color": "var(--bad)"})
 
-def task_generar_diplomas_wrapper(curso_id: int):
-    """ Función que envuelve la lógica de generación para ser llamada en segundo plano. """
-    print(f"INICIANDO TAREA: Generación de diplomas para el curso {curso_id}")
+    conn = get_db_connection()
+    if not conn:
+        return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Error de conexión", "mensaje": "No se pudo conectar a la base de datos.", "color": "var(--bad)"})
     try:
-        gen.generar_diplomas_para_curso(curso_id)
-        print(f"TAREA COMPLETADA: Diplomas para el curso {curso_id} generados.")
-    except Exception as e:
-        print(f"TAREA FALLIDA: Error al generar diplomas para el curso {curso_id}: {e}")
+        with metricas.HTTP_DB_SEGUNDOS.medir(endpoint="anular"):
+            resultado = anular_diplomas.anular(conn, curso, alumno, lista, borrar_pdfs=not conservar_pdfs)
+    finally:
+        if conn and conn.is_connected(): conn.close()
 
-# ===================== INICIA CORRECCIÓN =====================
-@app.post("/admin/generar-diplomas-action", response_class=HTMLResponse)
-async def generar_diplomas_action(request: Request, background_tasks: BackgroundTasks, token: str = Query(...), curso_id: int = Form(...)):
-# ===================== TERMINA CORRECCIÓN ====================
-    """ Inicia la generación de diplomas para un curso en segundo plano. """
+    mensaje = f"Diplomas anulados: <strong>{resultado.anulados}</strong>"
+    if not conservar_pdfs:
+        mensaje += f"<br>PDFs eliminados del almacenamiento: {resultado.pdfs_borrados}"
+    if resultado.error_almacenamiento:
+        mensaje += f"<br><br><strong>No se pudieron eliminar los PDFs:</strong> {resultado.error_almacenamiento}"
+    return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Anulación de Diplomas", "mensaje": mensaje})
+
+
+@app.get("/admin/jobs/{trabajo_id}")
+def estado_trabajo(trabajo_id: int, token: str = Query(...)):
     try:
         check_admin(token)
     except PermissionError:
-        return RedirectResponse(url="/admin-login?error=Token+inválido", status_code=302)
+        raise HTTPException(status_code=403, detail="Token inválido")
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=503, detail="No se pudo conectar a la base de datos")
+    try:
+        row = trabajos.obtener_trabajo(conn, trabajo_id)
+    finally:
+        if conn and conn.is_connected(): conn.close()
+    if not row:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajos.resumen_trabajo(row)
 
-    background_tasks.add_task(task_generar_diplomas_wrapper, curso_id)
 
-    mensaje = f"La generación de diplomas para el curso <strong>{curso_id}</strong> ha comenzado en segundo plano.<br>El proceso puede tardar varios minutos. Revisa los logs de Render para ver el progreso."
-    return templates.TemplateResponse("mensaje.html", {"request": request, "titulo": "Proceso Iniciado", "mensaje": mensaje})
+@app.post("/admin/jobs/{trabajo_id}/cancel")
+def cancelar_trabajo(trabajo_id: int, token: str = Query(...)):
+    try:
+        check_admin(token)
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Token inválido")
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=503, detail="No se pudo conectar a la base de datos")
+    try:
+        if not trabajos.solicitar_cancelacion(conn, trabajo_id):
+            raise HTTPException(status_code=409, detail="El trabajo no existe o ya terminó")
+        return trabajos.resumen_trabajo(trabajos.obtener_trabajo(conn, trabajo_id))
+    finally:
+        if conn and conn.is_connected(): conn.close()
 
 
+@app.get("/admin/reporte")
+def reporte(token: str = Query(...), curso_id: int = Query(None), escuela_id: int = Query(None),
+            desde: date = Query(None), hasta: date = Query(None), anulados: bool = Query(False),
+            formato: str = Query("csv")):
+    """Reporte de diplomas (formato links.csv) en CSV o NDJSON, enviado por bloques."""
+    try:
+        check_admin(token)
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Token inválido")
+    if formato not in reporte_diplomas.FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {formato}")
+    try:
+        bloques = reporte_diplomas.reporte(formato, curso_id=curso_id, escuela_id=escuela_id,
+                                           desde=desde, hasta=hasta, incluir_anulados=anulados)
+    except mysql.connector.Error as e:
+        print(f"❌ Error al generar el reporte: {e}")
+        raise HTTPException(status_code=503, detail="No se pudo consultar la base de datos")
+    partes = [f"curso{curso_id}" if curso_id else "", f"escuela{escuela_id}" if escuela_id else ""]
+    nombre = "_".join(["diplomas", *filter(None, partes)]) + f".{formato}"
+    return StreamingResponse(bloques, media_type=reporte_diplomas.FORMATOS[formato],
+                             headers={"Content-Disposition": f'attachment; filename="{nombre}"'})
+
+@app.get("/admin/curso/{curso_id}/diplomas.zip")
+def descargar_zip_curso(curso_id: int, token: str = Query(...)):
+    """ZIP con los PDFs de los diplomas vigentes del curso, enviado entrada por entrada."""
+    try:
+        check_admin(token)
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Token inválido")
+    try:
+        diplomas = zip_curso.diplomas_curso(curso_id)
+    except mysql.connector.Error as e:
+        print(f"❌ Error al preparar el ZIP del curso {curso_id}: {e}")
+        raise HTTPException(status_code=503, detail="No se pudo consultar la base de datos")
+    if not diplomas:
+        raise HTTPException(status_code=404, detail="El curso no tiene diplomas vigentes")
+    return StreamingResponse(zip_curso.zip_diplomas(diplomas), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="diplomas_curso{curso_id}.zip"'})
+
+@app.get("/admin/curso/{curso_id}/impresion.pdf")
+def descargar_pdf_impresion(curso_id: int, token: str = Query(...)):
+    """Un solo PDF con todos los diplomas vigentes del curso, para imprimir."""
+    try:
+        check_admin(token)
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Token inválido")
+    # El stack de PDF solo se carga si alguien pide el archivo (ver revisar_arranque.py)
+    import generar_diplomas as gen
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=503, detail="No se pudo conectar a la base de datos")
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(gen.SQL_DIPLOMAS_CURSO, (curso_id,))
+        tareas = [gen.tarea_desde_diploma(r) for r in cur.fetchall()]
+        cur.close()
+    finally:
+        if conn and conn.is_connected(): conn.close()
+    if not tareas:
+        raise HTTPException(status_code=404, detail="El curso no tiene diplomas vigentes")
+    # Se escribe a un archivo temporal y se envía desde disco: el PDF no queda entero en memoria
+    fd, ruta = tempfile.mkstemp(prefix=f"impresion_curso{curso_id}_", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            gen.escribir_pdf_curso(tareas, f)
+    except Exception:
+        os.remove(ruta)
+        raise
+    return FileResponse(ruta, media_type="application/pdf", filename=f"impresion_curso{curso_id}.pdf",
+                        background=BackgroundTask(os.remove, ruta))
+
 # =============================
 # OTROS ENDPOINTS Y SERVICIO DE ARCHIVOS
 # =============================
+@app.get("/admin/cache-stats")
+def cache_stats(token: str = Query(...)):
+    try:
+        check_admin(token)
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Token inválido")
+    return {"verificacion": cache_verificacion.VERIFICACION.stats(), "estadisticas": estadisticas.RESUMEN_CACHE.stats()}
+
+@app.get("/admin/stats")
+def admin_stats(token: str = Query(...), reconciliar: bool = Query(False)):
+    """Totales y desglose por curso (inscritos, emitidos, anulados). `reconciliar=true` los recalcula."""
+    try:
+        check_admin(token)
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Token inválido")
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=503, detail="No se pudo conectar a la base de datos")
+    try:
+        with metricas.HTTP_DB_SEGUNDOS.medir(endpoint="admin_stats"):
+            if reconciliar:
+                estadisticas.reconciliar(conn)
+            return estadisticas.leer(conn)
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(token: str = Query(None)):
+    if METRICS_TOKEN and token != METRICS_TOKEN:
+        raise HTTPException(status_code=403, detail="Token inválido")
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/healthz", response_class=PlainTextResponse)
 def healthz():
     return "OK"
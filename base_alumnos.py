@@ -1,17 +1,11 @@
-import os
-import mysql.connector
 from mysql.connector import Error
 
+import db_pool
+
 def get_db_connection():
-    """Crea una conexión MySQL usando las variables de entorno."""
+    """Obtiene una conexión MySQL del pool compartido (configurado con las variables de entorno)."""
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME"),
-            port=os.getenv("DB_PORT")
-        )
+        connection = db_pool.get_connection()
         if connection.is_connected():
             print("✅ Conectado correctamente a MySQL")
             return connection
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Benchmark del pipeline de generación de diplomas con dobles locales:
+- SQLite en memoria en lugar de MySQL (mismo esquema mínimo que usa el generador).
+- Servidor HTTP local que responde como Supabase Storage.
+
+Ejecuta generar_diplomas_para_curso de punta a punta y mide cada etapa
+(qr, overlay, merge, hash, upload, insert) y el throughput por tamaño de curso.
+
+    python benchmark_diplomas.py --tamanos 10,1000 --salida bench.json
+    python benchmark_diplomas.py --tamanos 10,1000 --baseline bench_baseline.json
+    python benchmark_diplomas.py --tamanos 10,1000 --guardar-baseline bench_baseline.json
+
+Con --baseline termina con código 1 si alguna métrica empeora más que --tolerancia.
+"""
+import io
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import threading
+import statistics
+import contextlib
+import http.server
+import datetime as dt
+from typing import Dict, List
+
+import generar_diplomas as gen
+import storage_supabase
+import almacenamiento
+
+ETAPAS = ("qr", "overlay", "merge", "hash", "upload", "insert")
+
+# --- Dobles locales ---
+class _CursorSQLite:
+    """Imita lo que el generador usa de un cursor de mysql.connector."""
+    def __init__(self, conn: sqlite3.Connection, dictionary: bool):
+        self._cur = conn.cursor()
+        self._dictionary = dictionary
+
+    @staticmethod
+    def _sql(query: str) -> str:
+        query = query.replace("%s", "?").replace("NOW()", "CURRENT_TIMESTAMP")
+        # Upserts y DDL (estadisticas.py, corrida_curso) en dialecto SQLite
+        query = query.replace(" ON UPDATE CURRENT_TIMESTAMP", "")
+        query = re.sub(r"ENUM\([^)]*\)", "TEXT", query)
+        query = query.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+        return re.sub(r"VALUES\((\w+)\)", r"excluded.\1", query)
+
+    def execute(self, query, params=()):
+        with cronometro("insert" if query.lstrip().upper().startswith("INSERT") else None):
+            self._cur.execute(self._sql(query), params)
+
+    def executemany(self, query, filas):
+        with cronometro("insert"):
+            self._cur.executemany(self._sql(query), filas)
+
+    def _fila(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {d[0]: v for d, v in zip(self._cur.description, row)}
+
+    def fetchone(self):
+        return self._fila(self._cur.fetchone())
+
+    def fetchall(self):
+        return [self._fila(r) for r in self._cur.fetchall()]
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+class ConexionSQLite:
+    """Imita la interfaz de conexión de mysql.connector sobre SQLite en memoria."""
+    def __init__(self):
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.autocommit = True
+        self._abierta = True
+        # GET_LOCK/RELEASE_LOCK de MySQL. Todas las "sesiones" comparten esta conexión,
+        # así que a diferencia de MySQL el candado no es reentrante
+        self._candados = set()
+        self._conn.create_function("GET_LOCK", 2, self._get_lock)
+        self._conn.create_function("RELEASE_LOCK", 1, self._release_lock)
+
+    def _get_lock(self, nombre, espera):
+        if nombre in self._candados:
+            return 0
+        self._candados.add(nombre)
+        return 1
+
+    def _release_lock(self, nombre):
+        if nombre not in self._candados:
+            return None
+        self._candados.discard(nombre)
+        return 1
+
+    def cursor(self, dictionary: bool = False, **_):
+        return _CursorSQLite(self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self):
+        return self._abierta
+
+    def close(self):
+        # El benchmark reutiliza la misma BD entre llamadas; no se cierra de verdad
+        pass
+
+ESQUEMA = """
+CREATE TABLE profesor (profesor_id INTEGER PRIMARY KEY, nombre TEXT NOT NULL);
+CREATE TABLE curso (curso_id INTEGER PRIMARY KEY, nombre TEXT NOT NULL, profesor_id INTEGER);
+CREATE TABLE alumno (alumno_id INTEGER PRIMARY KEY, nombre TEXT NOT NULL, curp TEXT UNIQUE,
+                     escuela_id INTEGER, grado_id INTEGER, profesor_id INTEGER, fecha_reg TEXT);
+CREATE TABLE inscripcion (alumno_id INTEGER, curso_id INTEGER, fecha_inscripcion TEXT DEFAULT CURRENT_DATE,
+                          PRIMARY KEY (alumno_id, curso_id));
+CREATE TABLE diploma (diploma_id INTEGER PRIMARY KEY AUTOINCREMENT, alumno_id INTEGER, curso_id INTEGER,
+                      coordinador_id INTEGER, folio TEXT UNIQUE, estado TEXT, fecha_emision TEXT,
+                      pdf_path TEXT, hash_sha256 TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP, pdf_url TEXT);
+CREATE INDEX idx_diploma_alumno_curso ON diploma (alumno_id, curso_id);
+"""
+
+def crear_bd(tamanos: List[int]) -> ConexionSQLite:
+    """Un curso por tamaño; curso_id == posición + 1."""
+    conn = ConexionSQLite()
+    conn._conn.executescript(ESQUEMA)
+    conn._conn.execute("INSERT INTO profesor VALUES (1, 'María Pérez')")
+    alumno_id = 0
+    for curso_id, n in enumerate(tamanos, start=1):
+        conn._conn.execute("INSERT INTO curso VALUES (?, ?, 1)", (curso_id, f"Curso benchmark {n}"))
+        filas = []
+        for _ in range(n):
+            alumno_id += 1
+            filas.append((alumno_id, f"Alumno Benchmark {alumno_id}", f"BENC{alumno_id:014d}", 1, 1, 1))
+        conn._conn.executemany("INSERT INTO alumno (alumno_id, nombre, curp, escuela_id, grado_id, profesor_id) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", filas)
+        conn._conn.executemany("INSERT INTO inscripcion (alumno_id, curso_id) VALUES (?, ?)",
+                               [(f[0], curso_id) for f in filas])
+    conn._conn.commit()
+    return conn
+
+class _SupabaseFalso(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        cuerpo = b'{"Key":"ok"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+@contextlib.contextmanager
+def servidor_supabase():
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _SupabaseFalso)
+    hilo = threading.Thread(target=srv.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        yield f"http://127.0.0.1:{srv.server_port}"
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+# --- Medición por etapa ---
+_tiempos: Dict[str, List[float]] = {e: [] for e in ETAPAS}
+_tiempos_lock = threading.Lock()
+
+@contextlib.contextmanager
+def cronometro(etapa):
+    if etapa is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _tiempos_lock:
+            _tiempos[etapa].append(time.perf_counter() - t0)
+
+def _cronometrar(etapa: str, fn):
+    def envoltura(*args, **kwargs):
+        with cronometro(etapa):
+            return fn(*args, **kwargs)
+    return envoltura
+
+class _HashlibCronometrado:
+    """Sustituye a `hashlib` dentro de generar_diplomas para medir el sha256."""
+    def __init__(self, real):
+        self._real = real
+
+    def sha256(self, data=b""):
+        with cronometro("hash"):
+            h = self._real.sha256(data)
+            h.hexdigest()
+        return h
+
+    def __getattr__(self, nombre):
+        return getattr(self._real, nombre)
+
+@contextlib.contextmanager
+def instrumentar(conn: ConexionSQLite, base_url: str):
+    uploader = storage_supabase.SupabaseUploader(base_url=base_url, service_key="benchmark")
+    uploader._subir = _cronometrar("upload", uploader._subir)
+    originales = {
+        "conectar_db": gen.conectar_db,
+        "get_almacenamiento": gen.get_almacenamiento,
+        "matriz_qr": gen.matriz_qr,
+        "generar_qr_bytes": gen.generar_qr_bytes,
+        "crear_overlay": gen.crear_overlay,
+        "fusionar_con_plantilla": gen.fusionar_con_plantilla,
+        "hashlib": gen.hashlib,
+    }
+    gen.conectar_db = lambda: conn
+    backend = almacenamiento.AlmacenamientoSupabase(uploader)
+    gen.get_almacenamiento = lambda: backend
+    gen.matriz_qr = _cronometrar("qr", gen.matriz_qr)
+    gen.generar_qr_bytes = _cronometrar("qr", gen.generar_qr_bytes)
+    gen.crear_overlay = _cronometrar("overlay", gen.crear_overlay)
+    gen.fusionar_con_plantilla = _cronometrar("merge", gen.fusionar_con_plantilla)
+    gen.hashlib = _HashlibCronometrado(originales["hashlib"])
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        for nombre, valor in originales.items():
+            setattr(gen, nombre, valor)
+        uploader.close()
+
+def _resumen(valores: List[float]) -> dict:
+    if not valores:
+        return {"n": 0, "total_s": 0.0, "media_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0}
+    orden = sorted(valores)
+    return {
+        "n": len(orden),
+        "total_s": round(sum(orden), 4),
+        "media_ms": round(statistics.fmean(orden) * 1000, 3),
+        "p50_ms": round(orden[len(orden) // 2] * 1000, 3),
+        "p95_ms": round(orden[min(len(orden) - 1, int(len(orden) * 0.95))] * 1000, 3),
+    }
+
+def ejecutar(tamanos: List[int], workers: int = 1) -> dict:
+    conn = crear_bd(tamanos)
+    gen.PLANTILLAS.obtener(gen.PLANTILLA_PDF)  # la carga inicial de la plantilla no cuenta
+    resultados = []
+    with servidor_supabase() as base_url, instrumentar(conn, base_url):
+        for curso_id, n in enumerate(tamanos, start=1):
+            for lista in _tiempos.values():
+                lista.clear()
+            t0 = time.perf_counter()
+            gen.generar_diplomas_para_curso(curso_id, dt.date(2025, 1, 1), workers=workers)
+            total = time.perf_counter() - t0
+            resultados.append({
+                "tamano": n,
+                "segundos": round(total, 4),
+                "diplomas_por_segundo": round(n / total, 3) if total else 0.0,
+                "etapas": {e: _resumen(list(_tiempos[e])) for e in ETAPAS},
+            })
+    return {
+        "fecha": dt.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "maquina": platform.machine(),
+        "workers": workers,
+        "qr_modo": gen.QR_MODO,
+        "resultados": resultados,
+    }
+
+def comparar(actual: dict, baseline: dict, tolerancia: float) -> List[str]:
+    """Regresiones: throughput menor o media por etapa mayor que la tolerancia relativa."""
+    regresiones = []
+    base_por_tamano = {r["tamano"]: r for r in baseline.get("resultados", [])}
+    for r in actual["resultados"]:
+        b = base_por_tamano.get(r["tamano"])
+        if not b:
+            continue
+        if b["diplomas_por_segundo"] and r["diplomas_por_segundo"] < b["diplomas_por_segundo"] * (1 - tolerancia):
+            regresiones.append(f"n={r['tamano']}: throughput {r['diplomas_por_segundo']} < {b['diplomas_por_segundo']} (baseline)")
+        for e in ETAPAS:
+            media, media_b = r["etapas"][e]["media_ms"], b["etapas"].get(e, {}).get("media_ms", 0)
+            if media_b and media > media_b * (1 + tolerancia):
+                regresiones.append(f"n={r['tamano']}: etapa {e} {media} ms > {media_b} ms (baseline)")
+    return regresiones
+
+def imprimir(reporte: dict):
+    for r in reporte["resultados"]:
+        print(f"n={r['tamano']:>6}  {r['segundos']:>9.2f}s  {r['diplomas_por_segundo']:>8.2f} diplomas/s")
+        for e in ETAPAS:
+            s = r["etapas"][e]
+            print(f"    {e:<8} n={s['n']:<6} media={s['media_ms']:>8.2f}ms  p95={s['p95_ms']:>8.2f}ms  total={s['total_s']:>8.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de generación de diplomas")
+    parser.add_argument("--tamanos", default="10,1000,10000", help="Tamaños de curso separados por coma")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos de render (con >1 las etapas solo cuentan el proceso principal)")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior contra el cual comparar")
+    parser.add_argument("--guardar-baseline", help="Guarda esta corrida como baseline en la ruta dada")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento relativo permitido (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    tamanos = [int(t) for t in args.tamanos.split(",") if t.strip()]
+    reporte = ejecutar(tamanos, workers=args.workers)
+    imprimir(reporte)
+
+    for ruta in (args.salida, args.guardar_baseline):
+        if ruta:
+            with open(ruta, "w", encoding="utf-8") as f:
+                json.dump(reporte, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regresiones = comparar(reporte, json.load(f), args.tolerancia)
+        if regresiones:
+            print("\n[REGRESIÓN]")
+            for r in regresiones:
+                print(f"  - {r}")
+            sys.exit(1)
+        print("\n[OK] Sin regresiones respecto al baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# cache_verificacion.py
+"""
+Caché en memoria (LRU acotada + TTL) para las consultas de verificación por folio.
+- Guarda también los folios inexistentes (caché negativa, con TTL más corto).
+- `invalidar_folio()` se llama al insertar un diploma o al cambiar su estado.
+- Lleva contadores de aciertos y fallos.
+La caché es por proceso; los cambios hechos en otro (anulaciones desde la terminal,
+folios nuevos del worker) llegan con `sincronizar_con`: la API revisa cada
+VERIFICACION_CACHE_SYNC segundos una firma compartida en la BD y, si cambió, vacía la
+caché. Ese es el máximo que puede mostrarse un dato viejo (el TTL queda como respaldo
+si la firma no se puede leer).
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional, Tuple
+
+VERIFICACION_CACHE_SIZE = int(os.getenv("VERIFICACION_CACHE_SIZE", "2048"))
+VERIFICACION_CACHE_TTL = float(os.getenv("VERIFICACION_CACHE_TTL", "300"))
+VERIFICACION_CACHE_TTL_NEGATIVO = float(os.getenv("VERIFICACION_CACHE_TTL_NEGATIVO", "30"))
+# Cada cuántos segundos se revisa la firma compartida (0 = solo TTL)
+VERIFICACION_CACHE_SYNC = float(os.getenv("VERIFICACION_CACHE_SYNC", "2"))
+
+_SIN_FIRMA = object()
+
+class CacheTTL:
+    def __init__(self, maxsize: int, ttl: float, ttl_negativo: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self._datos: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Cambia cada vez que se vacía: un valor leído antes no se guarda después
+        self.epoca = 0
+        self._firma: Optional[Callable[[], Hashable]] = None
+        self._firma_intervalo = 0.0
+        self._firma_valor: Any = _SIN_FIRMA
+        self._firma_revisada = 0.0
+
+    def sincronizar_con(self, firma: Callable[[], Hashable], intervalo: float):
+        """
+        Vacía la caché cuando cambia `firma()`, un valor compartido que quien modifica los
+        datos cacheados cambia en la misma transacción. Se lee como mucho cada `intervalo`
+        segundos, desde `get`.
+        """
+        self._firma = firma if intervalo > 0 else None
+        self._firma_intervalo = intervalo
+
+    def _revisar_firma(self):
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora - self._firma_revisada < self._firma_intervalo:
+                return
+            # Una revisión por intervalo aunque falle: sin BD se sigue con el TTL
+            self._firma_revisada = ahora
+        try:
+            valor = self._firma()
+        except Exception as e:
+            print(f"⚠️ [Caché] No se pudo revisar la firma de invalidación: {e}")
+            return
+        with self._lock:
+            if valor != self._firma_valor:
+                self._firma_valor = valor
+                self._datos.clear()
+                self.epoca += 1
+
+    def get(self, clave: Hashable) -> Tuple[bool, Any]:
+        """Devuelve (encontrado, valor). Un valor None encontrado es un negativo cacheado."""
+        if self._firma is not None:
+            self._revisar_firma()
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] <= ahora:
+                if entrada is not None:
+                    del self._datos[clave]
+                self.misses += 1
+                return False, None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return True, entrada[1]
+
+    def set(self, clave: Hashable, valor: Any, epoca: Optional[int] = None):
+        """`epoca`: la de la caché antes de leer `valor`; si se vació desde entonces, no se guarda."""
+        ttl = self.ttl if valor is not None else self.ttl_negativo
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            if epoca is not None and epoca != self.epoca:
+                return
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, claves: Iterable[Hashable]):
+        with self._lock:
+            for clave in claves:
+                self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self.epoca += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._datos),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+VERIFICACION = CacheTTL(VERIFICACION_CACHE_SIZE, VERIFICACION_CACHE_TTL, VERIFICACION_CACHE_TTL_NEGATIVO)
+
+def invalidar_folio(*folios: str):
+    """Hook de invalidación: llamar al insertar diplomas o cambiar su `estado`."""
+    VERIFICACION.invalidar(folios)
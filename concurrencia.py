@@ -0,0 +1,73 @@
+# concurrencia.py
+"""
+Protección de la BD ante picos de tráfico (p. ej. un grupo entero escaneando su QR a la vez).
+- UnSoloVuelo: las llamadas concurrentes con la misma clave comparten una sola ejecución.
+- LimiteConcurrencia: cupo acotado de operaciones a la vez; si no se libera un lugar en
+  `espera` segundos se lanza Saturado en lugar de seguir encolando (la API responde 503
+  con Retry-After).
+Ambos son por proceso.
+"""
+import threading
+import contextlib
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Optional
+
+import metricas
+
+RECHAZOS = metricas.Contador("concurrencia_rechazos_total", "Operaciones rechazadas por límite de concurrencia", ["limite"])
+
+class UnSoloVuelo:
+    """
+    Agrupa llamadas concurrentes con la misma clave: solo la primera ejecuta `fn`, las demás
+    esperan su resultado (o su excepción). `contador` (con `etiquetas`) cuenta las que esperaron.
+    """
+    def __init__(self, contador: Optional[metricas.Contador] = None, **etiquetas):
+        self._lock = threading.Lock()
+        self._vuelos: Dict[Hashable, Future] = {}
+        self._contador = contador
+        self._etiquetas = etiquetas
+
+    def ejecutar(self, clave: Hashable, fn: Callable, *args):
+        with self._lock:
+            fut = self._vuelos.get(clave)
+            lider = fut is None
+            if lider:
+                fut = self._vuelos[clave] = Future()
+        if not lider:
+            if self._contador:
+                self._contador.inc(**self._etiquetas)
+            return fut.result()
+        try:
+            resultado = fn(*args)
+            fut.set_result(resultado)
+            return resultado
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._vuelos[clave]
+
+class Saturado(Exception):
+    """No hubo cupo a tiempo; `reintentar_en` son los segundos sugeridos (Retry-After)."""
+    def __init__(self, limite: str, reintentar_en: int):
+        super().__init__(f"Límite de concurrencia '{limite}' saturado")
+        self.reintentar_en = reintentar_en
+
+class LimiteConcurrencia:
+    """Como mucho `cupo` operaciones a la vez; las demás esperan hasta `espera` segundos."""
+    def __init__(self, nombre: str, cupo: int, espera: float, reintentar_en: int = 1):
+        self.nombre = nombre
+        self.espera = espera
+        self.reintentar_en = reintentar_en
+        self._sem = threading.BoundedSemaphore(max(1, cupo))
+
+    @contextlib.contextmanager
+    def ocupar(self):
+        if not self._sem.acquire(timeout=self.espera):
+            RECHAZOS.inc(limite=self.nombre)
+            raise Saturado(self.nombre, self.reintentar_en)
+        try:
+            yield
+        finally:
+            self._sem.release()
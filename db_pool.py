@@ -0,0 +1,69 @@
+# db_pool.py
+"""
+Pool de conexiones MySQL compartido por la API y el generador de diplomas.
+- Se crea al primer uso (y de nuevo tras un fork).
+- Al sacar una conexión se comprueba con ping; si está caída se reconecta.
+- Si el pool está agotado se espera un poco y luego se abre una conexión directa.
+Las conexiones se devuelven al pool con conn.close(), igual que antes.
+"""
+import os
+import time
+import threading
+
+import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "port": int(os.getenv("DB_PORT") or "3306"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME"),
+}
+DB_POOL_NAME = os.getenv("DB_POOL_NAME", "diplomas")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# Segundos que se espera una conexión libre antes de abrir una directa
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "0.5"))
+
+_pool: pooling.MySQLConnectionPool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> pooling.MySQLConnectionPool:
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = pooling.MySQLConnectionPool(pool_name=DB_POOL_NAME, pool_size=DB_POOL_SIZE,
+                                                pool_reset_session=True, **DB_CONFIG)
+            _pool_pid = os.getpid()
+        return _pool
+
+def connect_direct():
+    """Conexión fuera del pool (fallback cuando está agotado)."""
+    return mysql.connector.connect(**DB_CONFIG)
+
+def get_connection():
+    """
+    Devuelve una conexión del pool ya verificada. Lanza mysql.connector.Error si la BD no responde.
+    """
+    pool = get_pool()
+    limite = time.monotonic() + DB_POOL_TIMEOUT
+    while True:
+        try:
+            conn = pool.get_connection()
+            break
+        except PoolError:
+            if time.monotonic() >= limite:
+                print("⚠️ Pool MySQL agotado; abriendo conexión directa")
+                return connect_direct()
+            time.sleep(0.02)
+    try:
+        conn.ping(reconnect=True, attempts=2, delay=0)
+    except mysql.connector.Error:
+        conn.close()
+        raise
+    return conn
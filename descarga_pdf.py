@@ -0,0 +1,116 @@
+# descarga_pdf.py
+"""
+Respuesta HTTP para servir un PDF guardado en disco (GET /pdf/{folio}).
+- ETag fijo a partir de hash_sha256: el contenido de un folio no cambia.
+- If-None-Match -> 304; Range de un solo tramo -> 206 (If-Range respetado); fuera de rango -> 416.
+- El cuerpo sale de un mmap del archivo; si el servidor ASGI soporta la extensión
+  `http.response.pathsend` y se pide el archivo completo, lo envía el propio servidor.
+"""
+import os
+import mmap
+from pathlib import Path
+from typing import Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+PDF_CACHE_MAX_AGE = int(os.getenv("PDF_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+TAMANO_BLOQUE = 256 * 1024
+
+class RangoInvalido(Exception):
+    pass
+
+def parsear_rango(valor: str, tamano: int) -> Optional[Tuple[int, int]]:
+    """
+    Devuelve (inicio, fin) inclusivo para un header Range de un solo tramo, o None si
+    no aplica (otra unidad o varios tramos: se responde el archivo completo).
+    Lanza RangoInvalido si el tramo no se puede satisfacer.
+    """
+    unidad, _, tramos = valor.partition("=")
+    if unidad.strip().lower() != "bytes" or "," in tramos:
+        return None
+    inicio_txt, guion, fin_txt = tramos.strip().partition("-")
+    if not guion:
+        return None
+    try:
+        if not inicio_txt:
+            # bytes=-N: los últimos N bytes
+            n = int(fin_txt)
+            if n <= 0:
+                raise RangoInvalido(valor)
+            return max(0, tamano - n), tamano - 1
+        inicio = int(inicio_txt)
+        fin = int(fin_txt) if fin_txt else tamano - 1
+    except ValueError:
+        return None
+    if inicio >= tamano or fin < inicio:
+        raise RangoInvalido(valor)
+    return inicio, min(fin, tamano - 1)
+
+def _coincide_etag(header: str, etag: str) -> bool:
+    candidatos = [e.strip() for e in header.split(",")]
+    return "*" in candidatos or any(e.removeprefix("W/") == etag for e in candidatos)
+
+class RespuestaArchivo(Response):
+    """Envía `ruta[inicio:fin+1]` por bloques desde un mmap (o con pathsend si es el archivo completo)."""
+
+    def __init__(self, ruta: Path, inicio: int, fin: int, tamano: int, status_code: int, headers: dict):
+        super().__init__(status_code=status_code, headers=headers, media_type="application/pdf")
+        self.ruta = ruta
+        self.inicio, self.fin, self.tamano = inicio, fin, tamano
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.fin < self.inicio:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        completo = self.inicio == 0 and self.fin == self.tamano - 1
+        if completo and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.pathsend", "path": str(self.ruta)})
+            return
+        with open(self.ruta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            vista = memoryview(m)
+            try:
+                pos = self.inicio
+                while pos <= self.fin:
+                    hasta = min(pos + TAMANO_BLOQUE, self.fin + 1)
+                    await send({"type": "http.response.body", "body": bytes(vista[pos:hasta]), "more_body": hasta <= self.fin})
+                    pos = hasta
+            finally:
+                vista.release()
+
+def _headers_cache(sha256: Optional[str], nombre_descarga: str) -> dict:
+    headers = {
+        "Cache-Control": f"public, max-age={PDF_CACHE_MAX_AGE}, immutable",
+        "Content-Disposition": f'inline; filename="{nombre_descarga}"',
+    }
+    if sha256:
+        headers["ETag"] = f'"{sha256}"'
+    return headers
+
+def respuesta_bytes(pdf_bytes: bytes, sha256: Optional[str], nombre_descarga: str) -> Response:
+    """PDF ya en memoria (p. ej. recién renderizado); sin soporte de Range."""
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=_headers_cache(sha256, nombre_descarga))
+
+def respuesta_pdf(request: Request, ruta: Path, sha256: Optional[str], nombre_descarga: str) -> Response:
+    tamano = ruta.stat().st_size
+    headers = {"Accept-Ranges": "bytes", **_headers_cache(sha256, nombre_descarga)}
+    etag = headers.get("ETag")
+    if etag:
+        if _coincide_etag(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=headers)
+
+    inicio, fin, status = 0, tamano - 1, 200
+    rango = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if rango and request.method == "GET" and (if_range is None or (etag and if_range.strip() == etag)):
+        try:
+            tramo = parsear_rango(rango, tamano)
+        except RangoInvalido:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{tamano}"})
+        if tramo:
+            inicio, fin = tramo
+            status = 206
+            headers["Content-Range"] = f"bytes {inicio}-{fin}/{tamano}"
+    headers["Content-Length"] = str(fin - inicio + 1)
+    return RespuestaArchivo(ruta, inicio, fin, tamano, status, headers)
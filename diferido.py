@@ -0,0 +1,83 @@
+# diferido.py
+"""
+Render diferido de diplomas (GENERACION_DIFERIDA=1 o --diferido).
+- La corrida por curso solo reserva el folio y la fila en `diploma` (hash_sha256 NULL,
+  pdf_url apuntando a /pdf/{folio}).
+- El PDF se renderiza, se guarda y se completa la fila la primera vez que se pide
+  (/verificar/{folio} o /pdf/{folio}).
+- Las peticiones simultáneas del mismo folio esperan un único render (por proceso).
+- Solo se renderizan diplomas VALIDO: uno anulado nunca se genera ni se vuelve a subir.
+Si dos procesos renderizan el mismo folio a la vez el PDF sale idéntico (mismos datos y
+salida reproducible) y el UPDATE solo completa la fila una vez.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import db_pool
+import metricas
+import cache_verificacion
+import almacenamiento
+from concurrencia import UnSoloVuelo
+
+RENDERS_DIFERIDOS = metricas.Contador("diplomas_render_diferido_total", "PDFs renderizados en la primera descarga")
+RENDERS_COALESCIDOS = metricas.Contador("diplomas_render_coalescido_total", "Peticiones que esperaron un render ya en curso")
+
+SQL_DATOS_DIPLOMA = """
+  SELECT d.folio, d.alumno_id, d.curso_id, d.coordinador_id, d.fecha_emision, d.pdf_path, d.pdf_url,
+         d.hash_sha256, a.nombre AS alumno_nombre, p.nombre AS profesor_nombre
+  FROM diploma d
+  JOIN alumno a ON a.alumno_id = d.alumno_id
+  LEFT JOIN profesor p ON p.profesor_id = d.coordinador_id
+  WHERE d.folio = %s AND d.estado = 'VALIDO'
+"""
+
+SQL_COMPLETAR_DIPLOMA = ("UPDATE diploma SET hash_sha256=%s, pdf_url=%s "
+                         "WHERE folio=%s AND hash_sha256 IS NULL AND estado='VALIDO'")
+
+@dataclass
+class PdfDiferido:
+    folio: str
+    sha256: str
+    pdf_url: str
+    pdf_path: str
+    # Solo si se renderizó en esta llamada
+    pdf_bytes: Optional[bytes] = None
+
+_vuelos = UnSoloVuelo(RENDERS_COALESCIDOS)
+
+def _renderizar(folio: str) -> Optional[PdfDiferido]:
+    # El stack de PDF (reportlab, PyPDF2, qrcode) se importa al primer render, no al arrancar la API
+    import generar_diplomas as gen
+    conn = db_pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(SQL_DATOS_DIPLOMA, (folio,))
+        row = cur.fetchone()
+        if not row:
+            # No existe o ya no está vigente: la caché de verificación de este proceso pudo
+            # quedar vieja tras una anulación hecha en otro proceso
+            cache_verificacion.invalidar_folio(folio)
+            return None
+        if row["hash_sha256"]:
+            # Otro proceso lo completó mientras tanto
+            return PdfDiferido(folio, row["hash_sha256"], row["pdf_url"], row["pdf_path"])
+
+        tarea = gen.tarea_desde_diploma(row)
+        pdf_bytes = gen.renderizar_diploma(tarea)
+        sha = gen.calcular_hash(pdf_bytes)
+        pdf_path = row["pdf_path"] or gen.nombre_pdf(tarea)
+        guardado = almacenamiento.get_almacenamiento().guardar(pdf_bytes, pdf_path, solo_si_cambia=True)
+        pdf_url = guardado.result() or gen.url_descarga(folio)
+        cur.execute(SQL_COMPLETAR_DIPLOMA, (sha, pdf_url, folio))
+        conn.commit()
+        cur.close()
+    finally:
+        if conn and conn.is_connected(): conn.close()
+    RENDERS_DIFERIDOS.inc()
+    cache_verificacion.invalidar_folio(folio)
+    print(f"  - [Diferido] Diploma {folio} renderizado ({len(pdf_bytes)} bytes)")
+    return PdfDiferido(folio, sha, pdf_url, pdf_path, pdf_bytes)
+
+def asegurar_pdf(folio: str) -> Optional[PdfDiferido]:
+    """Renderiza y guarda el PDF de un diploma reservado, una sola vez por folio. None si el folio no existe o no es VALIDO."""
+    return _vuelos.ejecutar(folio, _renderizar, folio)
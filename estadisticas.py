@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Estadísticas del panel de administración sin COUNT(*) en cada carga.
+- Totales en `estadistica` (clave/valor) y desglose por curso en `estadistica_curso`
+  (inscritos, emitidos, anulados).
+- El importador de CSV y el generador las actualizan de forma incremental, dentro de
+  su misma transacción.
+- `reconciliar()` las recalcula desde cero; el worker la corre cada
+  ESTADISTICAS_RECONCILIAR segundos y también se puede lanzar a mano:
+
+    python estadisticas.py --reconciliar
+
+- La API lee el resumen a través de una caché en memoria de ESTADISTICAS_TTL segundos.
+"""
+import os
+import argparse
+from collections import Counter
+from typing import Dict, Optional
+
+import db_pool
+from cache_verificacion import CacheTTL
+
+ESTADISTICAS_TTL = float(os.getenv("ESTADISTICAS_TTL", "30"))
+# Cada cuántos segundos se recalculan desde cero (la corrección de cualquier desvío)
+ESTADISTICAS_RECONCILIAR = int(os.getenv("ESTADISTICAS_RECONCILIAR", "3600"))
+
+SQL_TABLAS = (
+    """
+    CREATE TABLE IF NOT EXISTS estadistica (
+      clave VARCHAR(64) NOT NULL,
+      valor BIGINT NOT NULL DEFAULT 0,
+      actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      PRIMARY KEY (clave)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estadistica_curso (
+      curso_id INT NOT NULL,
+      inscritos INT NOT NULL DEFAULT 0,
+      emitidos INT NOT NULL DEFAULT 0,
+      anulados INT NOT NULL DEFAULT 0,
+      actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      PRIMARY KEY (curso_id)
+    )
+    """,
+)
+
+SQL_SUMAR = """
+  INSERT INTO estadistica (clave, valor) VALUES (%s, %s)
+  ON DUPLICATE KEY UPDATE valor = valor + VALUES(valor)
+"""
+
+SQL_SUMAR_CURSO = """
+  INSERT INTO estadistica_curso (curso_id, inscritos, emitidos, anulados) VALUES (%s, %s, %s, %s)
+  ON DUPLICATE KEY UPDATE inscritos = inscritos + VALUES(inscritos), emitidos = emitidos + VALUES(emitidos),
+                          anulados = anulados + VALUES(anulados)
+"""
+
+SQL_FIJAR_CURSO = """
+  INSERT INTO estadistica_curso (curso_id, inscritos, emitidos, anulados) VALUES (%s, %s, %s, %s)
+  ON DUPLICATE KEY UPDATE inscritos = VALUES(inscritos), emitidos = VALUES(emitidos), anulados = VALUES(anulados)
+"""
+
+SQL_POR_CURSO = """
+  SELECT ec.curso_id, IFNULL(c.nombre, '—') AS curso, ec.inscritos, ec.emitidos, ec.anulados
+  FROM estadistica_curso ec
+  LEFT JOIN curso c ON c.curso_id = ec.curso_id
+  ORDER BY ec.curso_id
+"""
+
+_tablas_listas = False
+RESUMEN_CACHE = CacheTTL(maxsize=1, ttl=ESTADISTICAS_TTL, ttl_negativo=ESTADISTICAS_TTL)
+
+def asegurar_tablas(conn):
+    global _tablas_listas
+    if _tablas_listas:
+        return
+    cur = conn.cursor()
+    for sql in SQL_TABLAS:
+        cur.execute(sql)
+    cur.close()
+    conn.commit()
+    _tablas_listas = True
+
+# --- Actualizaciones incrementales (usan el cursor de la transacción de quien llama) ---
+def sumar(cursor, **valores: int):
+    """p. ej. sumar(cur, alumnos=12). No hace commit."""
+    filas = [(clave, n) for clave, n in valores.items() if n]
+    if filas:
+        cursor.executemany(SQL_SUMAR, filas)
+
+def sumar_cursos(cursor, inscritos: Optional[Counter] = None, emitidos: Optional[Counter] = None,
+                 anulados: Optional[Counter] = None):
+    """Suma por curso_id (Counter curso_id -> n). No hace commit."""
+    inscritos, emitidos, anulados = inscritos or Counter(), emitidos or Counter(), anulados or Counter()
+    cursos = sorted(c for c in set(inscritos) | set(emitidos) | set(anulados) if c is not None)
+    if cursos:
+        cursor.executemany(SQL_SUMAR_CURSO, [(c, inscritos[c], emitidos[c], anulados[c]) for c in cursos])
+
+def invalidar_cache():
+    RESUMEN_CACHE.limpiar()
+
+# --- Reconciliación ---
+def _contar(cur, sql: str) -> int:
+    cur.execute(sql)
+    return cur.fetchone()[0]
+
+def reconciliar(conn) -> dict:
+    """Recalcula totales y desglose por curso con consultas completas. Devuelve los totales."""
+    asegurar_tablas(conn)
+    cur = conn.cursor()
+    try:
+        totales = {
+            "alumnos": _contar(cur, "SELECT COUNT(*) FROM alumno"),
+            "cursos": _contar(cur, "SELECT COUNT(*) FROM curso"),
+            "diplomas": _contar(cur, "SELECT COUNT(*) FROM diploma"),
+            "diplomas_anulados": _contar(cur, "SELECT COUNT(*) FROM diploma WHERE estado = 'ANULADO'"),
+        }
+        cur.execute("SELECT curso_id FROM curso")
+        cursos = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT curso_id, COUNT(*) FROM inscripcion GROUP BY curso_id")
+        inscritos = dict(cur.fetchall())
+        cur.execute("SELECT curso_id, COUNT(*), SUM(estado = 'ANULADO') FROM diploma "
+                    "WHERE curso_id IS NOT NULL GROUP BY curso_id")
+        diplomas = {r[0]: (r[1], int(r[2] or 0)) for r in cur.fetchall()}
+
+        cur.executemany("INSERT INTO estadistica (clave, valor) VALUES (%s, %s) "
+                        "ON DUPLICATE KEY UPDATE valor = VALUES(valor)", list(totales.items()))
+        cur.execute("INSERT INTO estadistica (clave, valor) VALUES ('reconciliado', UNIX_TIMESTAMP()) "
+                    "ON DUPLICATE KEY UPDATE valor = VALUES(valor)")
+        filas = [(c, inscritos.get(c, 0), *diplomas.get(c, (0, 0))) for c in cursos]
+        if filas:
+            cur.executemany(SQL_FIJAR_CURSO, filas)
+        if cursos:
+            cur.execute(f"DELETE FROM estadistica_curso WHERE curso_id NOT IN ({', '.join(['%s'] * len(cursos))})", cursos)
+        else:
+            cur.execute("DELETE FROM estadistica_curso")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    invalidar_cache()
+    print(f"[Estadísticas] Reconciliadas: {totales} ({len(cursos)} curso(s))")
+    return totales
+
+def reconciliar_si_toca(conn, intervalo: int = ESTADISTICAS_RECONCILIAR) -> bool:
+    """Reconcilia si la última vez fue hace más de `intervalo` segundos (o nunca)."""
+    asegurar_tablas(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT valor < UNIX_TIMESTAMP() - %s FROM estadistica WHERE clave = 'reconciliado'", (intervalo,))
+    row = cur.fetchone()
+    cur.close()
+    conn.commit()
+    if row and not row[0]:
+        return False
+    reconciliar(conn)
+    return True
+
+def firma_diplomas(conn) -> tuple:
+    """
+    (diplomas, diplomas_anulados): cambia con cada alta o anulación de diplomas, que los suman
+    en su misma transacción. La API la usa para invalidar su caché de verificación.
+    """
+    asegurar_tablas(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT clave, valor FROM estadistica WHERE clave IN ('diplomas', 'diplomas_anulados')")
+    valores = dict(cur.fetchall())
+    cur.close()
+    conn.commit()  # cierra el snapshot para ver la próxima actualización
+    return valores.get("diplomas", 0), valores.get("diplomas_anulados", 0)
+
+# --- Lectura para el panel ---
+def leer(conn) -> dict:
+    """Totales y desglose por curso, desde la caché si está fresca."""
+    encontrado, datos = RESUMEN_CACHE.get("resumen")
+    if encontrado:
+        return datos
+    asegurar_tablas(conn)
+    cur = conn.cursor(dictionary=True)
+    cur.execute("SELECT clave, valor FROM estadistica")
+    totales: Dict[str, int] = {r["clave"]: r["valor"] for r in cur.fetchall()}
+    cur.close()
+    conn.commit()
+    if "reconciliado" not in totales:
+        # Primera vez: no hay nada acumulado todavía
+        reconciliar(conn)
+        return leer(conn)
+    cur = conn.cursor(dictionary=True)
+    cur.execute(SQL_POR_CURSO)
+    por_curso = cur.fetchall()
+    cur.close()
+    datos = {
+        "total_alumnos": totales.get("alumnos", 0),
+        "total_cursos": totales.get("cursos", 0),
+        "total_diplomas": totales.get("diplomas", 0),
+        "total_anulados": totales.get("diplomas_anulados", 0),
+        "reconciliado": totales["reconciliado"],
+        "por_curso": por_curso,
+    }
+    RESUMEN_CACHE.set("resumen", datos)
+    return datos
+
+def main():
+    parser = argparse.ArgumentParser(description="Estadísticas del panel de administración")
+    parser.add_argument("--reconciliar", action="store_true", help="Recalcula todas las estadísticas desde cero")
+    args = parser.parse_args()
+    conn = db_pool.get_connection()
+    try:
+        if args.reconciliar:
+            reconciliar(conn)
+        datos = leer(conn)
+        print(f"Alumnos: {datos['total_alumnos']} · Cursos: {datos['total_cursos']} · "
+              f"Diplomas: {datos['total_diplomas']} ({datos['total_anulados']} anulados)")
+        for c in datos["por_curso"]:
+            print(f"  - Curso {c['curso_id']} ({c['curso']}): {c['inscritos']} inscritos, "
+                  f"{c['emitidos']} emitidos, {c['anulados']} anulados")
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+if __name__ == "__main__":
+    main()
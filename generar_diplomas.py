@@ -2,7 +2,8 @@
 """
 Módulo para la generación de diplomas.
 - Genera PDFs en memoria.
-- Sube directamente a Supabase sin guardar archivos locales.
+- Parsea la plantilla una sola vez por proceso (caché por ruta, se recarga si cambia).
+- Guarda el PDF en el backend configurado (Supabase o carpeta local, ver almacenamiento).
 - Evita la creación de diplomas duplicados para un mismo alumno y curso.
 - Lógica simplificada para obtener profesor directamente del alumno.
 """
@@ -10,30 +11,48 @@ import os
 import io
 import hashlib
 import uuid
+import json
 import argparse
+import threading
+import contextlib
+import multiprocessing
 import datetime as dt
-from dataclasses import dataclass
-from typing import Optional, Tuple
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Dict, FrozenSet, List, Optional, Tuple
 
 from dotenv import load_dotenv
-import mysql.connector as mysql
-from PyPDF2 import PdfReader, PdfWriter
+import db_pool
+import cache_verificacion
+import estadisticas
+import metricas
+from PyPDF2 import PdfReader, PdfWriter, PageObject
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 from reportlab.lib.pagesizes import letter
 import qrcode
-from storage_supabase import upload_pdf_from_bytes
+import optimizar_pdf
+from almacenamiento import get_almacenamiento
 
 load_dotenv()
 
-# --- Configuración ---
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = int(os.getenv("DB_PORT", "3306"))
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_NAME = os.getenv("DB_NAME")
+# --- Configuración --- (la conexión a MySQL se configura en db_pool)
 PLANTILLA_PDF = os.getenv("PLANTILLA_PDF", "reconocimientoo.pdf")
 BASE_URL_VERIFICACION = os.getenv("BASE_URL_VERIFICACION")
+INSERT_CHUNK = int(os.getenv("INSERT_CHUNK", "500"))
+# Diplomas por transacción en la corrida por curso (0 = todo el curso en una sola transacción)
+COMMIT_CHUNK = int(os.getenv("COMMIT_CHUNK", "200"))
+# "vector" dibuja el QR directo en el canvas; "png" usa la imagen rasterizada de antes
+QR_MODO = os.getenv("QR_MODO", "vector")
+# Modo idempotente por defecto (también se activa con --idempotente)
+IDEMPOTENTE = os.getenv("GENERACION_IDEMPOTENTE", "0") == "1"
+# Solo reservar folio y fila; el PDF se renderiza en la primera descarga (ver diferido.py)
+DIFERIDO = os.getenv("GENERACION_DIFERIDA", "0") == "1"
+# Controles de tamaño activos (ver optimizar_pdf; PDF_OPTIMIZAR vacío = salida sin optimizar)
+PDF_OPTIMIZAR = optimizar_pdf.PDF_OPTIMIZAR
+FOLIO_NAMESPACE = uuid.UUID(os.getenv("FOLIO_NAMESPACE", "0b6f7c4e-3d2a-5e8b-9a61-4c1d2e3f4a5b"))
 
 @dataclass
 class Posiciones:
@@ -50,58 +69,114 @@ POS = Posiciones()
 
 # --- Funciones de Utilidad ---
 def conectar_db():
-    return mysql.connect(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+    return db_pool.get_connection()
 
-def leer_tamano_pagina(pdf_path: str):
-    try:
-        with open(pdf_path, "rb") as f:
-            reader = PdfReader(f)
-            page = reader.pages[0]
-            return float(page.mediabox.width), float(page.mediabox.height)
-    except FileNotFoundError:
-        print(f"ERROR: No se encontró el archivo de plantilla PDF en la ruta: {pdf_path}")
+# --- Caché de plantillas ---
+@dataclass
+class PlantillaCacheada:
+    """Plantilla PDF ya parseada: página base, tamaño y bytes crudos."""
+    path: str
+    mtime: float
+    sha256: str
+    raw: bytes
+    page: PageObject
+    mediabox: Tuple[float, float]
+    # PdfReader lee de su stream de forma perezosa; se serializa el clonado de la página
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+class CachePlantillas:
+    """
+    Caché de plantillas a nivel de proceso, indexada por ruta (y si es la copia optimizada).
+    Solo vuelve a parsear el PDF si cambia su mtime y además su hash.
+    """
+    def __init__(self):
+        self._entradas: Dict[Tuple[str, bool], PlantillaCacheada] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def resolver_ruta(pdf_path: str) -> str:
+        if os.path.exists(pdf_path):
+            return pdf_path
         # Intenta una ruta alternativa común en entornos de despliegue como Render
         alt_path = f"/var/task/{pdf_path}"
         if os.path.exists(alt_path):
-             with open(alt_path, "rb") as f:
-                reader = PdfReader(f)
-                page = reader.pages[0]
-                return float(page.mediabox.width), float(page.mediabox.height)
-        raise
+            return alt_path
+        print(f"ERROR: No se encontró el archivo de plantilla PDF en la ruta: {pdf_path}")
+        raise FileNotFoundError(pdf_path)
+
+    def obtener(self, pdf_path: str, optimizada: Optional[bool] = None) -> PlantillaCacheada:
+        """`optimizada`: copia con el control "plantilla" de optimizar_pdf (None = según PDF_OPTIMIZAR)."""
+        if optimizada is None:
+            optimizada = "plantilla" in PDF_OPTIMIZAR
+        ruta = self.resolver_ruta(pdf_path)
+        mtime = os.stat(ruta).st_mtime
+        with self._lock:
+            entrada = self._entradas.get((ruta, optimizada))
+            if entrada and entrada.mtime == mtime:
+                return entrada
+            with open(ruta, "rb") as f:
+                raw = f.read()
+            sha = hashlib.sha256(raw).hexdigest()
+            if entrada and entrada.sha256 == sha:
+                # Solo cambió el mtime (p. ej. un touch o un redeploy): se conserva lo parseado
+                entrada.mtime = mtime
+                return entrada
+            if optimizada:
+                # Copia optimizada una sola vez; el sha256 sigue siendo el del archivo original
+                raw = optimizar_pdf.optimizar_plantilla(raw)
+            page = PdfReader(io.BytesIO(raw)).pages[0]
+            entrada = PlantillaCacheada(
+                path=ruta, mtime=mtime, sha256=sha, raw=raw, page=page,
+                mediabox=(float(page.mediabox.width), float(page.mediabox.height)),
+            )
+            self._entradas[(ruta, optimizada)] = entrada
+            return entrada
+
+    def invalidar(self, pdf_path: Optional[str] = None):
+        with self._lock:
+            if pdf_path is None:
+                self._entradas.clear()
+            else:
+                for ruta in (pdf_path, f"/var/task/{pdf_path}"):
+                    for optimizada in (False, True):
+                        self._entradas.pop((ruta, optimizada), None)
+
+PLANTILLAS = CachePlantillas()
+
+def leer_tamano_pagina(pdf_path: str):
+    return PLANTILLAS.obtener(pdf_path).mediabox
 
 def crear_overlay(page_size, draw_fn):
     buf = io.BytesIO()
-    c = canvas.Canvas(buf, pagesize=page_size)
+    # invariant=1: mismo contenido -> mismos bytes (necesario para el modo idempotente)
+    c = canvas.Canvas(buf, pagesize=page_size, pageCompression=1, invariant=1)
     draw_fn(c)
     c.save()
     return buf.getvalue()
 
-def fusionar_con_plantilla(overlay_bytes: bytes, plantilla_path: str) -> io.BytesIO:
-    try:
-        with open(plantilla_path, "rb") as f:
-            template_reader = PdfReader(f)
-            page = template_reader.pages[0]
-            overlay_reader = PdfReader(io.BytesIO(overlay_bytes))
-            page.merge_page(overlay_reader.pages[0])
-            writer = PdfWriter()
-            writer.add_page(page)
-            output_buffer = io.BytesIO()
-            writer.write(output_buffer)
-            output_buffer.seek(0)
-            return output_buffer
-    except FileNotFoundError:
-        alt_path = f"/var/task/{plantilla_path}"
-        with open(alt_path, "rb") as f:
-            template_reader = PdfReader(f)
-            page = template_reader.pages[0]
-            overlay_reader = PdfReader(io.BytesIO(overlay_bytes))
-            page.merge_page(overlay_reader.pages[0])
-            writer = PdfWriter()
-            writer.add_page(page)
-            output_buffer = io.BytesIO()
-            writer.write(output_buffer)
-            output_buffer.seek(0)
-            return output_buffer
+def fusionar_con_plantilla(overlay_bytes: bytes, plantilla_path: str,
+                           controles: Optional[FrozenSet[str]] = None) -> io.BytesIO:
+    """`controles`: los de optimizar_pdf a aplicar (None = PDF_OPTIMIZAR)."""
+    if controles is None:
+        controles = PDF_OPTIMIZAR
+    plantilla = PLANTILLAS.obtener(plantilla_path, optimizada="plantilla" in controles)
+    writer = optimizar_pdf.nuevo_writer(controles)
+    # add_page clona la página en el writer, así la plantilla cacheada no se modifica
+    with plantilla.lock:
+        page = writer.add_page(plantilla.page)
+    overlay_page = PdfReader(io.BytesIO(overlay_bytes)).pages[0]
+    # Los recursos del overlay (fuentes, QR) se clonan al writer antes de fusionar;
+    # si no, la página del writer queda apuntando a objetos de otro PDF y las referencias salen rotas
+    overlay_page[NameObject("/Resources")] = overlay_page["/Resources"].clone(writer)
+    page.merge_page(overlay_page)
+    # PyPDF2 une los /ProcSet con un set; se ordenan para que la salida sea reproducible
+    procset = page["/Resources"].get("/ProcSet")
+    if procset is not None:
+        page["/Resources"][NameObject("/ProcSet")] = ArrayObject(sorted(procset.get_object()))
+    output_buffer = io.BytesIO()
+    writer.write(output_buffer)
+    output_buffer.seek(0)
+    return output_buffer
 
 def generar_qr_bytes(url: str):
     qr = qrcode.QRCode(version=1, box_size=8, border=2)
@@ -113,13 +188,358 @@ def generar_qr_bytes(url: str):
     bio.seek(0)
     return bio.getvalue()
 
+def matriz_qr(url: str):
+    qr = qrcode.QRCode(version=1, border=2)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.get_matrix()  # incluye el borde
+
+def dibujar_qr_vectorial(c, matriz, x: float, y: float, size: float, nombre: str = "qr"):
+    """
+    Dibuja el QR como un solo path de rectángulos (sin PIL ni PNG).
+    Va dentro de un Form XObject: la fusión con la plantilla no tiene que parsear esos operadores.
+    """
+    n = len(matriz)
+    c.beginForm(nombre)
+    c.saveState()
+    # En unidades de módulo las coordenadas son enteras y el stream queda corto
+    c.translate(x, y)
+    c.scale(size / n, size / n)
+    c.setFillColorRGB(1, 1, 1)
+    c.rect(0, 0, n, n, stroke=0, fill=1)
+    c.setFillColorRGB(0, 0, 0)
+    p = c.beginPath()
+    for i, fila in enumerate(matriz):
+        j = 0
+        while j < n:
+            if not fila[j]:
+                j += 1
+                continue
+            # Une los módulos negros contiguos de la fila en un solo rectángulo
+            inicio = j
+            while j < n and fila[j]:
+                j += 1
+            p.rect(inicio, n - 1 - i, j - inicio, 1)
+    c.drawPath(p, stroke=0, fill=1)
+    c.restoreState()
+    c.endForm()
+    c.doForm(nombre)
+
 def formato_fecha_es(fecha: dt.date):
     meses = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
     return f"Toluca, Estado de México, a {fecha.day} de {meses[fecha.month - 1]} de {fecha.year}"
 
 
 # --- Lógica Principal de Generación ---
-def generar_diploma_para_alumno(cursor, alumno_id: int, fecha_emision: dt.date, curso_id: Optional[int] = None):
+@dataclass
+class TareaDiploma:
+    """Datos ya leídos de la BD que necesita un proceso para renderizar un diploma."""
+    alumno_id: int
+    curso_id: Optional[int]
+    profesor_id: Optional[int]
+    alumno_nombre: str
+    nombre_profesor: str
+    fecha_emision: dt.date
+    folio: str
+    # Si es True no se vuelve a subir un PDF idéntico que ya está en el bucket
+    idempotente: bool = False
+
+@dataclass
+class ResultadoDiploma:
+    pdf_filename: str
+    public_url: str
+    # None en modo diferido: se completa al renderizar (ver diferido.py)
+    sha256: Optional[str]
+    # Segundos por etapa cuando se procesó en otro proceso (el coordinador los registra)
+    tiempos: Dict[str, float] = field(default_factory=dict)
+
+def preparar_qr(tarea: TareaDiploma, qr_modo: str = QR_MODO):
+    """(png, None) o (None, matriz) según el modo."""
+    url_verificacion = f"{BASE_URL_VERIFICACION}/verificar/{tarea.folio}"
+    with metricas.medir_etapa("qr"):
+        if qr_modo == "png":
+            return generar_qr_bytes(url_verificacion), None
+        return None, matriz_qr(url_verificacion)
+
+def dibujar_diploma(c, tarea: TareaDiploma, qr, ancho: float, nombre_qr: str = "qr"):
+    """Textos y QR del diploma sobre el canvas (la plantilla va debajo)."""
+    qr_png, qr_matriz = qr
+    c.setFont("Helvetica-Bold", POS.font_nombre)
+    c.drawCentredString(POS.nombre_xy[0], POS.nombre_xy[1], tarea.alumno_nombre)
+    c.setFont("Helvetica", POS.font_coordinador)
+    c.drawCentredString(POS.coordinador_xy[0], POS.coordinador_xy[1], tarea.nombre_profesor)
+    c.setFont("Helvetica", POS.font_fecha)
+    c.drawCentredString(POS.fecha_xy[0], POS.fecha_xy[1], formato_fecha_es(tarea.fecha_emision))
+    if qr_png:
+        c.drawImage(ImageReader(io.BytesIO(qr_png)), POS.qr_xy[0], POS.qr_xy[1], width=120, height=120, mask='auto')
+    else:
+        dibujar_qr_vectorial(c, qr_matriz, POS.qr_xy[0], POS.qr_xy[1], 120, nombre_qr)
+    c.setFont("Helvetica", 8)
+    c.drawRightString(ancho - 24, 18, f"Folio: {tarea.folio}")
+
+def renderizar_diploma(tarea: TareaDiploma, qr_modo: str = QR_MODO,
+                       controles: Optional[FrozenSet[str]] = None) -> bytes:
+    """Genera QR, overlay y fusión con la plantilla. No toca la BD. `controles` como en fusionar_con_plantilla."""
+    qr = preparar_qr(tarea, qr_modo)
+    W, H = leer_tamano_pagina(PLANTILLA_PDF)
+    with metricas.medir_etapa("overlay"):
+        overlay_bytes = crear_overlay((W, H), lambda c: dibujar_diploma(c, tarea, qr, W))
+    with metricas.medir_etapa("merge"):
+        return fusionar_con_plantilla(overlay_bytes, PLANTILLA_PDF, controles).getvalue()
+
+def calcular_hash(pdf_bytes: bytes) -> str:
+    with metricas.medir_etapa("hash"):
+        return hashlib.sha256(pdf_bytes).hexdigest()
+
+def nombre_pdf(tarea: TareaDiploma) -> str:
+    return f"DIPLOMA_{tarea.alumno_id}_{tarea.folio}.pdf"
+
+def url_descarga(folio: str) -> str:
+    """URL del PDF servido por la API (GET /pdf/{folio}), para backends sin URL pública propia."""
+    return f"{(BASE_URL_VERIFICACION or '').rstrip('/')}/pdf/{folio}"
+
+def procesar_tarea(tarea: TareaDiploma) -> ResultadoDiploma:
+    """Renderiza, guarda en el almacenamiento y calcula el hash. Se puede ejecutar en otro proceso."""
+    with metricas.corrida() as resumen:
+        pdf_bytes = renderizar_diploma(tarea)
+        pdf_filename = nombre_pdf(tarea)
+        guardado = get_almacenamiento().guardar(pdf_bytes, pdf_filename, solo_si_cambia=tarea.idempotente)
+        public_url = guardado.result() or url_descarga(tarea.folio)
+        print(f"  - [Storage] Guardado: {public_url}")
+        sha = calcular_hash(pdf_bytes)
+    tiempos = {e: sum(v) for e, v in resumen.etapas.items()}
+    return ResultadoDiploma(pdf_filename=pdf_filename, public_url=public_url, sha256=sha, tiempos=tiempos)
+
+# Usa profesor_id en la columna coordinador_id
+SQL_INSERT_DIPLOMA = """
+  INSERT INTO diploma (alumno_id, curso_id, coordinador_id, folio, fecha_emision, hash_sha256, estado, pdf_path, pdf_url)
+  VALUES (%s, %s, %s, %s, %s, %s, 'VALIDO', %s, %s)
+"""
+
+def _fila_diploma(tarea: TareaDiploma, resultado: ResultadoDiploma) -> tuple:
+    return (tarea.alumno_id, tarea.curso_id, tarea.profesor_id, tarea.folio, tarea.fecha_emision,
+            resultado.sha256, resultado.pdf_filename, resultado.public_url)
+
+def registrar_diploma(cursor, tarea: TareaDiploma, resultado: ResultadoDiploma):
+    with metricas.medir_etapa("insert"):
+        cursor.execute(SQL_INSERT_DIPLOMA, _fila_diploma(tarea, resultado))
+    metricas.DIPLOMAS_GENERADOS.inc()
+    cache_verificacion.invalidar_folio(tarea.folio)
+    print(f"  - Diploma generado para Alumno {tarea.alumno_id}")
+
+class BufferDiplomas:
+    """Acumula filas de diploma y las inserta con executemany cada `chunk` filas."""
+    def __init__(self, cursor, chunk: int = INSERT_CHUNK):
+        self.cursor = cursor
+        self.chunk = max(1, chunk)
+        self.filas = []
+        # Diplomas insertados por curso_id, para las estadísticas del panel
+        self.emitidos: Counter = Counter()
+
+    def agregar(self, tarea: TareaDiploma, resultado: ResultadoDiploma):
+        self.filas.append(_fila_diploma(tarea, resultado))
+        print(f"  - Diploma generado para Alumno {tarea.alumno_id}")
+        if len(self.filas) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if self.filas:
+            with metricas.medir_etapa("insert"):
+                self.cursor.executemany(SQL_INSERT_DIPLOMA, self.filas)
+            self.emitidos.update(fila[1] for fila in self.filas)
+            metricas.DIPLOMAS_GENERADOS.inc(len(self.filas))
+            cache_verificacion.invalidar_folio(*(fila[3] for fila in self.filas))
+            self.filas = []
+
+    def registrar_estadisticas(self):
+        """Suma lo insertado a las estadísticas; llamar justo antes del commit (bloquea sus filas)."""
+        estadisticas.sumar(self.cursor, diplomas=sum(self.emitidos.values()))
+        estadisticas.sumar_cursos(self.cursor, emitidos=self.emitidos)
+        # Lo siguiente va en otra transacción
+        self.emitidos = Counter()
+
+SQL_ALUMNOS_CURSO = """
+  SELECT i.alumno_id, a.nombre AS alumno_nombre, a.profesor_id, p.nombre AS profesor_nombre,
+         EXISTS(SELECT 1 FROM diploma d WHERE d.alumno_id = i.alumno_id AND d.curso_id = i.curso_id) AS tiene_diploma
+  FROM inscripcion i
+  JOIN alumno a ON a.alumno_id = i.alumno_id
+  LEFT JOIN profesor p ON p.profesor_id = a.profesor_id
+  WHERE i.curso_id = %s
+  ORDER BY i.alumno_id
+"""
+
+# Modo incremental: solo inscripciones desde la marca y sin diploma (índices en migracion_incremental.sql)
+SQL_PENDIENTES_CURSO = """
+  SELECT i.alumno_id, a.nombre AS alumno_nombre, a.profesor_id, p.nombre AS profesor_nombre,
+         i.fecha_inscripcion, 0 AS tiene_diploma
+  FROM inscripcion i
+  JOIN alumno a ON a.alumno_id = i.alumno_id
+  LEFT JOIN profesor p ON p.profesor_id = a.profesor_id
+  WHERE i.curso_id = %s AND i.fecha_inscripcion >= %s
+    AND NOT EXISTS (SELECT 1 FROM diploma d WHERE d.alumno_id = i.alumno_id AND d.curso_id = i.curso_id)
+  ORDER BY i.alumno_id
+"""
+
+# --- Marca de agua por curso (modo incremental) ---
+SQL_TABLA_MARCA = """
+CREATE TABLE IF NOT EXISTS marca_generacion (
+  curso_id INT NOT NULL,
+  hasta DATE NOT NULL,
+  actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (curso_id)
+)
+"""
+# Fecha mínima cuando un curso aún no tiene marca
+MARCA_INICIAL = dt.date(1900, 1, 1)
+
+_tabla_marca_lista = False
+
+def asegurar_tabla_marca(conn):
+    global _tabla_marca_lista
+    if _tabla_marca_lista:
+        return
+    cur = conn.cursor()
+    cur.execute(SQL_TABLA_MARCA)
+    cur.close()
+    conn.commit()
+    _tabla_marca_lista = True
+
+def leer_marca(cursor, curso_id: int) -> Optional[dt.date]:
+    cursor.execute("SELECT hasta FROM marca_generacion WHERE curso_id = %s", (curso_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return row["hasta"] if isinstance(row, dict) else row[0]
+
+def avanzar_marca(cursor, curso_id: int, hasta: dt.date):
+    """No hace commit: va en la misma transacción que los INSERT del curso."""
+    cursor.execute("INSERT INTO marca_generacion (curso_id, hasta) VALUES (%s, %s) "
+                   "ON DUPLICATE KEY UPDATE hasta = GREATEST(hasta, VALUES(hasta))", (curso_id, hasta))
+
+# --- Punto de control por curso y lista de reintentos (ver migracion_corridas.sql) ---
+SQL_TABLA_CORRIDA = """
+CREATE TABLE IF NOT EXISTS corrida_curso (
+  curso_id INT NOT NULL,
+  fecha_emision DATE NOT NULL,
+  estado ENUM('EN_PROCESO','INTERRUMPIDA','COMPLETADA') NOT NULL DEFAULT 'EN_PROCESO',
+  ultimo_alumno_id INT NOT NULL DEFAULT 0,
+  hechos INT NOT NULL DEFAULT 0,
+  iniciado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (curso_id)
+)
+"""
+
+SQL_TABLA_REINTENTO = """
+CREATE TABLE IF NOT EXISTS reintento_diploma (
+  curso_id INT NOT NULL,
+  alumno_id INT NOT NULL,
+  intentos INT NOT NULL DEFAULT 1,
+  error TEXT NULL,
+  actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (curso_id, alumno_id)
+)
+"""
+
+_tablas_corrida_listas = False
+
+def asegurar_tablas_corrida(conn):
+    global _tablas_corrida_listas
+    if _tablas_corrida_listas:
+        return
+    cur = conn.cursor()
+    cur.execute(SQL_TABLA_CORRIDA)
+    cur.execute(SQL_TABLA_REINTENTO)
+    cur.close()
+    conn.commit()
+    _tablas_corrida_listas = True
+
+def leer_punto_control(cursor, curso_id: int) -> Optional[dict]:
+    """Fila de `corrida_curso` (cursor con dictionary=True) o None si el curso nunca corrió."""
+    cursor.execute("SELECT fecha_emision, estado, ultimo_alumno_id, hechos FROM corrida_curso WHERE curso_id = %s",
+                   (curso_id,))
+    return cursor.fetchone()
+
+def guardar_punto_control(cursor, curso_id: int, fecha_emision: dt.date, estado: str, ultimo_alumno_id: int, hechos: int):
+    """No hace commit: va en la misma transacción que el bloque de diplomas que confirma."""
+    cursor.execute("INSERT INTO corrida_curso (curso_id, fecha_emision, estado, ultimo_alumno_id, hechos) "
+                   "VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE fecha_emision = VALUES(fecha_emision), "
+                   "estado = VALUES(estado), ultimo_alumno_id = VALUES(ultimo_alumno_id), hechos = VALUES(hechos)",
+                   (curso_id, fecha_emision, estado, ultimo_alumno_id, hechos))
+
+def marcar_interrumpida(conn, curso_id: int):
+    """Tras un rollback: deja constancia de que la corrida se puede reanudar. No falla si la conexión cayó."""
+    try:
+        cur = conn.cursor()
+        cur.execute("UPDATE corrida_curso SET estado = 'INTERRUMPIDA' WHERE curso_id = %s AND estado = 'EN_PROCESO'",
+                    (curso_id,))
+        cur.close()
+        conn.commit()
+    except Exception as e:
+        print(f"⚠️ No se pudo marcar como interrumpida la corrida del curso {curso_id}: {e}")
+
+def tomar_candado_curso(conn, curso_id: int) -> bool:
+    """
+    Candado con nombre (GET_LOCK) del curso, sin esperar: excluye corridas simultáneas del
+    mismo curso entre procesos (CLI, cron, worker). Es de la sesión: se suelta con
+    soltar_candado_curso o al cerrar la conexión.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, 0)", (f"diplomas_curso_{curso_id}",))
+    tomado = cur.fetchone()[0] == 1
+    cur.close()
+    return tomado
+
+def soltar_candado_curso(conn, curso_id: int):
+    cur = conn.cursor()
+    cur.execute("SELECT RELEASE_LOCK(%s)", (f"diplomas_curso_{curso_id}",))
+    cur.fetchone()
+    cur.close()
+
+def leer_reintentos(cursor, curso_id: int) -> Dict[int, str]:
+    """alumno_id -> último error de los alumnos del curso en la lista de reintentos."""
+    cursor.execute("SELECT alumno_id, error FROM reintento_diploma WHERE curso_id = %s", (curso_id,))
+    return {r["alumno_id"]: r["error"] for r in cursor.fetchall()}
+
+def registrar_reintentos(cursor, curso_id: int, fallos: List[Tuple[int, str]]):
+    if fallos:
+        cursor.executemany("INSERT INTO reintento_diploma (curso_id, alumno_id, error) VALUES (%s, %s, %s) "
+                           "ON DUPLICATE KEY UPDATE intentos = intentos + 1, error = VALUES(error)",
+                           [(curso_id, alumno_id, error[:2000]) for alumno_id, error in fallos])
+
+def quitar_reintentos(cursor, curso_id: int, alumnos: List[int]):
+    if alumnos:
+        cursor.execute(f"DELETE FROM reintento_diploma WHERE curso_id = %s AND alumno_id IN ({', '.join(['%s'] * len(alumnos))})",
+                       (curso_id, *alumnos))
+
+def tarea_desde_fila(row: dict, fecha_emision: dt.date, curso_id: Optional[int], idempotente: bool = False) -> TareaDiploma:
+    """Construye la tarea a partir de una fila de SQL_ALUMNOS_CURSO."""
+    return TareaDiploma(
+        alumno_id=row['alumno_id'], curso_id=curso_id, profesor_id=row['profesor_id'],
+        alumno_nombre=row['alumno_nombre'],
+        nombre_profesor=row['profesor_nombre'] or "Coordinador de Aula",
+        fecha_emision=fecha_emision, folio=nuevo_folio(row['alumno_id'], curso_id, fecha_emision, idempotente),
+        idempotente=idempotente,
+    )
+
+def tarea_desde_diploma(row: dict) -> TareaDiploma:
+    """Tarea de un diploma ya registrado (fila de `diploma` con alumno_nombre y profesor_nombre)."""
+    return TareaDiploma(
+        alumno_id=row["alumno_id"], curso_id=row["curso_id"], profesor_id=row["coordinador_id"],
+        alumno_nombre=row["alumno_nombre"],
+        nombre_profesor=row["profesor_nombre"] or "Coordinador de Aula",
+        fecha_emision=row["fecha_emision"], folio=row["folio"],
+    )
+
+def folio_determinista(alumno_id: int, curso_id: Optional[int], fecha_emision: dt.date) -> str:
+    """Mismo (alumno, curso, fecha) -> mismo folio; permite reintentar sin duplicar objetos."""
+    return str(uuid.uuid5(FOLIO_NAMESPACE, f"{alumno_id}:{curso_id}:{fecha_emision.isoformat()}"))
+
+def nuevo_folio(alumno_id: int, curso_id: Optional[int], fecha_emision: dt.date, idempotente: bool) -> str:
+    return folio_determinista(alumno_id, curso_id, fecha_emision) if idempotente else str(uuid.uuid4())
+
+def preparar_tarea(cursor, alumno_id: int, fecha_emision: dt.date, curso_id: Optional[int] = None,
+                   idempotente: bool = False) -> TareaDiploma:
     # 1. Obtener datos del alumno y su profesor_id
     cursor.execute("SELECT nombre, profesor_id FROM alumno WHERE alumno_id=%s", (alumno_id,))
     alumno_row = cursor.fetchone()
@@ -135,69 +555,452 @@ def generar_diploma_para_alumno(cursor, alumno_id: int, fecha_emision: dt.date,
         if profesor_row:
             nombre_profesor = profesor_row['nombre']
 
-    # 3. Generar folio, QR y overlay
-    folio = str(uuid.uuid4())
-    url_verificacion = f"{BASE_URL_VERIFICACION}/verificar/{folio}"
-    qr_png = generar_qr_bytes(url_verificacion)
-    W, H = leer_tamano_pagina(PLANTILLA_PDF)
+    # 3. Generar folio
+    return TareaDiploma(
+        alumno_id=alumno_id, curso_id=curso_id, profesor_id=profesor_id,
+        alumno_nombre=alumno_nombre, nombre_profesor=nombre_profesor,
+        fecha_emision=fecha_emision, folio=nuevo_folio(alumno_id, curso_id, fecha_emision, idempotente),
+        idempotente=idempotente,
+    )
 
-    def draw(c):
-        c.setFont("Helvetica-Bold", POS.font_nombre)
-        c.drawCentredString(POS.nombre_xy[0], POS.nombre_xy[1], alumno_nombre)
-        c.setFont("Helvetica", POS.font_coordinador)
-        c.drawCentredString(POS.coordinador_xy[0], POS.coordinador_xy[1], nombre_profesor)
-        c.setFont("Helvetica", POS.font_fecha)
-        c.drawCentredString(POS.fecha_xy[0], POS.fecha_xy[1], formato_fecha_es(fecha_emision))
-        c.drawImage(ImageReader(io.BytesIO(qr_png)), POS.qr_xy[0], POS.qr_xy[1], width=120, height=120, mask='auto')
-        c.setFont("Helvetica", 8)
-        c.drawRightString(W - 24, 18, f"Folio: {folio}")
-
-    overlay_bytes = crear_overlay((W, H), draw)
-    
-    # 4. Fusionar en memoria y subir a Supabase
-    pdf_buffer = fusionar_con_plantilla(overlay_bytes, PLANTILLA_PDF)
-    pdf_bytes = pdf_buffer.getvalue()
-    pdf_filename = f"DIPLOMA_{alumno_id}_{folio}.pdf"
-    public_url = upload_pdf_from_bytes(pdf_bytes, dest_name=pdf_filename)
-    print(f"  - [Supabase] Subido: {public_url}")
-
-    # 5. Calcular hash y registrar en la BD
-    sha = hashlib.sha256(pdf_bytes).hexdigest()
-    # Usa profesor_id en la columna coordinador_id
-    cursor.execute("""
-      INSERT INTO diploma (alumno_id, curso_id, coordinador_id, folio, fecha_emision, hash_sha256, estado, pdf_path, pdf_url)
-      VALUES (%s, %s, %s, %s, %s, %s, 'VALIDO', %s, %s)
-    """, (alumno_id, curso_id, profesor_id, folio, fecha_emision, sha, pdf_filename, public_url))
-    print(f"  - Diploma generado para Alumno {alumno_id}")
-
-def generar_diplomas_para_curso(curso_id: int, fecha_emision: Optional[dt.date] = None):
+def generar_diploma_para_alumno(cursor, alumno_id: int, fecha_emision: dt.date, curso_id: Optional[int] = None,
+                                idempotente: bool = False):
+    tarea = preparar_tarea(cursor, alumno_id, fecha_emision, curso_id, idempotente)
+    resultado = procesar_tarea(tarea)
+    registrar_diploma(cursor, tarea, resultado)
+    estadisticas.sumar(cursor, diplomas=1)
+    estadisticas.sumar_cursos(cursor, emitidos=Counter([curso_id]))
+
+def _texto_error(e: Exception) -> str:
+    return f"{type(e).__name__}: {e}"
+
+def procesar_tarea_o_error(tarea: TareaDiploma) -> Tuple[Optional[ResultadoDiploma], Optional[str]]:
+    """procesar_tarea para el pool: el fallo de un alumno se devuelve como texto en vez de cortar el map."""
+    try:
+        return procesar_tarea(tarea), None
+    except Exception as e:
+        return None, _texto_error(e)
+
+class GeneracionCancelada(Exception):
+    pass
+
+class CursoOcupado(Exception):
+    """Otra corrida del mismo curso tiene su candado."""
+    pass
+
+def resumen_corrida(resumen: "metricas.ResumenCorrida", curso_id: int, hechos: int, total: int, resultado: str,
+                    fallidos: int = 0) -> dict:
+    """Imprime y devuelve el resumen estructurado (JSON) de una corrida por curso."""
+    datos = resumen.como_dict(curso_id=curso_id, resultado=resultado, hechos=hechos, total=total, fallidos=fallidos)
+    print(f"[RESUMEN] {json.dumps(datos, ensure_ascii=False)}")
+    return datos
+
+def generar_diplomas_para_curso(curso_id: int, fecha_emision: Optional[dt.date] = None, workers: int = 1,
+                                insert_chunk: int = INSERT_CHUNK,
+                                progreso: Optional[Callable[[int, int], None]] = None,
+                                cancelado: Optional[Callable[[], bool]] = None,
+                                idempotente: bool = IDEMPOTENTE,
+                                diferido: bool = DIFERIDO,
+                                incremental: bool = False,
+                                desde: Optional[dt.date] = None,
+                                commit_chunk: int = COMMIT_CHUNK,
+                                reintentar: bool = False,
+                                contexto_pool: Optional[str] = None):
+    """
+    Genera los diplomas de un curso. Con workers > 1 el render y la subida se reparten
+    en un pool de procesos; las lecturas y los INSERT se quedan en este proceso.
+    `contexto_pool` es el método de arranque de ese pool ("fork", "forkserver", "spawn";
+    None = el de la plataforma). Desde un proceso con varios hilos no debe ser "fork": el
+    hijo heredaría locks tomados por otros hilos.
+    Los alumnos se leen con una sola consulta (por alumno_id) y los INSERT se agrupan de
+    `insert_chunk` en `insert_chunk`.
+    Se hace commit cada `commit_chunk` diplomas (0 = una sola transacción para todo el curso)
+    junto con el punto de control del curso (`corrida_curso`: último alumno confirmado).
+    Si la corrida se interrumpe, la siguiente con la misma fecha de emisión sigue desde ahí;
+    lo ya confirmado no se deshace.
+    Un alumno cuyo render o subida falla no detiene la corrida: pasa a `reintento_diploma`
+    y lo recoge la siguiente corrida del curso o una con `reintentar` (solo esa lista).
+    `progreso(hechos, total)` se llama tras cada diploma; si `cancelado()` devuelve True
+    se lanza GeneracionCancelada y se deshace el bloque en curso.
+    Con `idempotente` los folios salen de (alumno, curso, fecha) y no se resuben PDFs idénticos,
+    así que reintentar una corrida fallida casi no cuesta.
+    Con `diferido` solo se insertan las filas; cada PDF se genera al pedirlo por primera vez.
+    Con `incremental` solo se leen las inscripciones sin diploma desde `desde` o, si no se
+    indica, desde la marca guardada del curso, que avanza al confirmar el último bloque
+    (sin pasar de la inscripción más antigua que quedó para reintento).
+    Una inscripción con fecha anterior a la marca no se ve en modo incremental: la recoge
+    una corrida completa.
+    Solo corre una a la vez por curso (candado en la BD): si otra ya lo tiene, se lanza
+    CursoOcupado sin tocar nada.
+    Devuelve el resumen de la corrida con los tiempos por etapa.
+    """
     if not fecha_emision:
         fecha_emision = dt.date.today()
 
+    with metricas.corrida() as resumen:
+        hechos, fallidos, tareas = 0, 0, []
+        conn = conectar_db()
+        try:
+            if not tomar_candado_curso(conn, curso_id):
+                raise CursoOcupado(f"El curso {curso_id} ya se está generando en otro proceso")
+            # Antes de abrir la transacción: el DDL haría commit implícito
+            estadisticas.asegurar_tablas(conn)
+            asegurar_tablas_corrida(conn)
+            if incremental:
+                asegurar_tabla_marca(conn)
+        except Exception:
+            # Cerrar la conexión suelta el candado si se llegó a tomar
+            conn.close()
+            raise
+        conn.autocommit = False
+        try:
+            cur = conn.cursor(dictionary=True)
+            with metricas.medir_etapa("db"):
+                if incremental or desde:
+                    if desde is None:
+                        desde = leer_marca(cur, curso_id) or MARCA_INICIAL
+                    cur.execute(SQL_PENDIENTES_CURSO, (curso_id, desde))
+                else:
+                    cur.execute(SQL_ALUMNOS_CURSO, (curso_id,))
+                alumnos = cur.fetchall()
+                punto = leer_punto_control(cur, curso_id)
+                reintentos = leer_reintentos(cur, curso_id)
+
+            # Último alumno confirmado y diplomas de la corrida antes de esta llamada
+            ultimo, hechos_previos = 0, 0
+            if reintentar:
+                alumnos = [a for a in alumnos if a['alumno_id'] in reintentos]
+                print(f"Reintentando {len(alumnos)} alumno(s) del curso {curso_id}...")
+            elif punto and punto['estado'] != 'COMPLETADA' and punto['fecha_emision'] == fecha_emision:
+                ultimo, hechos_previos = punto['ultimo_alumno_id'], punto['hechos']
+                alumnos = [a for a in alumnos if a['alumno_id'] > ultimo or a['alumno_id'] in reintentos]
+                print(f"Reanudando la corrida del curso {curso_id} tras el alumno {ultimo} "
+                      f"({hechos_previos} diploma(s) ya confirmados)...")
+            else:
+                print(f"Iniciando generación de diplomas para {len(alumnos)} alumno(s) del curso {curso_id}...")
+            for alumno_data in alumnos:
+                if alumno_data['tiene_diploma']:
+                    print(f"  - Alumno {alumno_data['alumno_id']} ya tiene un diploma para este curso. Omitiendo.")
+                    continue
+                tareas.append(tarea_desde_fila(alumno_data, fecha_emision, curso_id, idempotente))
+            if not reintentar:
+                # Visible aunque la corrida se corte antes del primer bloque
+                guardar_punto_control(cur, curso_id, fecha_emision, 'EN_PROCESO', ultimo, hechos_previos)
+                conn.commit()
+
+            def revisar_cancelacion():
+                if cancelado and cancelado():
+                    raise GeneracionCancelada(f"Generación del curso {curso_id} cancelada")
+
+            def avanzar():
+                nonlocal hechos
+                hechos += 1
+                if progreso:
+                    progreso(hechos, len(tareas))
+                revisar_cancelacion()
+
+            def resultados():
+                """(tarea, resultado, error) en el orden de `tareas`; `error` es el fallo del alumno, si lo hubo."""
+                if diferido:
+                    for tarea in tareas:
+                        yield tarea, ResultadoDiploma(pdf_filename=nombre_pdf(tarea),
+                                                      public_url=url_descarga(tarea.folio), sha256=None), None
+                elif workers > 1 and len(tareas) > 1:
+                    chunksize = max(1, len(tareas) // (workers * 4))
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(contexto_pool))
+                    try:
+                        for tarea, (resultado, error) in zip(tareas, pool.map(procesar_tarea_o_error, tareas, chunksize=chunksize)):
+                            if resultado:
+                                for etapa, segundos in resultado.tiempos.items():
+                                    metricas.registrar_etapa(etapa, segundos)
+                            yield tarea, resultado, error
+                    finally:
+                        # Si hubo error o cancelación, no seguir renderizando lo que falta
+                        pool.shutdown(wait=True, cancel_futures=True)
+                else:
+                    # Se sigue renderizando mientras las subidas van en segundo plano, bloque por bloque
+                    almacenamiento = get_almacenamiento()
+                    paso = commit_chunk or len(tareas) or 1
+                    for i in range(0, len(tareas), paso):
+                        pendientes = []
+                        for tarea in tareas[i:i + paso]:
+                            revisar_cancelacion()
+                            try:
+                                pdf_bytes = renderizar_diploma(tarea)
+                                guardado = almacenamiento.guardar(pdf_bytes, nombre_pdf(tarea), solo_si_cambia=idempotente)
+                                pendientes.append((tarea, calcular_hash(pdf_bytes), guardado, None))
+                            except Exception as e:
+                                pendientes.append((tarea, None, None, _texto_error(e)))
+                        for tarea, sha, guardado, error in pendientes:
+                            if error is None:
+                                try:
+                                    public_url = guardado.result() or url_descarga(tarea.folio)
+                                except Exception as e:
+                                    error = _texto_error(e)
+                            if error:
+                                yield tarea, None, error
+                                continue
+                            print(f"  - [Storage] Guardado: {public_url}")
+                            yield tarea, ResultadoDiploma(pdf_filename=nombre_pdf(tarea), public_url=public_url, sha256=sha), None
+
+            buffer = BufferDiplomas(cur, insert_chunk)
+            confirmados, exitosos, fallos = 0, [], []
+            fechas = {a['alumno_id']: a.get('fecha_inscripcion') for a in alumnos}
+            fecha_fallida = None  # inscripción más antigua que quedó para reintento
+
+            def confirmar(estado: str = 'EN_PROCESO'):
+                """Cierra el bloque: INSERT pendientes, estadísticas, reintentos y punto de control en un commit."""
+                nonlocal confirmados, exitosos, fallos
+                buffer.flush()
+                buffer.registrar_estadisticas()
+                registrar_reintentos(cur, curso_id, fallos)
+                quitar_reintentos(cur, curso_id, [a for a in exitosos if a in reintentos])
+                confirmados += len(exitosos)
+                if not reintentar:
+                    guardar_punto_control(cur, curso_id, fecha_emision, estado, ultimo, hechos_previos + confirmados)
+                if estado == 'COMPLETADA' and incremental and alumnos:
+                    hasta = max(a['fecha_inscripcion'] for a in alumnos)
+                    avanzar_marca(cur, curso_id, min(hasta, fecha_fallida) if fecha_fallida else hasta)
+                conn.commit()
+                estadisticas.invalidar_cache()
+                exitosos, fallos = [], []
+
+            if progreso:
+                progreso(0, len(tareas))
+            with contextlib.closing(resultados()) as flujo:
+                for tarea, resultado, error in flujo:
+                    ultimo = max(ultimo, tarea.alumno_id)
+                    if error:
+                        print(f"  - [Reintento] Alumno {tarea.alumno_id}: {error}")
+                        fallos.append((tarea.alumno_id, error))
+                        fallidos += 1
+                        fecha = fechas.get(tarea.alumno_id)
+                        if fecha and (fecha_fallida is None or fecha < fecha_fallida):
+                            fecha_fallida = fecha
+                    else:
+                        buffer.agregar(tarea, resultado)
+                        exitosos.append(tarea.alumno_id)
+                    if commit_chunk and len(exitosos) + len(fallos) >= commit_chunk:
+                        confirmar()
+                    avanzar()
+
+            confirmar('COMPLETADA')
+            if fallidos:
+                print(f"[AVISO] {fallidos} alumno(s) del curso {curso_id} quedaron para reintento (--reintentar).")
+            print(f"[OK] Proceso para el curso {curso_id} finalizado.")
+            estado = "parcial" if fallidos else "ok"
+            metricas.CORRIDAS.inc(resultado=estado)
+            return resumen_corrida(resumen, curso_id, hechos, len(tareas), estado, fallidos)
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERROR] Falló la generación para el curso {curso_id}: {e}")
+            if not reintentar:
+                marcar_interrumpida(conn, curso_id)
+            estado = "cancelada" if isinstance(e, GeneracionCancelada) else "error"
+            metricas.CORRIDAS.inc(resultado=estado)
+            resumen_corrida(resumen, curso_id, hechos, len(tareas), estado, fallidos)
+            raise
+        finally:
+            if conn and conn.is_connected():
+                try:
+                    soltar_candado_curso(conn, curso_id)
+                finally:
+                    conn.close()
+
+SQL_CURSOS_CON_PENDIENTES = """
+  SELECT c.curso_id
+  FROM curso c
+  LEFT JOIN marca_generacion m ON m.curso_id = c.curso_id
+  WHERE {filtro} EXISTS (
+    SELECT 1 FROM inscripcion i
+    WHERE i.curso_id = c.curso_id AND i.fecha_inscripcion >= IFNULL(m.hasta, %s)
+      AND NOT EXISTS (SELECT 1 FROM diploma d WHERE d.alumno_id = i.alumno_id AND d.curso_id = i.curso_id)
+  )
+  ORDER BY c.curso_id
+"""
+
+def barrido_incremental(escuela_id: Optional[int] = None, fecha_emision: Optional[dt.date] = None,
+                        **opciones) -> list:
+    """
+    Corrida incremental de todos los cursos (o los de una escuela) que tienen inscripciones
+    nuevas sin diploma. Los cursos sin pendientes no se abren. Pensado para programarse
+    (cron) cada noche; `opciones` se pasan a generar_diplomas_para_curso.
+    Un curso que falla no detiene el barrido. Devuelve los resúmenes de las corridas.
+    """
+    conn = conectar_db()
+    try:
+        asegurar_tabla_marca(conn)
+        cur = conn.cursor()
+        if escuela_id is None:
+            cur.execute(SQL_CURSOS_CON_PENDIENTES.format(filtro=""), (MARCA_INICIAL,))
+        else:
+            cur.execute(SQL_CURSOS_CON_PENDIENTES.format(filtro="c.escuela_id = %s AND"), (escuela_id, MARCA_INICIAL))
+        cursos = [r[0] for r in cur.fetchall()]
+        cur.close()
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+    ambito = f"escuela {escuela_id}" if escuela_id is not None else "todas las escuelas"
+    print(f"[Barrido] {len(cursos)} curso(s) con inscripciones pendientes ({ambito}).")
+    resumenes, fallidos = [], []
+    for curso_id in cursos:
+        try:
+            resumenes.append(generar_diplomas_para_curso(curso_id, fecha_emision, incremental=True, **opciones))
+        except CursoOcupado as e:
+            # Lo termina la corrida que lo tiene; lo que falte lo recoge el siguiente barrido
+            print(f"[Barrido] {e}; se omite.")
+        except Exception:
+            fallidos.append(curso_id)
+    if fallidos:
+        print(f"[Barrido] Cursos con error: {', '.join(map(str, fallidos))}")
+    return resumenes
+
+def reconciliar_huerfanos(borrar: bool = False, min_edad_horas: float = 1.0) -> list:
+    """
+    Busca PDFs DIPLOMA_*.pdf del almacenamiento que no están en `diploma.pdf_path` (p. ej. tras un rollback)
+    y, con `borrar=True`, los elimina. Ignora los más nuevos que `min_edad_horas` para no tocar
+    subidas de una corrida en curso.
+    """
+    limite = dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=min_edad_horas)
+    candidatos = []
+    almacenamiento = get_almacenamiento()
+    for obj in almacenamiento.listar():
+        nombre = obj["name"]
+        creado = obj.get("created_at")
+        if not (nombre.startswith("DIPLOMA_") and nombre.endswith(".pdf")):
+            continue
+        if creado and dt.datetime.fromisoformat(creado.replace("Z", "+00:00")) > limite:
+            continue
+        candidatos.append(nombre)
+
+    registrados = set()
+    conn = conectar_db()
+    try:
+        cur = conn.cursor()
+        for i in range(0, len(candidatos), 500):
+            lote = candidatos[i:i + 500]
+            cur.execute(f"SELECT pdf_path FROM diploma WHERE pdf_path IN ({', '.join(['%s'] * len(lote))})", lote)
+            registrados.update(r[0] for r in cur.fetchall())
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+    huerfanos = [n for n in candidatos if n not in registrados]
+    print(f"[Reconciliar] {len(candidatos)} objeto(s) revisados, {len(huerfanos)} huérfano(s).")
+    for nombre in huerfanos:
+        if borrar:
+            ok = almacenamiento.eliminar(nombre)
+            print(f"  - {'Eliminado' if ok else 'No se pudo eliminar'}: {nombre}")
+        else:
+            print(f"  - Huérfano: {nombre}")
+    return huerfanos
+
+# --- PDF de impresión por curso ---
+SQL_DIPLOMAS_CURSO = """
+  SELECT d.folio, d.alumno_id, d.curso_id, d.coordinador_id, d.fecha_emision,
+         a.nombre AS alumno_nombre, p.nombre AS profesor_nombre
+  FROM diploma d
+  JOIN alumno a ON a.alumno_id = d.alumno_id
+  LEFT JOIN profesor p ON p.profesor_id = d.coordinador_id
+  WHERE d.curso_id = %s AND d.estado = 'VALIDO'
+  ORDER BY a.nombre, d.folio
+"""
+
+CAJAS_PAGINA = ("/MediaBox", "/CropBox", "/BleedBox", "/TrimBox", "/ArtBox")
+
+def _objeto_indirecto(writer: PdfWriter, obj):
+    """
+    Agrega `obj` al writer como objeto indirecto y devuelve su referencia. PyPDF2 3.0.1
+    (fijado en requirements.txt) no tiene API pública para esto; es el único uso de
+    `_add_object` fuera de optimizar_pdf.
+    """
+    return writer._add_object(obj)
+
+def _plantilla_como_form(writer: PdfWriter, plantilla: PlantillaCacheada):
+    """
+    Copia la página de la plantilla al writer como un Form XObject (una sola vez).
+    Cada página del PDF del curso la dibuja con `/Plantilla Do`: la imagen y el
+    contenido de la plantilla se escriben una vez y no una por alumno.
+    """
+    with plantilla.lock:
+        datos = DecodedStreamObject()
+        datos.set_data(plantilla.page.get_contents().get_data())
+        # flate_encode() devuelve un stream nuevo solo con /Filter: las claves van después
+        form = datos.flate_encode()
+        form.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject(FloatObject(v) for v in plantilla.page.mediabox),
+            NameObject("/Resources"): plantilla.page["/Resources"].clone(writer),
+        })
+    return _objeto_indirecto(writer, form)
+
+def escribir_pdf_curso(tareas: List[TareaDiploma], destino: BinaryIO, qr_modo: str = QR_MODO,
+                       controles: Optional[FrozenSet[str]] = None) -> int:
+    """
+    PDF de varias páginas (una por diploma) listo para imprimir, con la plantilla compartida.
+    Los textos y QR de todas las páginas salen de un solo canvas, así que también las
+    fuentes se comparten. `controles` como en fusionar_con_plantilla. Devuelve el número de páginas.
+    Sin tareas no escribe nada en `destino` y devuelve 0.
+    """
+    if not tareas:
+        return 0
+    if controles is None:
+        controles = PDF_OPTIMIZAR
+    plantilla = PLANTILLAS.obtener(PLANTILLA_PDF, optimizada="plantilla" in controles)
+    W, H = plantilla.mediabox
+    with metricas.medir_etapa("overlay"):
+        buf = io.BytesIO()
+        c = canvas.Canvas(buf, pagesize=(W, H), pageCompression=1, invariant=1)
+        for i, tarea in enumerate(tareas):
+            # Los nombres de Form XObject son globales al documento: uno por página
+            dibujar_diploma(c, tarea, preparar_qr(tarea, qr_modo), W, nombre_qr=f"qr{i}")
+            c.showPage()
+        c.save()
+
+    with metricas.medir_etapa("merge"):
+        writer = optimizar_pdf.nuevo_writer(controles)
+        form = _plantilla_como_form(writer, plantilla)
+        prefijo_datos = DecodedStreamObject()
+        prefijo_datos.set_data(b"q /Plantilla Do Q\n")
+        prefijo = _objeto_indirecto(writer, prefijo_datos)
+        for overlay_page in PdfReader(buf).pages:
+            # Las páginas del mismo reader comparten los objetos clonados (fuentes)
+            page = writer.add_page(overlay_page)
+            # Mismas cajas que la plantilla (su MediaBox no siempre empieza en 0,0), como en fusionar_con_plantilla
+            for caja in CAJAS_PAGINA:
+                if caja in plantilla.page:
+                    page[NameObject(caja)] = ArrayObject(FloatObject(v) for v in plantilla.page[caja])
+            recursos = page["/Resources"].get_object()
+            xobjects = recursos.get("/XObject")
+            if xobjects is None:
+                xobjects = recursos[NameObject("/XObject")] = DictionaryObject()
+            xobjects.get_object()[NameObject("/Plantilla")] = form
+            contenido = page.raw_get("/Contents")
+            if isinstance(contenido.get_object(), ArrayObject):
+                contenido = contenido.get_object()
+            else:
+                contenido = [contenido]
+            page[NameObject("/Contents")] = ArrayObject([prefijo, *contenido])
+        writer.write(destino)
+    return len(tareas)
+
+def pdf_curso(curso_id: int, destino: str, qr_modo: str = QR_MODO) -> int:
+    """Escribe en `destino` el PDF de impresión con los diplomas vigentes del curso."""
     conn = conectar_db()
-    conn.autocommit = False
     try:
         cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT alumno_id FROM inscripcion WHERE curso_id=%s", (curso_id,))
-        alumnos = cur.fetchall()
-
-        print(f"Iniciando generación de diplomas para {len(alumnos)} alumno(s) del curso {curso_id}...")
-        for alumno_data in alumnos:
-            alumno_id = alumno_data['alumno_id']
-            cur.execute("SELECT diploma_id FROM diploma WHERE alumno_id = %s AND curso_id = %s", (alumno_id, curso_id))
-            if cur.fetchone():
-                print(f"  - Alumno {alumno_id} ya tiene un diploma para este curso. Omitiendo.")
-                continue
-            generar_diploma_para_alumno(cur, alumno_id, fecha_emision, curso_id)
-        
-        conn.commit()
-        print(f"[OK] Proceso para el curso {curso_id} finalizado.")
-    except Exception as e:
-        conn.rollback()
-        print(f"[ERROR] Falló la generación para el curso {curso_id}: {e}")
-        raise
+        cur.execute(SQL_DIPLOMAS_CURSO, (curso_id,))
+        tareas = [tarea_desde_diploma(r) for r in cur.fetchall()]
+        cur.close()
     finally:
         if conn and conn.is_connected(): conn.close()
+    if not tareas:
+        print(f"[PDF curso] El curso {curso_id} no tiene diplomas vigentes.")
+        return 0
+    with open(destino, "wb") as f:
+        paginas = escribir_pdf_curso(tareas, f, qr_modo)
+    print(f"[PDF curso] {destino}: {paginas} página(s), {os.path.getsize(destino) / 1024:.0f} KB")
+    return paginas
 
 # --- Bloque para ejecución como script ---
 def main():
@@ -205,24 +1008,49 @@ def main():
     parser.add_argument("--curso_id", type=int, help="ID del curso para generar para todos los alumnos inscritos")
     parser.add_argument("--alumno_id", type=int, help="ID del alumno para generar un solo diploma")
     parser.add_argument("--fecha", type=str, default=dt.date.today().isoformat(), help="Fecha de emisión YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para renderizar y subir en paralelo (solo con --curso_id)")
+    parser.add_argument("--insert-chunk", type=int, default=INSERT_CHUNK, help="Filas por cada INSERT agrupado (solo con --curso_id)")
+    parser.add_argument("--commit-chunk", type=int, default=COMMIT_CHUNK, help="Diplomas por commit; 0 = una sola transacción (solo con --curso_id o --barrido)")
+    parser.add_argument("--reintentar", action="store_true", help="Con --curso_id, solo los alumnos de la lista de reintentos del curso")
+    parser.add_argument("--idempotente", action="store_true", default=IDEMPOTENTE, help="Folios deterministas y sin resubir PDFs idénticos")
+    parser.add_argument("--diferido", action="store_true", default=DIFERIDO, help="Solo reserva folios; el PDF se genera al descargarlo (solo con --curso_id)")
+    parser.add_argument("--incremental", action="store_true", help="Solo inscripciones sin diploma desde la marca del curso (con --curso_id o --barrido)")
+    parser.add_argument("--since", type=dt.date.fromisoformat, help="Con --curso_id, solo inscripciones desde esta fecha YYYY-MM-DD sin diploma")
+    parser.add_argument("--barrido", action="store_true", help="Corrida incremental de todos los cursos con pendientes")
+    parser.add_argument("--escuela_id", type=int, help="Con --barrido, solo los cursos de esta escuela")
+    parser.add_argument("--pdf-curso", metavar="RUTA", help="Con --curso_id, escribe un solo PDF de impresión con los diplomas del curso")
+    parser.add_argument("--reconciliar", action="store_true", help="Lista los PDFs del almacenamiento sin fila en `diploma`")
+    parser.add_argument("--borrar", action="store_true", help="Con --reconciliar, elimina los huérfanos")
+    parser.add_argument("--min-edad-horas", type=float, default=1.0, help="Con --reconciliar, ignora objetos más nuevos")
     args = parser.parse_args()
     fecha_emision = dt.date.fromisoformat(args.fecha)
 
     if args.alumno_id:
         conn = conectar_db()
         try:
+            estadisticas.asegurar_tablas(conn)
             cur = conn.cursor(dictionary=True)
             cur.execute("SELECT curso_id FROM inscripcion WHERE alumno_id = %s LIMIT 1", (args.alumno_id,))
             inscripcion = cur.fetchone()
             curso_id_alumno = inscripcion['curso_id'] if inscripcion else None
-            generar_diploma_para_alumno(cur, args.alumno_id, fecha_emision, curso_id_alumno)
+            generar_diploma_para_alumno(cur, args.alumno_id, fecha_emision, curso_id_alumno, idempotente=args.idempotente)
             conn.commit()
         finally:
             if conn and conn.is_connected(): conn.close()
+    elif args.curso_id and args.pdf_curso:
+        pdf_curso(args.curso_id, args.pdf_curso)
     elif args.curso_id:
-        generar_diplomas_para_curso(args.curso_id, fecha_emision)
+        generar_diplomas_para_curso(args.curso_id, fecha_emision, workers=args.workers, insert_chunk=args.insert_chunk,
+                                    idempotente=args.idempotente, diferido=args.diferido,
+                                    incremental=args.incremental, desde=args.since,
+                                    commit_chunk=args.commit_chunk, reintentar=args.reintentar)
+    elif args.barrido:
+        barrido_incremental(args.escuela_id, fecha_emision, workers=args.workers, insert_chunk=args.insert_chunk,
+                            idempotente=args.idempotente, diferido=args.diferido, commit_chunk=args.commit_chunk)
+    elif args.reconciliar:
+        reconciliar_huerfanos(borrar=args.borrar, min_edad_horas=args.min_edad_horas)
     else:
-        print("Error: Debes especificar --alumno_id o --curso_id.")
+        print("Error: Debes especificar --alumno_id, --curso_id o --barrido.")
 
 if __name__ == "__main__":
     main()
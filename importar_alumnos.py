@@ -0,0 +1,153 @@
+# importar_alumnos.py
+"""
+Importación masiva de alumnos desde CSV.
+- Lee el archivo fila por fila (no lo carga completo en memoria).
+- Valida cada bloque de filas y hace upsert con INSERT ... ON DUPLICATE KEY UPDATE (clave única: curp).
+- Hace commit por bloque: una fila con error no aborta el resto del archivo.
+- Suma los alumnos nuevos a las estadísticas del panel en la misma transacción del bloque.
+- Si el archivo deja de ser UTF-8 a la mitad, se detiene ahí: lo leído hasta entonces queda
+  importado y el resultado lo indica en `error_codificacion`.
+Columnas: nombre, curp, escuela_id y, opcionalmente, grado_id y profesor_id (si faltan o
+vienen vacías, un alumno existente conserva los que ya tenía).
+"""
+import io
+import os
+import csv
+from dataclasses import dataclass, field
+from typing import BinaryIO, List, Optional
+
+import mysql.connector
+
+import estadisticas
+
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "1000"))
+MAX_ERRORES_REPORTADOS = 200
+
+SQL_UPSERT_ALUMNO = """
+  INSERT INTO alumno (nombre, curp, escuela_id, grado_id, profesor_id, fecha_reg)
+  VALUES (%s, %s, %s, %s, %s, NOW())
+  ON DUPLICATE KEY UPDATE nombre=VALUES(nombre), escuela_id=VALUES(escuela_id),
+                          grado_id=COALESCE(VALUES(grado_id), grado_id),
+                          profesor_id=COALESCE(VALUES(profesor_id), profesor_id)
+"""
+
+@dataclass
+class ResultadoImportacion:
+    nuevos: int = 0
+    actualizados: int = 0
+    filas: int = 0
+    errores: List[str] = field(default_factory=list)
+    total_errores: int = 0
+    progreso: List[str] = field(default_factory=list)
+    # Dónde se cortó la lectura si el archivo no era UTF-8 válido
+    error_codificacion: Optional[str] = None
+
+    def error(self, mensaje: str):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES_REPORTADOS:
+            self.errores.append(mensaje)
+
+def _entero(valor: Optional[str], opcional: bool = False) -> Optional[int]:
+    valor = (valor or "").strip()
+    if not valor:
+        if opcional:
+            return None
+        raise ValueError("valor vacío")
+    return int(valor)
+
+def validar_fila(row: dict) -> tuple:
+    """Convierte una fila del CSV en la tupla del upsert o lanza ValueError."""
+    nombre = (row.get("nombre") or "").strip()
+    curp = (row.get("curp") or "").strip().upper()
+    if not nombre:
+        raise ValueError("falta el nombre")
+    if len(curp) != 18:
+        raise ValueError(f"CURP inválida '{curp}'")
+    try:
+        escuela_id = _entero(row.get("escuela_id"))
+        grado_id = _entero(row.get("grado_id"), opcional=True)
+        profesor_id = _entero(row.get("profesor_id"), opcional=True)
+    except ValueError as e:
+        raise ValueError(f"id no numérico ({e})")
+    return (nombre, curp, escuela_id, grado_id, profesor_id)
+
+def _curps_existentes(cur, curps: List[str]) -> set:
+    marcadores = ", ".join(["%s"] * len(curps))
+    cur.execute(f"SELECT curp FROM alumno WHERE curp IN ({marcadores})", curps)
+    return {r[0] for r in cur.fetchall()}
+
+def _procesar_bloque(conn, bloque: List[tuple], resultado: ResultadoImportacion, numero: int):
+    """bloque: lista de (numero_de_fila, tupla_validada)."""
+    cur = conn.cursor()
+    try:
+        existentes = _curps_existentes(cur, [t[1] for _, t in bloque])
+        try:
+            cur.executemany(SQL_UPSERT_ALUMNO, [t for _, t in bloque])
+            ok = bloque
+            nuevos = sum(1 for _, t in ok if t[1] not in existentes)
+            estadisticas.sumar(cur, alumnos=nuevos)
+            conn.commit()
+        except mysql.connector.Error:
+            # Algún registro rompe el bloque (p. ej. una FK): se reintenta fila por fila
+            conn.rollback()
+            ok = []
+            for n, t in bloque:
+                try:
+                    cur.execute(SQL_UPSERT_ALUMNO, t)
+                    ok.append((n, t))
+                except mysql.connector.Error as e:
+                    resultado.error(f"Error en fila {n}: {e}")
+            nuevos = sum(1 for _, t in ok if t[1] not in existentes)
+            estadisticas.sumar(cur, alumnos=nuevos)
+            conn.commit()
+    finally:
+        cur.close()
+    resultado.nuevos += nuevos
+    resultado.actualizados += len(ok) - nuevos
+    linea = f"Bloque {numero}: {len(ok)}/{len(bloque)} filas ({nuevos} nuevas, {len(ok) - nuevos} actualizadas)"
+    resultado.progreso.append(linea)
+    print(f"  - [CSV] {linea}")
+
+def importar_csv(binario: BinaryIO, conn, chunk: int = IMPORT_CHUNK) -> ResultadoImportacion:
+    """Importa alumnos desde un archivo binario (p. ej. UploadFile.file) usando `conn`."""
+    resultado = ResultadoImportacion()
+    estadisticas.asegurar_tablas(conn)
+    texto = io.TextIOWrapper(binario, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(texto)
+        bloque: List[tuple] = []
+        # Una CURP repetida en el mismo bloque contaría mal nuevos/actualizados: gana la última
+        indice_bloque = {}
+        numero = 0
+        try:
+            for i, row in enumerate(reader):
+                fila = i + 2  # +1 por el encabezado, +1 porque las filas se cuentan desde 1
+                resultado.filas += 1
+                try:
+                    t = validar_fila(row)
+                except ValueError as e:
+                    resultado.error(f"Error en fila {fila}: {e}")
+                    continue
+                if t[1] in indice_bloque:
+                    bloque[indice_bloque[t[1]]] = (fila, t)
+                else:
+                    indice_bloque[t[1]] = len(bloque)
+                    bloque.append((fila, t))
+                if len(bloque) >= chunk:
+                    numero += 1
+                    _procesar_bloque(conn, bloque, resultado, numero)
+                    bloque, indice_bloque = [], {}
+        except UnicodeDecodeError:
+            # Los bloques anteriores ya están confirmados; lo leído del bloque en curso también se importa
+            ultima = f"después de la fila {resultado.filas + 1}" if resultado.filas else "antes de la primera fila de datos"
+            resultado.error_codificacion = (f"El archivo no está codificado en UTF-8: la lectura se detuvo {ultima}; "
+                                            f"las filas siguientes no se importaron.")
+        if bloque:
+            numero += 1
+            _procesar_bloque(conn, bloque, resultado, numero)
+        if resultado.nuevos:
+            estadisticas.invalidar_cache()
+    finally:
+        # No cerrar el archivo subyacente al soltar el wrapper
+        texto.detach()
+    return resultado
@@ -0,0 +1,166 @@
+# metricas.py
+"""
+Instrumentación mínima (sin dependencias) con salida en formato Prometheus.
+- Contador e Histograma con etiquetas; `exportar()` genera el texto para /metrics.
+- `medir_etapa()` mide una etapa de la generación y, si hay una corrida activa
+  (`corrida()`), la suma también a su resumen para imprimirlo al final.
+Las métricas son por proceso.
+"""
+import time
+import threading
+import contextlib
+import contextvars
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registro: List["_Metrica"] = []
+_registro_lock = threading.Lock()
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _etiquetas(nombres: Tuple[str, ...], valores: Tuple[str, ...], extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        with _registro_lock:
+            _registro.append(self)
+
+    def _clave(self, valores: dict) -> Tuple[str, ...]:
+        return tuple(str(valores.get(n, "")) for n in self.etiquetas)
+
+    def exportar(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, n: float = 1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + n
+
+    def exportar(self) -> List[str]:
+        lineas = super().exportar()
+        with self._lock:
+            for clave, valor in sorted(self._valores.items()):
+                lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}")
+        return lineas
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = (), buckets: Iterable[float] = BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        # clave -> [conteos por bucket..., suma, total]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observar(self, valor: float, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._series.setdefault(clave, [0] * len(self.buckets) + [0.0, 0])
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    @contextlib.contextmanager
+    def medir(self, **etiquetas):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - t0, **etiquetas)
+
+    def exportar(self) -> List[str]:
+        lineas = super().exportar()
+        with self._lock:
+            for clave, serie in sorted(self._series.items()):
+                for limite, n in zip(self.buckets, serie):
+                    le = 'le="%s"' % limite
+                    lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {n}")
+                le = 'le="+Inf"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {serie[-1]}")
+                lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {serie[-2]}")
+                lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {serie[-1]}")
+        return lineas
+
+def exportar() -> str:
+    with _registro_lock:
+        metricas = list(_registro)
+    lineas: List[str] = []
+    for m in metricas:
+        lineas.extend(m.exportar())
+    return "\n".join(lineas) + "\n"
+
+# --- Métricas de la generación de diplomas ---
+ETAPA_SEGUNDOS = Histograma("diplomas_etapa_segundos", "Duración de cada etapa de la generación de diplomas", ["etapa"])
+DIPLOMAS_GENERADOS = Contador("diplomas_generados_total", "Diplomas generados y registrados")
+CORRIDAS = Contador("diplomas_corridas_total", "Corridas de generación por curso y resultado", ["resultado"])
+
+class ResumenCorrida:
+    """Acumula tiempos por etapa de una corrida (p. ej. un curso) para el resumen final."""
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def agregar(self, etapa: str, segundos: float):
+        with self._lock:
+            self.etapas.setdefault(etapa, []).append(segundos)
+
+    def como_dict(self, **extra) -> dict:
+        with self._lock:
+            etapas = {
+                e: {"n": len(v), "total_s": round(sum(v), 4), "media_ms": round(sum(v) / len(v) * 1000, 3)}
+                for e, v in self.etapas.items()
+            }
+        return {**extra, "segundos": round(time.perf_counter() - self.inicio, 4), "etapas": etapas}
+
+_corrida_actual: contextvars.ContextVar[Optional[ResumenCorrida]] = contextvars.ContextVar("corrida_actual", default=None)
+
+@contextlib.contextmanager
+def corrida():
+    resumen = ResumenCorrida()
+    token = _corrida_actual.set(resumen)
+    try:
+        yield resumen
+    finally:
+        _corrida_actual.reset(token)
+
+def registrar_etapa(etapa: str, segundos: float):
+    ETAPA_SEGUNDOS.observar(segundos, etapa=etapa)
+    resumen = _corrida_actual.get()
+    if resumen is not None:
+        resumen.agregar(etapa, segundos)
+
+@contextlib.contextmanager
+def medir_etapa(etapa: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - t0)
+
+# --- Métricas HTTP ---
+HTTP_SOLICITUDES = Contador("http_solicitudes_total", "Solicitudes HTTP por ruta, método y código", ["ruta", "metodo", "codigo"])
+HTTP_DURACION = Histograma("http_duracion_segundos", "Duración total de las solicitudes HTTP", ["ruta"])
+HTTP_DB_SEGUNDOS = Histograma("http_db_segundos", "Tiempo de BD dentro de cada endpoint", ["endpoint"])
+HTTP_PLANTILLA_SEGUNDOS = Histograma("http_plantilla_segundos", "Tiempo de render de plantillas Jinja2", ["plantilla"])
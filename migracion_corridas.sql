@@ -0,0 +1,23 @@
+-- Corridas por curso en bloques (generar_diplomas.py --commit-chunk / --reintentar):
+-- punto de control para reanudar una corrida interrumpida y lista de alumnos para reintento
+-- generar_diplomas.py también las crea al arrancar si no existen
+
+CREATE TABLE IF NOT EXISTS corrida_curso (
+  curso_id INT NOT NULL,
+  fecha_emision DATE NOT NULL,
+  estado ENUM('EN_PROCESO','INTERRUMPIDA','COMPLETADA') NOT NULL DEFAULT 'EN_PROCESO',
+  ultimo_alumno_id INT NOT NULL DEFAULT 0,
+  hechos INT NOT NULL DEFAULT 0,
+  iniciado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (curso_id)
+);
+
+CREATE TABLE IF NOT EXISTS reintento_diploma (
+  curso_id INT NOT NULL,
+  alumno_id INT NOT NULL,
+  intentos INT NOT NULL DEFAULT 1,
+  error TEXT NULL,
+  actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (curso_id, alumno_id)
+);
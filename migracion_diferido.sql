@@ -0,0 +1,4 @@
+-- Render diferido (GENERACION_DIFERIDA=1): la fila de `diploma` se reserva sin hash
+-- y se completa al generar el PDF en la primera descarga (ver diferido.py)
+
+ALTER TABLE diploma MODIFY hash_sha256 CHAR(64) NULL;
@@ -0,0 +1,20 @@
+-- Estadísticas del panel de administración (las mantiene estadisticas.py)
+-- La API, el importador y el worker también las crean si no existen
+
+CREATE TABLE IF NOT EXISTS estadistica (
+  clave VARCHAR(64) NOT NULL,
+  valor BIGINT NOT NULL DEFAULT 0,
+  actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (clave)
+);
+
+CREATE TABLE IF NOT EXISTS estadistica_curso (
+  curso_id INT NOT NULL,
+  inscritos INT NOT NULL DEFAULT 0,
+  emitidos INT NOT NULL DEFAULT 0,
+  anulados INT NOT NULL DEFAULT 0,
+  actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (curso_id)
+);
+
+-- Carga inicial: python estadisticas.py --reconciliar
@@ -0,0 +1,4 @@
+-- Índice para la verificación por archivo (POST /api/verificar-pdf, verificar_pdf.py):
+-- busca el diploma por el SHA-256 del PDF
+
+CREATE INDEX idx_diploma_hash ON diploma (hash_sha256);
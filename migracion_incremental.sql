@@ -0,0 +1,15 @@
+-- Generación incremental (generar_diplomas.py --incremental / --barrido):
+-- marca de agua por curso e índices para leer solo las inscripciones nuevas sin diploma
+
+CREATE TABLE IF NOT EXISTS marca_generacion (
+  curso_id INT NOT NULL,
+  hasta DATE NOT NULL,
+  actualizado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (curso_id)
+);
+
+-- Rango por fecha de inscripción dentro de un curso
+CREATE INDEX idx_insc_curso_fecha ON inscripcion (curso_id, fecha_inscripcion);
+
+-- Anti-join "sin diploma" por (alumno, curso)
+CREATE INDEX idx_diploma_alumno_curso ON diploma (alumno_id, curso_id);
@@ -0,0 +1,21 @@
+-- Cola de trabajos de generación de diplomas (la usan api_verificacion y worker_diplomas)
+-- worker_diplomas.py también la crea al arrancar si no existe
+
+CREATE TABLE IF NOT EXISTS trabajo_generacion (
+  trabajo_id BIGINT NOT NULL AUTO_INCREMENT,
+  curso_id INT NOT NULL,
+  fecha_emision DATE NULL,
+  estado ENUM('PENDIENTE','EN_PROCESO','COMPLETADO','FALLIDO','CANCELADO') NOT NULL DEFAULT 'PENDIENTE',
+  total INT NOT NULL DEFAULT 0,
+  hechos INT NOT NULL DEFAULT 0,
+  fallidos INT NOT NULL DEFAULT 0,
+  cancelar TINYINT(1) NOT NULL DEFAULT 0,
+  worker VARCHAR(120) NULL,
+  error TEXT NULL,
+  creado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  iniciado DATETIME NULL,
+  terminado DATETIME NULL,
+  latido DATETIME NULL,
+  PRIMARY KEY (trabajo_id),
+  KEY idx_trabajo_estado (estado, trabajo_id)
+);
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Optimización del tamaño de los diplomas. Controles (PDF_OPTIMIZAR, separados por coma):
+- plantilla: copia optimizada de la plantilla, una vez por proceso. Las coordenadas de
+  los trazos se redondean según la escala a la que se dibujan (error máximo
+  PDF_TOLERANCIA_PT puntos en la página) y los streams se recomprimen al máximo.
+- comprimir: comprime los streams que PyPDF2 deja sin filtro (el contenido de la
+  página fusionada) y los que estén dentro de otro objeto pasan a ser indirectos.
+- objetos: empaqueta los objetos sin stream en object streams y escribe la tabla de
+  referencias como stream comprimido (PDF 1.5).
+Son opcionales: con PDF_OPTIMIZAR vacío (por defecto) la salida es la de siempre.
+
+Las fuentes del overlay son las estándar de PDF (Helvetica), que no se incrustan, así
+que no hay nada que subconjuntar; las de la plantilla ya vienen como subconjunto.
+
+    python optimizar_pdf.py --reporte --n 5
+    python optimizar_pdf.py --plantilla reconocimientoo.pdf --salida reconocimientoo.opt.pdf
+"""
+import io
+import os
+import sys
+import math
+import zlib
+import argparse
+from typing import Dict, FrozenSet, List, Tuple
+
+import PyPDF2
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (ArrayObject, ContentStream, DictionaryObject, EncodedStreamObject, FloatObject,
+                            NameObject, NumberObject, StreamObject)
+
+CONTROLES = ("plantilla", "comprimir", "objetos")
+
+def _controles(valor: str) -> FrozenSet[str]:
+    elegidos = frozenset(c.strip().lower() for c in valor.split(",") if c.strip())
+    desconocidos = elegidos - set(CONTROLES)
+    if desconocidos:
+        raise ValueError(f"PDF_OPTIMIZAR desconocido: {', '.join(sorted(desconocidos))} (opciones: {', '.join(CONTROLES)})")
+    return elegidos
+
+PDF_OPTIMIZAR = _controles(os.getenv("PDF_OPTIMIZAR", ""))
+PDF_TOLERANCIA_PT = float(os.getenv("PDF_TOLERANCIA_PT", "0.01"))
+NIVEL_ZLIB = 9
+OBJETOS_POR_STREAM = 200
+# EscritorCompacto reemplaza la escritura de PdfWriter y usa sus atributos internos
+# (_objects, _root, _info, _ID...): solo se usa con la versión fijada en requirements.txt,
+# la que cubre tests/test_optimizar_pdf.py. Con otra, los diplomas salen con PdfWriter.
+PYPDF2_PROBADO = "3.0.1"
+COMPACTO_DISPONIBLE = PyPDF2.__version__ == PYPDF2_PROBADO
+
+# --- Streams ---
+def comprimir_stream(obj: StreamObject, datos: bytes) -> EncodedStreamObject:
+    """Copia de `obj` (mismas claves) con `datos` comprimidos con Flate."""
+    nuevo = EncodedStreamObject()
+    for clave, valor in obj.items():
+        if clave not in ("/Length", "/Filter", "/DecodeParms"):
+            nuevo[clave] = valor
+    nuevo[NameObject("/Filter")] = NameObject("/FlateDecode")
+    nuevo._data = zlib.compress(datos, NIVEL_ZLIB)
+    return nuevo
+
+def _sin_filtro(obj: StreamObject) -> bool:
+    return "/Filter" not in obj
+
+def _solo_flate(obj: StreamObject) -> bool:
+    return obj.get("/Filter") in ("/FlateDecode", ArrayObject([NameObject("/FlateDecode")])) and "/DecodeParms" not in obj
+
+class EscritorCompacto(PdfWriter):
+    """
+    PdfWriter con los controles `comprimir` y `objetos`. Con `recomprimir` también vuelve
+    a comprimir los streams Flate (caro: solo para la plantilla, una vez).
+    """
+    def __init__(self, comprimir: bool = True, objetos: bool = True, recomprimir: bool = False):
+        super().__init__()
+        self.comprimir = comprimir
+        self.objetos = objetos
+        self.recomprimir = recomprimir
+
+    def _indirectar_contenidos(self):
+        """Los streams deben ser objetos indirectos; merge_page deja /Contents dentro de la página."""
+        for pagina in self.pages:
+            contenido = pagina.raw_get("/Contents") if "/Contents" in pagina else None
+            if isinstance(contenido, StreamObject):
+                pagina[NameObject("/Contents")] = self._add_object(contenido)
+            elif isinstance(contenido, ArrayObject):
+                for i, parte in enumerate(contenido):
+                    if isinstance(parte, StreamObject):
+                        contenido[i] = self._add_object(parte)
+
+    def _comprimir_streams(self):
+        for i, obj in enumerate(self._objects):
+            if not isinstance(obj, StreamObject):
+                continue
+            if _sin_filtro(obj):
+                self._objects[i] = comprimir_stream(obj, obj.get_data())
+            elif self.recomprimir and _solo_flate(obj):
+                nuevo = comprimir_stream(obj, obj.get_data())
+                if len(nuevo._data) < len(obj._data):
+                    self._objects[i] = nuevo
+
+    def write_stream(self, stream) -> None:
+        if hasattr(self, "_encrypt"):
+            raise ValueError("EscritorCompacto no soporta PDFs cifrados")
+        if not self._root:
+            self._root = self._add_object(self._root_object)
+        self._sweep_indirect_references(self._root)
+        if self.comprimir or self.objetos:
+            self._indirectar_contenidos()
+        if self.comprimir:
+            self._comprimir_streams()
+        if not self.objetos:
+            posiciones = self._write_header(stream)
+            xref = self._write_xref_table(stream, posiciones)
+            self._write_trailer(stream)
+            stream.write(f"\nstartxref\n{xref}\n%%EOF\n".encode())
+            return
+        self._escribir_con_object_streams(stream)
+
+    def _escribir_con_object_streams(self, stream):
+        # Entradas de la xref: num -> (tipo, campo2, campo3)
+        entradas: Dict[int, Tuple[int, int, int]] = {0: (0, 0, 65535)}
+        stream.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+        empaquetar: List[int] = []
+        for num, obj in enumerate(self._objects, start=1):
+            if obj is None:
+                entradas[num] = (0, 0, 0)
+            elif isinstance(obj, StreamObject):
+                entradas[num] = (1, stream.tell(), 0)
+                stream.write(f"{num} 0 obj\n".encode())
+                obj.write_to_stream(stream, None)
+                stream.write(b"\nendobj\n")
+            else:
+                empaquetar.append(num)
+
+        siguiente = len(self._objects) + 1
+        for inicio in range(0, len(empaquetar), OBJETOS_POR_STREAM):
+            grupo = empaquetar[inicio:inicio + OBJETOS_POR_STREAM]
+            cuerpo, indice = io.BytesIO(), []
+            for pos, num in enumerate(grupo):
+                indice.append(f"{num} {cuerpo.tell()}")
+                self._objects[num - 1].write_to_stream(cuerpo, None)
+                cuerpo.write(b"\n")
+                entradas[num] = (2, siguiente, pos)
+            cabecera = (" ".join(indice) + "\n").encode()
+            objstm = DictionaryObject({
+                NameObject("/Type"): NameObject("/ObjStm"),
+                NameObject("/N"): NumberObject(len(grupo)),
+                NameObject("/First"): NumberObject(len(cabecera)),
+            })
+            entradas[siguiente] = (1, stream.tell(), 0)
+            self._escribir_stream(stream, siguiente, objstm, zlib.compress(cabecera + cuerpo.getvalue(), NIVEL_ZLIB))
+            siguiente += 1
+
+        # La tabla de referencias también es un stream (y se incluye a sí misma)
+        num_xref = siguiente
+        entradas[num_xref] = (1, stream.tell(), 0)
+        filas = b"".join(
+            bytes([tipo]) + c2.to_bytes(4, "big") + c3.to_bytes(2, "big")
+            for tipo, c2, c3 in (entradas.get(n, (0, 0, 0)) for n in range(num_xref + 1))
+        )
+        xref = DictionaryObject({
+            NameObject("/Type"): NameObject("/XRef"),
+            NameObject("/Size"): NumberObject(num_xref + 1),
+            NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(4), NumberObject(2)]),
+            NameObject("/Root"): self._root,
+            NameObject("/Info"): self._info,
+        })
+        if hasattr(self, "_ID"):
+            xref[NameObject("/ID")] = self._ID
+        posicion_xref = entradas[num_xref][1]
+        self._escribir_stream(stream, num_xref, xref, zlib.compress(filas, NIVEL_ZLIB))
+        stream.write(f"startxref\n{posicion_xref}\n%%EOF\n".encode())
+
+    @staticmethod
+    def _escribir_stream(stream, num: int, dic: DictionaryObject, datos: bytes):
+        dic[NameObject("/Filter")] = NameObject("/FlateDecode")
+        dic[NameObject("/Length")] = NumberObject(len(datos))
+        stream.write(f"{num} 0 obj\n".encode())
+        dic.write_to_stream(stream, None)
+        stream.write(b"\nstream\n" + datos + b"\nendstream\nendobj\n")
+
+def nuevo_writer(controles: FrozenSet[str] = PDF_OPTIMIZAR) -> PdfWriter:
+    """Writer para cada diploma según los controles activos."""
+    if ("comprimir" in controles or "objetos" in controles) and COMPACTO_DISPONIBLE:
+        return EscritorCompacto(comprimir="comprimir" in controles, objetos="objetos" in controles)
+    return PdfWriter()
+
+# --- Plantilla: redondeo de coordenadas según la escala ---
+OPERADORES_TRAZO = {b"m", b"l", b"c", b"v", b"y", b"re"}
+IDENTIDAD = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+MAX_PROFUNDIDAD = 12
+
+def _multiplicar(m, n):
+    """Matriz m seguida de n (convención de PDF: [a b c d e f])."""
+    a, b, c, d, e, f = m
+    A, B, C, D, E, F = n
+    return (a * A + b * C, a * B + b * D, c * A + d * C, c * B + d * D, e * A + f * C + E, e * B + f * D + F)
+
+def _escala(m) -> float:
+    """Mayor valor singular de la parte lineal: lo máximo que la matriz agranda una distancia."""
+    a, b, c, d = m[:4]
+    t = a * a + b * b + c * c + d * d
+    det = a * d - b * c
+    return math.sqrt((t + math.sqrt(max(t * t - 4 * det * det, 0.0))) / 2)
+
+def _redondear(valor, decimales: int):
+    v = round(float(valor), decimales)
+    if decimales == 0 or v == int(v):
+        return NumberObject(int(v))
+    return FloatObject(f"{v:.{decimales}f}")
+
+class _Redondeo:
+    """Recorre el contenido de la página y de sus Form XObjects registrando la escala máxima de cada trazo."""
+    def __init__(self, reader: PdfReader):
+        self.reader = reader
+        # id(stream) -> [stream, ContentStream, escala máxima]
+        self.flujos: Dict[int, list] = {}
+
+    def recorrer(self, contenido: ContentStream, clave: int, recursos, ctm, profundidad: int = 0):
+        pila = []
+        xobjects = (recursos or {}).get("/XObject")
+        xobjects = xobjects.get_object() if xobjects is not None else {}
+        for operandos, op in contenido.operations:
+            if op == b"q":
+                pila.append(ctm)
+            elif op == b"Q":
+                ctm = pila.pop() if pila else ctm
+            elif op == b"cm" and len(operandos) == 6:
+                ctm = _multiplicar(tuple(float(x) for x in operandos), ctm)
+            elif op in OPERADORES_TRAZO:
+                entrada = self.flujos[clave]
+                entrada[2] = max(entrada[2], _escala(ctm))
+            elif op == b"Do" and profundidad < MAX_PROFUNDIDAD and operandos and operandos[0] in xobjects:
+                xobj = xobjects[operandos[0]].get_object()
+                if xobj.get("/Subtype") != "/Form":
+                    continue
+                matriz = tuple(float(x) for x in xobj.get("/Matrix", IDENTIDAD))
+                sub = self.flujos.get(id(xobj))
+                if sub is None:
+                    sub = self.flujos[id(xobj)] = [xobj, ContentStream(xobj, self.reader), 0.0]
+                self.recorrer(sub[1], id(xobj), xobj.get("/Resources") or recursos, _multiplicar(matriz, ctm), profundidad + 1)
+
+    @staticmethod
+    def aplicar(contenido: ContentStream, escala: float, tolerancia: float) -> bool:
+        if escala <= 0:
+            return False
+        # Error de redondeo <= 0.5 * 10^-decimales en el espacio del trazo
+        decimales = max(0, min(6, math.ceil(math.log10(escala / tolerancia))))
+        for operandos, op in contenido.operations:
+            if op in OPERADORES_TRAZO:
+                operandos[:] = [_redondear(x, decimales) for x in operandos]
+        return True
+
+def redondear_pagina(reader: PdfReader, pagina, tolerancia: float = PDF_TOLERANCIA_PT):
+    """Redondea en su lugar las coordenadas de los trazos de la página y de sus formularios."""
+    redondeo = _Redondeo(reader)
+    if "/Contents" not in pagina:
+        return
+    contenido = ContentStream(pagina["/Contents"], reader)
+    redondeo.flujos[id(contenido)] = [None, contenido, 0.0]
+    redondeo.recorrer(contenido, id(contenido), pagina.get("/Resources"), IDENTIDAD)
+    for stream, cs, escala in redondeo.flujos.values():
+        if not redondeo.aplicar(cs, escala, tolerancia):
+            continue
+        datos = cs.get_data()
+        if stream is None:
+            pagina[NameObject("/Contents")] = comprimir_stream(DictionaryObject(), datos)
+        else:
+            # Se reemplaza el contenido del mismo objeto: quien lo referencia sigue apuntando a él
+            stream._data = zlib.compress(datos, NIVEL_ZLIB)
+            stream.decoded_self = None
+            stream[NameObject("/Filter")] = NameObject("/FlateDecode")
+            if "/DecodeParms" in stream:
+                del stream["/DecodeParms"]
+
+def optimizar_plantilla(raw: bytes, tolerancia: float = PDF_TOLERANCIA_PT) -> bytes:
+    """PDF de una página equivalente a la primera de `raw`, con trazos redondeados y streams recomprimidos."""
+    reader = PdfReader(io.BytesIO(raw))
+    pagina = reader.pages[0]
+    redondear_pagina(reader, pagina, tolerancia)
+    writer = EscritorCompacto(comprimir=True, objetos=True, recomprimir=True) if COMPACTO_DISPONIBLE else PdfWriter()
+    writer.add_page(pagina)
+    salida = io.BytesIO()
+    writer.write(salida)
+    return salida.getvalue()
+
+# --- Reporte ---
+def reporte(n: int = 3) -> List[dict]:
+    """Bytes por diploma sin optimizar, con cada control por separado y con todos."""
+    import datetime as dt
+    import generar_diplomas as gen
+    tareas = [gen.TareaDiploma(alumno_id=i, curso_id=1, profesor_id=None, alumno_nombre=f"Alumna de Prueba Número {i}",
+                               nombre_profesor="Coordinador de Aula", fecha_emision=dt.date(2025, 1, 15),
+                               folio=gen.folio_determinista(i, 1, dt.date(2025, 1, 15)))
+              for i in range(1, n + 1)]
+    variantes = [("ninguno", frozenset())] + [(c, frozenset([c])) for c in CONTROLES] + [("todos", frozenset(CONTROLES))]
+    filas = []
+    for tarea in tareas:
+        fila = {"folio": tarea.folio}
+        for nombre, controles in variantes:
+            fila[nombre] = len(gen.renderizar_diploma(tarea, controles=controles))
+        filas.append(fila)
+    return filas
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimización del tamaño de los diplomas")
+    parser.add_argument("--reporte", action="store_true", help="Bytes por diploma antes y después de cada control")
+    parser.add_argument("--n", type=int, default=3, help="Diplomas de prueba para el reporte")
+    parser.add_argument("--plantilla", help="Plantilla a optimizar (escribe una copia en --salida)")
+    parser.add_argument("--salida", help="Ruta de la copia optimizada de la plantilla")
+    parser.add_argument("--tolerancia", type=float, default=PDF_TOLERANCIA_PT, help="Error máximo en puntos al redondear trazos")
+    args = parser.parse_args()
+
+    if args.plantilla:
+        if not args.salida:
+            parser.error("--plantilla requiere --salida")
+        with open(args.plantilla, "rb") as f:
+            raw = f.read()
+        optimizada = optimizar_plantilla(raw, args.tolerancia)
+        with open(args.salida, "wb") as f:
+            f.write(optimizada)
+        print(f"{args.plantilla}: {len(raw)} -> {len(optimizada)} bytes ({100 * (1 - len(optimizada) / len(raw)):.1f}% menos)")
+    elif args.reporte:
+        filas = reporte(max(1, args.n))
+        columnas = ["ninguno", *CONTROLES, "todos"]
+        print(f"{'folio':<38}" + "".join(f"{c:>12}" for c in columnas) + f"{'ahorro':>9}")
+        for fila in filas:
+            ahorro = 100 * (1 - fila["todos"] / fila["ninguno"])
+            print(f"{fila['folio']:<38}" + "".join(f"{fila[c]:>12}" for c in columnas) + f"{ahorro:>8.1f}%")
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
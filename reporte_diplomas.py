@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Reporte de diplomas emitidos con el formato de links.csv
+(alumno, curso, escuela, folio, verificacion, pdf), en CSV o NDJSON.
+- Filtra por curso, escuela y rango de fecha de emisión.
+- Lee con un cursor sin búfer (fetchmany) y emite por bloques: la memoria no crece
+  con el tamaño del reporte.
+- Usa una conexión propia fuera del pool para no ocupar un hueco durante toda la descarga.
+
+    python reporte_diplomas.py --curso_id 3 > links.csv
+    python reporte_diplomas.py --escuela_id 2 --desde 2025-01-01 --formato ndjson --salida escuela2.ndjson
+"""
+import io
+import os
+import csv
+import sys
+import json
+import argparse
+import datetime as dt
+from typing import Iterator, Optional
+
+from dotenv import load_dotenv
+
+import db_pool
+
+load_dotenv()
+
+BASE_URL_VERIFICACION = (os.getenv("BASE_URL_VERIFICACION") or "").rstrip("/")
+COLUMNAS = ("alumno", "curso", "escuela", "folio", "verificacion", "pdf")
+FORMATOS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+# Filas por fetchmany y bytes aproximados por bloque emitido
+FILAS_POR_LECTURA = 1000
+BYTES_POR_BLOQUE = 64 * 1024
+
+SQL_REPORTE = """
+  SELECT a.nombre AS alumno, IFNULL(c.nombre, '—') AS curso, IFNULL(e.nombre, '—') AS escuela,
+         d.folio, d.pdf_url
+  FROM diploma d
+  JOIN alumno a ON a.alumno_id = d.alumno_id
+  LEFT JOIN curso c ON c.curso_id = d.curso_id
+  LEFT JOIN escuela e ON e.escuela_id = a.escuela_id
+"""
+
+def consulta_reporte(curso_id: Optional[int] = None, escuela_id: Optional[int] = None,
+                     desde: Optional[dt.date] = None, hasta: Optional[dt.date] = None,
+                     incluir_anulados: bool = False) -> tuple:
+    condiciones, params = [], []
+    if curso_id is not None:
+        condiciones.append("d.curso_id = %s"); params.append(curso_id)
+    if escuela_id is not None:
+        condiciones.append("a.escuela_id = %s"); params.append(escuela_id)
+    if desde is not None:
+        condiciones.append("d.fecha_emision >= %s"); params.append(desde)
+    if hasta is not None:
+        condiciones.append("d.fecha_emision <= %s"); params.append(hasta)
+    if not incluir_anulados:
+        condiciones.append("d.estado = 'VALIDO'")
+    where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return SQL_REPORTE + where + " ORDER BY d.diploma_id", tuple(params)
+
+def fila_reporte(alumno: str, curso: str, escuela: str, folio: str, pdf_url: Optional[str]) -> tuple:
+    pdf = pdf_url if (pdf_url or "").startswith("http") else f"{BASE_URL_VERIFICACION}/pdf/{folio}"
+    return (alumno, curso, escuela, folio, f"{BASE_URL_VERIFICACION}/verificar/{folio}", pdf)
+
+def _bloques(filas: Iterator[tuple], formato: str) -> Iterator[bytes]:
+    buf = io.StringIO()
+    escritor = csv.writer(buf, lineterminator="\n")
+    if formato == "csv":
+        escritor.writerow(COLUMNAS)
+    for fila in filas:
+        if formato == "csv":
+            escritor.writerow(fila)
+        else:
+            buf.write(json.dumps(dict(zip(COLUMNAS, fila)), ensure_ascii=False))
+            buf.write("\n")
+        if buf.tell() >= BYTES_POR_BLOQUE:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def _generar(formato: str, filtros: dict) -> Iterator[bytes]:
+    conn = db_pool.connect_direct()
+    try:
+        cur = conn.cursor(buffered=False)
+        cur.execute(*consulta_reporte(**filtros))
+        yield b""  # la consulta ya corrió: los errores de BD salen antes de empezar a responder
+
+        def filas():
+            while True:
+                lote = cur.fetchmany(FILAS_POR_LECTURA)
+                if not lote:
+                    return
+                for row in lote:
+                    yield fila_reporte(*row)
+
+        yield from _bloques(filas(), formato)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass  # p. ej. el cliente cortó la descarga con filas sin leer
+
+def reporte(formato: str = "csv", **filtros) -> Iterator[bytes]:
+    """
+    Iterador de bytes del reporte. Conecta y ejecuta la consulta al llamarla, así que
+    lanza mysql.connector.Error aquí y no a mitad de la respuesta.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado '{formato}' (opciones: {', '.join(FORMATOS)})")
+    it = _generar(formato, filtros)
+    next(it)
+    return it
+
+def main():
+    parser = argparse.ArgumentParser(description="Reporte de diplomas emitidos (formato links.csv)")
+    parser.add_argument("--curso_id", type=int)
+    parser.add_argument("--escuela_id", type=int)
+    parser.add_argument("--desde", type=dt.date.fromisoformat, help="Fecha de emisión mínima YYYY-MM-DD")
+    parser.add_argument("--hasta", type=dt.date.fromisoformat, help="Fecha de emisión máxima YYYY-MM-DD")
+    parser.add_argument("--anulados", action="store_true", help="Incluye también los diplomas anulados")
+    parser.add_argument("--formato", choices=sorted(FORMATOS), default="csv")
+    parser.add_argument("--salida", help="Archivo de salida (por defecto, la salida estándar)")
+    args = parser.parse_args()
+
+    bloques = reporte(args.formato, curso_id=args.curso_id, escuela_id=args.escuela_id,
+                      desde=args.desde, hasta=args.hasta, incluir_anulados=args.anulados)
+    destino = open(args.salida, "wb") if args.salida else sys.stdout.buffer
+    try:
+        for bloque in bloques:
+            destino.write(bloque)
+    finally:
+        if args.salida:
+            destino.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Revisa el tiempo de importación de la API (lo que paga cada arranque en frío antes
+de que /healthz responda). Importa el módulo en un proceso nuevo con `-X importtime`
+y termina con código 1 si:
+- el mejor de --repeticiones intentos supera --presupuesto-ms, o
+- se importó algún módulo del stack de render (reportlab, PyPDF2, qrcode, PIL),
+  que solo debe cargarse al generar diplomas.
+
+    python revisar_arranque.py
+    python revisar_arranque.py --presupuesto-ms 1200 --top 15
+"""
+import os
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+PRESUPUESTO_MS = float(os.getenv("ARRANQUE_PRESUPUESTO_MS", "1500"))
+# Paquetes que la API no debe importar al arrancar
+PROHIBIDOS = ("reportlab", "PyPDF2", "qrcode", "PIL", "generar_diplomas")
+
+def medir(modulo: str) -> Tuple[float, Dict[str, float]]:
+    """Devuelve (ms totales de `import modulo`, ms acumulados por módulo importado)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{proc.stderr[-2000:]}")
+    acumulado: Dict[str, float] = {}
+    for linea in proc.stderr.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        _, cumulativo, nombre = linea[len("import time:"):].split("|")
+        try:
+            acumulado[nombre.strip()] = int(cumulativo) / 1000
+        except ValueError:
+            continue  # encabezado
+    if modulo not in acumulado:
+        raise RuntimeError(f"{modulo} no aparece en la salida de -X importtime")
+    return acumulado[modulo], acumulado
+
+def _raiz(nombre: str) -> str:
+    return nombre.split(".")[0]
+
+def prohibidos_importados(detalle: Dict[str, float]) -> List[str]:
+    """Paquetes de PROHIBIDOS entre los módulos importados."""
+    return sorted({_raiz(n) for n in detalle if _raiz(n) in PROHIBIDOS})
+
+def main():
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de importación de la API")
+    parser.add_argument("--modulo", default="api_verificacion")
+    parser.add_argument("--presupuesto-ms", type=float, default=PRESUPUESTO_MS)
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se toma el mejor intento (menos ruido)")
+    parser.add_argument("--top", type=int, default=10, help="Paquetes más lentos a mostrar")
+    args = parser.parse_args()
+
+    mediciones: List[Tuple[float, Dict[str, float]]] = [medir(args.modulo) for _ in range(max(1, args.repeticiones))]
+    total, detalle = min(mediciones, key=lambda m: m[0])
+
+    por_paquete: Dict[str, float] = {}
+    for nombre, ms in detalle.items():
+        raiz = _raiz(nombre)
+        por_paquete[raiz] = max(por_paquete.get(raiz, 0.0), ms)
+    por_paquete.pop(args.modulo, None)
+
+    print(f"import {args.modulo}: {total:.1f} ms (presupuesto {args.presupuesto_ms:.0f} ms)")
+    for raiz, ms in sorted(por_paquete.items(), key=lambda x: -x[1])[:args.top]:
+        print(f"  {raiz:<24} {ms:8.1f} ms")
+
+    fallos = []
+    prohibidos = prohibidos_importados(detalle)
+    if prohibidos:
+        fallos.append(f"la API importa el stack de render al arrancar: {', '.join(prohibidos)}")
+    if total > args.presupuesto_ms:
+        fallos.append(f"{total:.1f} ms supera el presupuesto de {args.presupuesto_ms:.0f} ms")
+    for f in fallos:
+        print(f"[FALLA] {f}")
+    return 1 if fallos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,18 @@
 # storage_supabase.py
 import os
 import uuid
+import hashlib
+import time
+import random
 import mimetypes
+import threading
+import contextvars
 import requests
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+
+import metricas
 
 # Carga .env automáticamente
 try:
@@ -22,6 +31,14 @@ STORAGE_BASE = f"{SUPABASE_URL}/storage/v1"
 OBJECT_URL = f"{STORAGE_BASE}/object"  # subir/bajar
 PUBLIC_BASE = f"{OBJECT_URL}/public"   # si el bucket es público, las URL públicas salen de aquí
 
+# Subidas concurrentes (ver SupabaseUploader)
+UPLOAD_CONCURRENCY = int(os.getenv("SUPABASE_UPLOAD_CONCURRENCY", "8"))
+UPLOAD_RETRIES = int(os.getenv("SUPABASE_UPLOAD_RETRIES", "3"))
+# Rutas por petición en el borrado múltiple (Storage acepta hasta 1000)
+DELETE_BATCH = int(os.getenv("SUPABASE_DELETE_BATCH", "1000"))
+
+SUBIDAS_OMITIDAS = metricas.Contador("supabase_subidas_omitidas_total", "Subidas omitidas porque el objeto ya existía idéntico")
+
 def _assert_env():
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         raise RuntimeError("Faltan variables SUPABASE_URL o SUPABASE_SERVICE_KEY en el .env")
@@ -63,36 +80,222 @@ def upload_pdf(local_path: str, dest_name: str | None = None, bucket: str | None
     # Llama a la nueva función para hacer el trabajo real
     return upload_pdf_from_bytes(data, dest_name or p.name, bucket, upsert)
 
-# ====================================================================
-# ESTA ES LA FUNCIÓN CLAVE QUE FALTABA
-# ====================================================================
+class SupabaseUploader:
+    """
+    Cliente de subida con sesión HTTP compartida (keep-alive), un número acotado
+    de subidas en vuelo y reintentos con backoff para errores 5xx y timeouts.
+
+    `subir()` devuelve un Future con la URL pública; `subir_sync()` espera el resultado.
+    `base_url` y `service_key` se pueden inyectar para probar contra un servidor local.
+    """
+    def __init__(self, max_concurrencia: int = UPLOAD_CONCURRENCY, reintentos: int = UPLOAD_RETRIES,
+                 backoff_base: float = 0.5, timeout: float = 60,
+                 base_url: str | None = None, service_key: str | None = None):
+        self.base_url = (base_url or SUPABASE_URL).rstrip("/")
+        self.service_key = service_key if service_key is not None else SUPABASE_SERVICE_KEY
+        self.reintentos = reintentos
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrencia)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrencia, thread_name_prefix="supabase-upload")
+        # Limita subidas encoladas + en vuelo para no acumular PDFs en memoria
+        self._cupos = threading.BoundedSemaphore(max_concurrencia * 2)
+
+    def _headers(self, extra: dict | None = None) -> dict:
+        if not self.base_url or not self.service_key:
+            raise RuntimeError("Faltan variables SUPABASE_URL o SUPABASE_SERVICE_KEY en el .env")
+        base = {"Authorization": f"Bearer {self.service_key}", "apikey": self.service_key}
+        if extra:
+            base.update(extra)
+        return base
+
+    def public_url(self, dest_name: str, bucket: str | None = None) -> str:
+        return f"{self.base_url}/storage/v1/object/public/{bucket or SUPABASE_BUCKET}/{dest_name}"
+
+    def _esperar(self, intento: int):
+        # Backoff exponencial con jitter completo
+        time.sleep(random.uniform(0, self.backoff_base * (2 ** intento)))
+
+    def _subir(self, data: bytes, dest_name: str, bucket: str, upsert: bool) -> str:
+        with metricas.medir_etapa("upload"):
+            return self._subir_con_reintentos(data, dest_name, bucket, upsert)
+
+    def _subir_con_reintentos(self, data: bytes, dest_name: str, bucket: str, upsert: bool) -> str:
+        url = f"{self.base_url}/storage/v1/object/{bucket}/{dest_name}"
+        headers = self._headers({
+            "Content-Type": "application/pdf",
+            "x-upsert": "true" if upsert else "false",
+        })
+        for intento in range(self.reintentos + 1):
+            try:
+                resp = self.session.post(url, headers=headers, data=data, timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError):
+                if intento >= self.reintentos:
+                    raise
+                self._esperar(intento)
+                continue
+            if resp.status_code in (200, 201, 204):
+                return self.public_url(dest_name, bucket)
+            if resp.status_code >= 500 and intento < self.reintentos:
+                self._esperar(intento)
+                continue
+            raise RuntimeError(f"Error al subir a Supabase: {resp.status_code} {resp.text}")
+        raise RuntimeError("Error al subir a Supabase: reintentos agotados")
+
+    def info_objeto(self, dest_name: str, bucket: str | None = None) -> dict | None:
+        """Metadatos del objeto (size, eTag, created_at...) o None si no existe."""
+        carpeta, _, nombre = dest_name.rpartition("/")
+        for obj in self.listar_objetos(prefix=carpeta, bucket=bucket, search=nombre):
+            if obj.get("name") == nombre:
+                return obj
+        return None
+
+    def listar_objetos(self, prefix: str = "", bucket: str | None = None, search: str | None = None,
+                       pagina: int = 1000):
+        """Itera los objetos de una carpeta del bucket (API /object/list, paginada)."""
+        url = f"{self.base_url}/storage/v1/object/list/{bucket or SUPABASE_BUCKET}"
+        offset = 0
+        while True:
+            cuerpo = {"prefix": prefix, "limit": pagina, "offset": offset,
+                      "sortBy": {"column": "name", "order": "asc"}}
+            if search:
+                cuerpo["search"] = search
+            resp = self.session.post(url, headers=self._headers(), json=cuerpo, timeout=self.timeout)
+            if resp.status_code != 200:
+                raise RuntimeError(f"Error al listar Supabase: {resp.status_code} {resp.text}")
+            objetos = resp.json()
+            for obj in objetos:
+                if obj.get("id"):  # las "carpetas" vienen sin id
+                    yield obj
+            if len(objetos) < pagina:
+                return
+            offset += pagina
+
+    def descargar(self, dest_name: str, bucket: str | None = None, tamano_bloque: int = 256 * 1024):
+        """
+        Itera el contenido del objeto por bloques, sin cargarlo completo en memoria.
+        La petición se hace al llamar; FileNotFoundError si el objeto no existe.
+        """
+        url = f"{self.base_url}/storage/v1/object/{bucket or SUPABASE_BUCKET}/{dest_name}"
+        resp = self.session.get(url, headers=self._headers(), timeout=self.timeout, stream=True)
+        if resp.status_code in (400, 404):
+            resp.close()
+            raise FileNotFoundError(dest_name)
+        if resp.status_code != 200:
+            resp.close()
+            raise RuntimeError(f"Error al descargar de Supabase: {resp.status_code} {resp.text}")
+
+        def bloques():
+            with resp:
+                yield from resp.iter_content(tamano_bloque)
+        return bloques()
+
+    def _eliminar_lote(self, nombres: list, bucket: str) -> int:
+        """Un DELETE /object/{bucket} con varias rutas; devuelve cuántas existían y se borraron."""
+        url = f"{self.base_url}/storage/v1/object/{bucket}"
+        for intento in range(self.reintentos + 1):
+            try:
+                resp = self.session.delete(url, headers=self._headers(), json={"prefixes": nombres}, timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError):
+                if intento >= self.reintentos:
+                    raise
+                self._esperar(intento)
+                continue
+            if resp.status_code == 200:
+                return len(resp.json())
+            if resp.status_code >= 500 and intento < self.reintentos:
+                self._esperar(intento)
+                continue
+            raise RuntimeError(f"Error al eliminar en Supabase: {resp.status_code} {resp.text}")
+        raise RuntimeError("Error al eliminar en Supabase: reintentos agotados")
+
+    def eliminar_varios(self, nombres, bucket: str | None = None, lote: int = DELETE_BATCH) -> int:
+        """
+        Elimina muchos objetos con el borrado múltiple de Storage: `lote` rutas por petición
+        y varias peticiones a la vez. Las rutas que no existen se ignoran.
+        Devuelve cuántos objetos se borraron.
+        """
+        self._headers()
+        nombres = list(dict.fromkeys(nombres))
+        lotes = [nombres[i:i + lote] for i in range(0, len(nombres), max(1, lote))]
+        futuros = [self._executor.submit(self._eliminar_lote, l, bucket or SUPABASE_BUCKET) for l in lotes]
+        return sum(f.result() for f in futuros)
+
+    def _subir_si_cambia(self, data: bytes, dest_name: str, bucket: str, upsert: bool) -> str:
+        """
+        Omite la subida si ya existe un objeto con el mismo contenido. Supabase no expone
+        el sha256, así que se compara el eTag (MD5 de los mismos bytes) y el tamaño.
+        """
+        try:
+            info = self.info_objeto(dest_name, bucket)
+        except (requests.RequestException, RuntimeError):
+            info = None
+        meta = (info or {}).get("metadata") or {}
+        if (meta.get("eTag", "").strip('"') == hashlib.md5(data).hexdigest()
+                and int(meta.get("size") or -1) == len(data)):
+            SUBIDAS_OMITIDAS.inc()
+            return self.public_url(dest_name, bucket)
+        return self._subir(data, dest_name, bucket, upsert)
+
+    def _encolar(self, fn, data: bytes, dest_name: str | None, bucket: str | None, upsert: bool) -> Future:
+        self._headers()
+        dest_name = dest_name or f"{uuid.uuid4()}.pdf"
+        self._cupos.acquire()
+        try:
+            # El contexto viaja al hilo para que la subida cuente en la corrida actual (metricas)
+            ctx = contextvars.copy_context()
+            fut = self._executor.submit(ctx.run, fn, data, dest_name, bucket or SUPABASE_BUCKET, upsert)
+        except Exception:
+            self._cupos.release()
+            raise
+        fut.add_done_callback(lambda _: self._cupos.release())
+        return fut
+
+    def subir(self, data: bytes, dest_name: str | None = None, bucket: str | None = None, upsert: bool = True) -> Future:
+        """Encola la subida y devuelve un Future. Bloquea si ya hay demasiadas pendientes."""
+        return self._encolar(self._subir, data, dest_name, bucket, upsert)
+
+    def subir_si_cambia(self, data: bytes, dest_name: str | None = None, bucket: str | None = None, upsert: bool = True) -> Future:
+        """Como `subir()`, pero no vuelve a subir un objeto idéntico que ya está en el bucket."""
+        return self._encolar(self._subir_si_cambia, data, dest_name, bucket, upsert)
+
+    def subir_sync(self, data: bytes, dest_name: str | None = None, bucket: str | None = None, upsert: bool = True) -> str:
+        return self.subir(data, dest_name, bucket, upsert).result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_uploader: SupabaseUploader | None = None
+_uploader_pid: int | None = None
+_uploader_lock = threading.Lock()
+
+def get_uploader() -> SupabaseUploader:
+    """Uploader compartido por el proceso (se crea al primer uso y tras un fork)."""
+    global _uploader, _uploader_pid
+    with _uploader_lock:
+        if _uploader is None or _uploader_pid != os.getpid():
+            _uploader = SupabaseUploader()
+            _uploader_pid = os.getpid()
+        return _uploader
+
 def upload_pdf_from_bytes(data: bytes, dest_name: str, bucket: str | None = None, upsert: bool = True) -> str:
     """
     Sube los bytes de un PDF a Supabase Storage y devuelve la URL pública.
     Esta función es para subidas desde memoria, sin archivos locales.
+    Usa el uploader compartido (keep-alive y reintentos).
     """
-    bucket = bucket or SUPABASE_BUCKET
     _assert_env()
-
-    if not dest_name:
-        dest_name = f"{uuid.uuid4()}.pdf"
-
-    # POST/PUT a /object/{bucket}/{dest_name}
-    url = f"{OBJECT_URL}/{bucket}/{dest_name}"
-    headers = _auth_headers({
-        "Content-Type": "application/pdf",
-        "x-upsert": "true" if upsert else "false",
-    })
-    resp = requests.post(url, headers=headers, data=data, timeout=60)
-
-    # Respuestas válidas: 200/201/204
-    if resp.status_code not in (200, 201, 204):
-        raise RuntimeError(f"Error al subir a Supabase: {resp.status_code} {resp.text}")
-
-    # Construimos URL pública (asumiendo bucket público)
-    public_url = f"{PUBLIC_BASE}/{bucket}/{dest_name}"
-    return public_url
-# ====================================================================
+    return get_uploader().subir_sync(data, dest_name or f"{uuid.uuid4()}.pdf", bucket, upsert)
 
 def delete_object(path: str, bucket: str | None = None) -> bool:
     """
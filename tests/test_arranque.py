@@ -0,0 +1,17 @@
+"""La API arranca sin el stack de render; el presupuesto en ms lo revisa revisar_arranque.py."""
+import os
+
+import pytest
+
+import revisar_arranque
+
+def test_api_no_importa_el_stack_de_render():
+    _, detalle = revisar_arranque.medir("api_verificacion")
+    assert revisar_arranque.prohibidos_importados(detalle) == []
+
+# Depende del reloj y de la carga de la máquina: solo si se pide (ARRANQUE_PROBAR_PRESUPUESTO=1)
+@pytest.mark.skipif(os.getenv("ARRANQUE_PROBAR_PRESUPUESTO") != "1", reason="medición de tiempo opcional")
+def test_api_dentro_del_presupuesto():
+    # El mejor de tres, como revisar_arranque.py, para no depender del ruido de una sola medición
+    total = min(revisar_arranque.medir("api_verificacion")[0] for _ in range(3))
+    assert total <= revisar_arranque.PRESUPUESTO_MS
@@ -0,0 +1,116 @@
+"""Corridas por curso en bloques: punto de control, reanudación y lista de reintentos (BD SQLite del benchmark)."""
+import datetime as dt
+
+import pytest
+
+import almacenamiento
+import benchmark_diplomas
+import estadisticas
+import generar_diplomas as gen
+
+FECHA = dt.date(2025, 1, 15)
+
+@pytest.fixture
+def bd(monkeypatch, tmp_path):
+    conn = benchmark_diplomas.crear_bd([30])
+    monkeypatch.setattr(gen, "conectar_db", lambda: conn)
+    # Las tablas se crean una vez por proceso; cada prueba tiene una BD nueva
+    monkeypatch.setattr(gen, "_tablas_corrida_listas", False)
+    monkeypatch.setattr(estadisticas, "_tablas_listas", False)
+    backend = almacenamiento.AlmacenamientoLocal(str(tmp_path))
+    monkeypatch.setattr(gen, "get_almacenamiento", lambda: backend)
+    leer = gen.leer_punto_control
+
+    def leer_con_fecha(cur, curso_id):
+        # SQLite devuelve DATE como texto; MySQL, como date
+        punto = leer(cur, curso_id)
+        if punto and isinstance(punto["fecha_emision"], str):
+            punto["fecha_emision"] = dt.date.fromisoformat(punto["fecha_emision"])
+        return punto
+    monkeypatch.setattr(gen, "leer_punto_control", leer_con_fecha)
+    return conn
+
+def consultar(conn, sql: str, *params):
+    return conn._conn.execute(sql, params).fetchall()
+
+def punto_control(conn):
+    return consultar(conn, "SELECT estado, ultimo_alumno_id, hechos FROM corrida_curso WHERE curso_id = 1")[0]
+
+def cancelar_tras(n: int) -> dict:
+    """progreso/cancelado que cancelan la corrida al llegar a `n` diplomas."""
+    hechos = {"n": 0}
+
+    def progreso(h, total):
+        hechos["n"] = h
+    return {"progreso": progreso, "cancelado": lambda: hechos["n"] >= n}
+
+@pytest.fixture
+def fallan(monkeypatch):
+    """Alumnos cuyo render falla."""
+    ids = set()
+    renderizar = gen.renderizar_diploma
+
+    def render(tarea, *args, **kwargs):
+        if tarea.alumno_id in ids:
+            raise RuntimeError("falla simulada")
+        return renderizar(tarea, *args, **kwargs)
+    monkeypatch.setattr(gen, "renderizar_diploma", render)
+    return ids
+
+def test_fallidos_pasan_a_reintento(bd, fallan):
+    fallan.update({7, 23})
+    resumen = gen.generar_diplomas_para_curso(1, FECHA, commit_chunk=10)
+    assert (resumen["resultado"], resumen["hechos"], resumen["fallidos"]) == ("parcial", 30, 2)
+    assert consultar(bd, "SELECT COUNT(*) FROM diploma") == [(28,)]
+    assert consultar(bd, "SELECT alumno_id FROM reintento_diploma ORDER BY alumno_id") == [(7,), (23,)]
+    assert punto_control(bd) == ("COMPLETADA", 30, 28)
+
+    fallan.clear()
+    resumen = gen.generar_diplomas_para_curso(1, FECHA, reintentar=True)
+    assert (resumen["resultado"], resumen["total"], resumen["fallidos"]) == ("ok", 2, 0)
+    assert consultar(bd, "SELECT COUNT(*) FROM diploma") == [(30,)]
+    assert consultar(bd, "SELECT COUNT(*) FROM reintento_diploma") == [(0,)]
+
+def test_corrida_interrumpida_se_reanuda(bd):
+    with pytest.raises(gen.GeneracionCancelada):
+        gen.generar_diplomas_para_curso(1, FECHA, commit_chunk=10, **cancelar_tras(15))
+    # Solo se deshace el bloque en curso
+    assert consultar(bd, "SELECT COUNT(*) FROM diploma") == [(10,)]
+    estado, ultimo, confirmados = punto_control(bd)
+    assert estado != "COMPLETADA" and (ultimo, confirmados) == (10, 10)
+
+    resumen = gen.generar_diplomas_para_curso(1, FECHA, commit_chunk=10)
+    assert (resumen["resultado"], resumen["total"]) == ("ok", 20)
+    assert consultar(bd, "SELECT COUNT(*) FROM diploma") == [(30,)]
+    assert punto_control(bd) == ("COMPLETADA", 30, 30)
+
+def test_otra_fecha_no_reanuda(bd):
+    with pytest.raises(gen.GeneracionCancelada):
+        gen.generar_diplomas_para_curso(1, FECHA, commit_chunk=10, **cancelar_tras(15))
+    gen.generar_diplomas_para_curso(1, FECHA + dt.timedelta(days=1), commit_chunk=10)
+    # Corrida nueva: no suma los 10 de la interrumpida (esos alumnos ya tienen diploma y se omiten)
+    assert punto_control(bd) == ("COMPLETADA", 30, 20)
+    assert consultar(bd, "SELECT COUNT(*) FROM diploma") == [(30,)]
+
+def test_sin_bloques_todo_o_nada(bd):
+    with pytest.raises(gen.GeneracionCancelada):
+        gen.generar_diplomas_para_curso(1, FECHA, commit_chunk=0, **cancelar_tras(15))
+    assert consultar(bd, "SELECT COUNT(*) FROM diploma") == [(0,)]
+
+def test_dos_corridas_del_mismo_curso_no_insertan_ambas(bd):
+    choques = []
+
+    def progreso(hechos, total):
+        # Una segunda corrida (p. ej. el cron) arranca mientras la primera va a la mitad
+        if hechos == 15 and not choques:
+            with pytest.raises(gen.CursoOcupado) as e:
+                gen.generar_diplomas_para_curso(1, FECHA, commit_chunk=10)
+            choques.append(e.value)
+    resumen = gen.generar_diplomas_para_curso(1, FECHA, commit_chunk=10, progreso=progreso)
+    assert choques and resumen["hechos"] == 30
+    assert consultar(bd, "SELECT COUNT(*), COUNT(DISTINCT alumno_id) FROM diploma") == [(30, 30)]
+    assert punto_control(bd) == ("COMPLETADA", 30, 30)
+
+    # Al terminar se suelta el candado
+    resumen = gen.generar_diplomas_para_curso(1, FECHA)
+    assert (resumen["resultado"], resumen["total"]) == ("ok", 0)
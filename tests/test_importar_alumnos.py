@@ -0,0 +1,40 @@
+"""Importación de alumnos por bloques con la BD SQLite del benchmark."""
+import io
+
+import pytest
+
+import benchmark_diplomas
+import estadisticas
+import importar_alumnos
+
+ENCABEZADO = "nombre,curp,escuela_id,grado_id,profesor_id\n"
+
+def fila(i: int) -> str:
+    return f"Alumno {i},CURP{i:014d},1,,\n"
+
+@pytest.fixture
+def bd(monkeypatch):
+    monkeypatch.setattr(estadisticas, "_tablas_listas", False)
+    return benchmark_diplomas.crear_bd([])
+
+def alumnos(conn) -> int:
+    return conn._conn.execute("SELECT COUNT(*) FROM alumno").fetchone()[0]
+
+def test_importa_por_bloques(bd):
+    csv = ENCABEZADO + "".join(fila(i) for i in range(25)) + "Sin CURP,,1,,\n"
+    resultado = importar_alumnos.importar_csv(io.BytesIO(csv.encode()), bd, chunk=10)
+    assert (resultado.filas, resultado.nuevos, resultado.actualizados) == (26, 25, 0)
+    assert resultado.errores == ["Error en fila 27: CURP inválida ''"]
+    assert resultado.error_codificacion is None and len(resultado.progreso) == 3
+    assert alumnos(bd) == 25
+
+def test_byte_invalido_a_la_mitad_conserva_lo_importado(bd):
+    # El decodificador lee por bloques de 8 KiB: el byte inválido queda muy después del primer bloque de filas
+    buenas = "".join(fila(i) for i in range(400))
+    binario = io.BytesIO(ENCABEZADO.encode() + buenas.encode() + b"Alumno \xff,CURP99999999999999,1,,\n" + fila(401).encode())
+    resultado = importar_alumnos.importar_csv(binario, bd, chunk=100)
+    assert resultado.error_codificacion and "no está codificado en UTF-8" in resultado.error_codificacion
+    assert f"después de la fila {resultado.filas + 1}" in resultado.error_codificacion
+    assert 100 <= resultado.filas <= 400
+    assert resultado.nuevos == resultado.filas == alumnos(bd)
+    assert binario.closed is False
@@ -0,0 +1,69 @@
+"""Los PDFs escritos con los controles de optimizar_pdf se vuelven a leer con PdfReader sin perder nada."""
+import io
+import datetime as dt
+
+import pytest
+from PyPDF2 import PdfReader
+
+import optimizar_pdf
+import generar_diplomas as gen
+
+FECHA = dt.date(2025, 1, 15)
+VARIANTES = [frozenset()] + [frozenset([c]) for c in optimizar_pdf.CONTROLES] + [frozenset(optimizar_pdf.CONTROLES)]
+
+def tarea(i: int) -> gen.TareaDiploma:
+    return gen.TareaDiploma(alumno_id=i, curso_id=1, profesor_id=None, alumno_nombre=f"Alumna de Prueba {i}",
+                            nombre_profesor="Coordinador de Aula", fecha_emision=FECHA,
+                            folio=gen.folio_determinista(i, 1, FECHA))
+
+def leer(pdf: bytes) -> PdfReader:
+    return PdfReader(io.BytesIO(pdf), strict=True)
+
+def recursos_validos(pagina):
+    """Fuentes y XObjects de la página resuelven a objetos del tipo esperado."""
+    recursos = pagina["/Resources"].get_object()
+    for fuente in recursos["/Font"].get_object().values():
+        assert fuente.get_object()["/Type"] == "/Font"
+    for xobj in recursos.get("/XObject", {}).values():
+        assert xobj.get_object()["/Subtype"] in ("/Form", "/Image")
+
+@pytest.fixture(scope="module")
+def sin_optimizar():
+    return leer(gen.renderizar_diploma(tarea(1), controles=frozenset()))
+
+@pytest.mark.parametrize("controles", VARIANTES, ids=lambda c: ",".join(sorted(c)) or "ninguno")
+def test_diploma_ida_y_vuelta(controles, sin_optimizar):
+    pdf = gen.renderizar_diploma(tarea(1), controles=controles)
+    reader = leer(pdf)
+    assert len(reader.pages) == 1
+    pagina = reader.pages[0]
+    texto = pagina.extract_text()
+    assert "Alumna de Prueba 1" in texto
+    assert tarea(1).folio in texto
+    assert texto == sin_optimizar.pages[0].extract_text()
+    assert pagina.mediabox == sin_optimizar.pages[0].mediabox
+    recursos_validos(pagina)
+
+def test_optimizado_es_mas_chico(sin_optimizar):
+    sin = gen.renderizar_diploma(tarea(1), controles=frozenset())
+    con = gen.renderizar_diploma(tarea(1), controles=frozenset(optimizar_pdf.CONTROLES))
+    assert len(con) < len(sin)
+
+def test_plantilla_optimizada_conserva_el_texto():
+    plantilla = gen.PLANTILLAS.obtener(gen.PLANTILLA_PDF, optimizada=False)
+    original = leer(plantilla.raw).pages[0]
+    optimizada = leer(optimizar_pdf.optimizar_plantilla(plantilla.raw)).pages[0]
+    assert optimizada.extract_text() == original.extract_text()
+    assert optimizada.mediabox == original.mediabox
+
+@pytest.mark.parametrize("controles", [frozenset(), frozenset(optimizar_pdf.CONTROLES)], ids=["ninguno", "todos"])
+def test_pdf_curso_ida_y_vuelta(controles):
+    tareas = [tarea(i) for i in range(1, 4)]
+    buf = io.BytesIO()
+    assert gen.escribir_pdf_curso(tareas, buf, controles=controles) == 3
+    reader = leer(buf.getvalue())
+    assert len(reader.pages) == 3
+    for t, pagina in zip(tareas, reader.pages):
+        texto = pagina.extract_text()
+        assert t.alumno_nombre in texto and t.folio in texto
+        recursos_validos(pagina)
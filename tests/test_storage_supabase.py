@@ -0,0 +1,127 @@
+"""SupabaseUploader contra un Storage falso en http.server: reintentos, subida omitida y borrado por lotes."""
+import json
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import storage_supabase
+
+PREFIJO = "/storage/v1/object/"
+
+class StorageFalso:
+    """Objetos en memoria y registro de peticiones; `fallas` = respuestas 503 antes de aceptar una subida."""
+    def __init__(self):
+        self.objetos = {}
+        self.subidas = []
+        self.borrados = []
+        self.fallas = 0
+        self.estado_error = 503
+        self.lock = threading.Lock()
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, codigo: int, cuerpo):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _cuerpo(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        storage: StorageFalso = self.server.storage
+        datos = self._cuerpo()
+        ruta = self.path[len(PREFIJO):]
+        if ruta.startswith("list/"):
+            pedido = json.loads(datos)
+            nombre = pedido.get("search", "")
+            with storage.lock:
+                encontrados = [
+                    {"id": n, "name": n, "metadata": {"eTag": f'"{hashlib.md5(d).hexdigest()}"', "size": len(d)}}
+                    for n, d in storage.objetos.items() if n == nombre
+                ]
+            return self._responder(200, encontrados)
+        with storage.lock:
+            storage.subidas.append(ruta)
+            if storage.fallas > 0:
+                storage.fallas -= 1
+                return self._responder(storage.estado_error, {"error": "falla simulada"})
+            storage.objetos[ruta.split("/", 1)[1]] = datos
+        self._responder(200, {"Key": ruta})
+
+    def do_DELETE(self):
+        storage: StorageFalso = self.server.storage
+        nombres = json.loads(self._cuerpo())["prefixes"]
+        with storage.lock:
+            storage.borrados.append(len(nombres))
+            borrados = [n for n in nombres if storage.objetos.pop(n, None) is not None]
+        self._responder(200, [{"name": n} for n in borrados])
+
+@pytest.fixture
+def storage():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Manejador)
+    srv.storage = StorageFalso()
+    hilo = threading.Thread(target=srv.serve_forever, daemon=True)
+    hilo.start()
+    srv.storage.url = f"http://127.0.0.1:{srv.server_address[1]}"
+    yield srv.storage
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.fixture
+def uploader(storage):
+    with storage_supabase.SupabaseUploader(max_concurrencia=4, reintentos=3, backoff_base=0.0, timeout=5,
+                                           base_url=storage.url, service_key="clave-de-prueba") as up:
+        yield up
+
+def test_reintenta_tras_503(storage, uploader):
+    storage.fallas = 2
+    url = uploader.subir_sync(b"%PDF-1", "DIPLOMA_1.pdf", bucket="diplomas")
+    assert url == f"{storage.url}/storage/v1/object/public/diplomas/DIPLOMA_1.pdf"
+    assert storage.subidas == ["diplomas/DIPLOMA_1.pdf"] * 3
+    assert storage.objetos["DIPLOMA_1.pdf"] == b"%PDF-1"
+
+def test_reintentos_agotados(storage, uploader):
+    storage.fallas = 10
+    with pytest.raises(RuntimeError, match="503"):
+        uploader.subir_sync(b"%PDF-1", "DIPLOMA_1.pdf", bucket="diplomas")
+    assert len(storage.subidas) == uploader.reintentos + 1
+
+def test_error_4xx_no_se_reintenta(storage, uploader):
+    storage.fallas, storage.estado_error = 1, 400
+    with pytest.raises(RuntimeError, match="400"):
+        uploader.subir_sync(b"%PDF-1", "DIPLOMA_1.pdf", bucket="diplomas")
+    assert len(storage.subidas) == 1
+
+def test_subidas_concurrentes(storage, uploader):
+    futuros = [uploader.subir(f"%PDF-{i}".encode(), f"DIPLOMA_{i}.pdf", bucket="diplomas") for i in range(20)]
+    assert [f.result() for f in futuros] == [uploader.public_url(f"DIPLOMA_{i}.pdf", "diplomas") for i in range(20)]
+    assert len(storage.objetos) == 20
+
+def test_subir_si_cambia_omite_objeto_identico(storage, uploader):
+    uploader.subir_sync(b"%PDF-igual", "DIPLOMA_1.pdf", bucket="diplomas")
+    url = uploader.subir_si_cambia(b"%PDF-igual", "DIPLOMA_1.pdf", bucket="diplomas").result()
+    assert url == uploader.public_url("DIPLOMA_1.pdf", "diplomas")
+    assert len(storage.subidas) == 1
+
+    uploader.subir_si_cambia(b"%PDF-distinto", "DIPLOMA_1.pdf", bucket="diplomas").result()
+    assert len(storage.subidas) == 2
+    assert storage.objetos["DIPLOMA_1.pdf"] == b"%PDF-distinto"
+
+def test_eliminar_varios_por_lotes(storage, uploader):
+    for i in range(5):
+        storage.objetos[f"DIPLOMA_{i}.pdf"] = b"%PDF"
+    nombres = [f"DIPLOMA_{i}.pdf" for i in range(2500)] + ["DIPLOMA_1.pdf"]
+    assert uploader.eliminar_varios(nombres, bucket="diplomas", lote=1000) == 5
+    # Los repetidos se quitan antes de partir en lotes
+    assert sorted(storage.borrados) == [500, 1000, 1000]
+    assert storage.objetos == {}
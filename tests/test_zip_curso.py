@@ -0,0 +1,43 @@
+"""ZIP de un curso: un PDF que no se puede obtener va a FALTANTES.txt sin cortar el archivo."""
+import io
+import datetime as dt
+import zipfile
+
+import pytest
+
+import almacenamiento
+import zip_curso
+
+class AlmacenamientoFalso:
+    """`leer` de un objeto que se corta a la mitad lanza OSError tras el primer bloque."""
+    def __init__(self, objetos, cortados=()):
+        self.objetos = objetos
+        self.cortados = set(cortados)
+
+    def leer(self, nombre):
+        if nombre not in self.objetos:
+            raise FileNotFoundError(nombre)
+        datos = self.objetos[nombre]
+        yield datos[:10]
+        if nombre in self.cortados:
+            raise OSError("conexión reiniciada")
+        yield datos[10:]
+
+def diploma(folio: str, alumno: str) -> dict:
+    return {"folio": folio, "fecha_emision": dt.date(2025, 1, 15), "pdf_path": f"DIPLOMA_{folio}.pdf",
+            "hash_sha256": "x", "alumno": alumno}
+
+@pytest.fixture
+def storage(monkeypatch):
+    falso = AlmacenamientoFalso({f"DIPLOMA_{f}.pdf": f"%PDF-1.4 diploma {f}".encode() * 50 for f in ("A", "B", "C")},
+                                cortados={"DIPLOMA_B.pdf"})
+    monkeypatch.setattr(almacenamiento, "get_almacenamiento", lambda: falso)
+    return falso
+
+def test_fallo_de_descarga_va_a_faltantes(storage):
+    diplomas = [diploma("A", "Ana"), diploma("B", "Beto"), diploma("C", "Carla"), diploma("D", "Dora")]
+    zf = zipfile.ZipFile(io.BytesIO(b"".join(zip_curso.zip_diplomas(diplomas))))
+    assert zf.testzip() is None
+    assert zf.namelist() == ["Ana_A.pdf", "Carla_C.pdf", "FALTANTES.txt"]
+    assert zf.read("Carla_C.pdf") == storage.objetos["DIPLOMA_C.pdf"]
+    assert zf.read("FALTANTES.txt").decode().splitlines()[1:] == ["B", "D"]
@@ -0,0 +1,177 @@
+# trabajos.py
+"""
+Cola persistente de trabajos de generación de diplomas (tabla `trabajo_generacion`).
+- La API solo encola (`crear_trabajo`) y consulta el estado.
+- worker_diplomas.py reclama los trabajos pendientes y reporta el progreso.
+- Un trabajo EN_PROCESO sin latido reciente (worker reiniciado) vuelve a PENDIENTE.
+"""
+import os
+import socket
+import datetime as dt
+from typing import Optional
+
+import db_pool
+
+ESTADOS_FINALES = ("COMPLETADO", "FALLIDO", "CANCELADO")
+# Segundos sin latido tras los que un trabajo EN_PROCESO se considera abandonado
+TRABAJO_TIMEOUT = int(os.getenv("TRABAJO_TIMEOUT", "600"))
+
+SQL_TABLA = """
+CREATE TABLE IF NOT EXISTS trabajo_generacion (
+  trabajo_id BIGINT NOT NULL AUTO_INCREMENT,
+  curso_id INT NOT NULL,
+  fecha_emision DATE NULL,
+  estado ENUM('PENDIENTE','EN_PROCESO','COMPLETADO','FALLIDO','CANCELADO') NOT NULL DEFAULT 'PENDIENTE',
+  total INT NOT NULL DEFAULT 0,
+  hechos INT NOT NULL DEFAULT 0,
+  fallidos INT NOT NULL DEFAULT 0,
+  cancelar TINYINT(1) NOT NULL DEFAULT 0,
+  worker VARCHAR(120) NULL,
+  error TEXT NULL,
+  creado DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  iniciado DATETIME NULL,
+  terminado DATETIME NULL,
+  latido DATETIME NULL,
+  PRIMARY KEY (trabajo_id),
+  KEY idx_trabajo_estado (estado, trabajo_id)
+)
+"""
+
+_tabla_lista = False
+
+def asegurar_tabla(conn):
+    global _tabla_lista
+    if _tabla_lista:
+        return
+    cur = conn.cursor()
+    cur.execute(SQL_TABLA)
+    cur.close()
+    conn.commit()
+    _tabla_lista = True
+
+def nombre_worker() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def crear_trabajo(conn, curso_id: int, fecha_emision: Optional[dt.date] = None) -> int:
+    asegurar_tabla(conn)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO trabajo_generacion (curso_id, fecha_emision) VALUES (%s, %s)", (curso_id, fecha_emision))
+    trabajo_id = cur.lastrowid
+    cur.close()
+    conn.commit()
+    return trabajo_id
+
+def obtener_trabajo(conn, trabajo_id: int) -> Optional[dict]:
+    asegurar_tabla(conn)
+    cur = conn.cursor(dictionary=True)
+    cur.execute("SELECT *, TIMESTAMPDIFF(SECOND, iniciado, COALESCE(terminado, NOW())) AS segundos "
+                "FROM trabajo_generacion WHERE trabajo_id=%s", (trabajo_id,))
+    row = cur.fetchone()
+    cur.close()
+    return row
+
+def resumen_trabajo(row: dict) -> dict:
+    """Forma pública del trabajo para GET /admin/jobs/{id}."""
+    segundos = row.get("segundos") or 0
+    return {
+        "id": row["trabajo_id"],
+        "curso_id": row["curso_id"],
+        "estado": row["estado"],
+        "done": row["hechos"],
+        "total": row["total"],
+        "failed": row["fallidos"],
+        "throughput": round(row["hechos"] / segundos, 2) if segundos else 0.0,
+        "cancel_requested": bool(row["cancelar"]),
+        "error": row["error"],
+        "creado": row["creado"].isoformat() if row["creado"] else None,
+        "iniciado": row["iniciado"].isoformat() if row["iniciado"] else None,
+        "terminado": row["terminado"].isoformat() if row["terminado"] else None,
+    }
+
+def solicitar_cancelacion(conn, trabajo_id: int) -> bool:
+    """Marca el trabajo para cancelar. Si aún está PENDIENTE, se cancela de inmediato."""
+    asegurar_tabla(conn)
+    cur = conn.cursor()
+    cur.execute("UPDATE trabajo_generacion SET estado='CANCELADO', cancelar=1, terminado=NOW() "
+                "WHERE trabajo_id=%s AND estado='PENDIENTE'", (trabajo_id,))
+    cambiados = cur.rowcount
+    cur.execute("UPDATE trabajo_generacion SET cancelar=1 WHERE trabajo_id=%s AND estado='EN_PROCESO'", (trabajo_id,))
+    cambiados += cur.rowcount
+    cur.close()
+    conn.commit()
+    return cambiados > 0
+
+def cancelacion_solicitada(conn, trabajo_id: int) -> bool:
+    cur = conn.cursor()
+    cur.execute("SELECT cancelar FROM trabajo_generacion WHERE trabajo_id=%s", (trabajo_id,))
+    row = cur.fetchone()
+    cur.close()
+    conn.commit()  # cierra el snapshot para ver la próxima actualización
+    return bool(row and row[0])
+
+def recuperar_abandonados(conn) -> int:
+    """Devuelve a PENDIENTE los trabajos cuyo worker dejó de dar latidos."""
+    cur = conn.cursor()
+    cur.execute("UPDATE trabajo_generacion SET estado='PENDIENTE', worker=NULL "
+                "WHERE estado='EN_PROCESO' AND latido < NOW() - INTERVAL %s SECOND", (TRABAJO_TIMEOUT,))
+    n = cur.rowcount
+    cur.close()
+    conn.commit()
+    return n
+
+def latir(conn, trabajo_ids) -> None:
+    """Renueva el latido de los trabajos EN_PROCESO de este worker aunque no avancen."""
+    ids = list(trabajo_ids)
+    if not ids:
+        return
+    cur = conn.cursor()
+    cur.execute(f"UPDATE trabajo_generacion SET latido=NOW() WHERE estado='EN_PROCESO' "
+                f"AND trabajo_id IN ({', '.join(['%s'] * len(ids))})", tuple(ids))
+    cur.close()
+    conn.commit()
+
+def reclamar_siguiente(conn, worker: str) -> Optional[dict]:
+    """
+    Toma el trabajo pendiente más antiguo sin bloquear a otros workers (SKIP LOCKED).
+    Se saltan los cursos que ya tienen un trabajo EN_PROCESO: dos corridas del mismo curso
+    a la vez duplicarían diplomas (además lo impide el candado de generar_diplomas_para_curso).
+    """
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("SELECT trabajo_id, curso_id, fecha_emision FROM trabajo_generacion "
+                    "WHERE estado='PENDIENTE' AND curso_id NOT IN "
+                    "(SELECT curso_id FROM trabajo_generacion WHERE estado='EN_PROCESO') "
+                    "ORDER BY trabajo_id LIMIT 1 FOR UPDATE SKIP LOCKED")
+        row = cur.fetchone()
+        if not row:
+            conn.commit()
+            return None
+        cur.execute("UPDATE trabajo_generacion SET estado='EN_PROCESO', worker=%s, iniciado=NOW(), latido=NOW(), "
+                    "hechos=0, fallidos=0, error=NULL WHERE trabajo_id=%s", (worker, row["trabajo_id"]))
+        conn.commit()
+        return row
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def actualizar_progreso(conn, trabajo_id: int, hechos: int, total: int, fallidos: int = 0):
+    cur = conn.cursor()
+    cur.execute("UPDATE trabajo_generacion SET hechos=%s, total=%s, fallidos=%s, latido=NOW() WHERE trabajo_id=%s",
+                (hechos, total, fallidos, trabajo_id))
+    cur.close()
+    conn.commit()
+
+def finalizar(conn, trabajo_id: int, estado: str, error: Optional[str] = None):
+    assert estado in ESTADOS_FINALES
+    cur = conn.cursor()
+    cur.execute("UPDATE trabajo_generacion SET estado=%s, error=%s, terminado=NOW(), latido=NOW() WHERE trabajo_id=%s",
+                (estado, error, trabajo_id))
+    cur.close()
+    conn.commit()
+
+def nueva_conexion():
+    conn = db_pool.get_connection()
+    conn.autocommit = False
+    return conn
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Verificación de autenticidad por archivo: el SHA-256 del PDF debe coincidir con
+`diploma.hash_sha256` (índice idx_diploma_hash, ver migracion_hash.sql).
+- El hash se calcula por bloques, sin cargar el archivo completo en memoria. En la API
+  se calcula mientras llega el cuerpo de la solicitud (HashCuerpo): nada se guarda en
+  disco y un archivo que supera el límite se corta en cuanto lo cruza.
+- La API lo usa en POST /api/verificar-pdf; desde la terminal revisa carpetas enteras
+  hasheando varios archivos en paralelo:
+
+    python verificar_pdf.py descargas/ otro.pdf --workers 8
+"""
+import io
+import os
+import sys
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+import db_pool
+
+TAMANO_BLOQUE = 1024 * 1024
+# Hashes por consulta IN
+LOTE_CONSULTA = 500
+# Bytes del cuerpo multipart que no son el archivo (límites, cabeceras, otros campos)
+MARGEN_MULTIPART = 64 * 1024
+
+SQL_POR_HASH = """
+  SELECT d.hash_sha256, d.folio, d.estado, d.fecha_emision, a.nombre AS alumno,
+         IFNULL(c.nombre, '—') AS curso, e.nombre AS escuela
+  FROM diploma d
+  JOIN alumno a ON a.alumno_id = d.alumno_id
+  LEFT JOIN curso c ON c.curso_id = d.curso_id
+  LEFT JOIN escuela e ON e.escuela_id = a.escuela_id
+  WHERE d.hash_sha256 IN ({marcadores})
+"""
+
+class ArchivoDemasiadoGrande(Exception):
+    pass
+
+class CuerpoInvalido(ValueError):
+    pass
+
+def hash_stream(binario: BinaryIO, max_bytes: Optional[int] = None) -> str:
+    """SHA-256 leyendo `binario` por bloques en un búfer reutilizado."""
+    h = hashlib.sha256()
+    buf = bytearray(TAMANO_BLOQUE)
+    vista = memoryview(buf)
+    total = 0
+    if not hasattr(binario, "readinto"):
+        # p. ej. SpooledTemporaryFile antes de Python 3.11
+        binario = io.BufferedReader(binario)
+    while True:
+        n = binario.readinto(buf)
+        if not n:
+            break
+        total += n
+        if max_bytes is not None and total > max_bytes:
+            raise ArchivoDemasiadoGrande(f"El archivo supera {max_bytes} bytes")
+        h.update(vista[:n])
+    return h.hexdigest()
+
+class HashCuerpo:
+    """
+    SHA-256 del archivo de una solicitud HTTP, calculado bloque a bloque con `alimentar`.
+    Con multipart/form-data se hashea solo el contenido del campo `campo`; con cualquier
+    otro tipo (application/pdf, application/octet-stream), el cuerpo completo.
+    Lanza ArchivoDemasiadoGrande en cuanto el archivo pasa de `max_bytes`.
+    """
+    def __init__(self, content_type: str, max_bytes: int, campo: str = "file"):
+        self.max_bytes = max_bytes
+        self.campo = campo.encode()
+        self._h = hashlib.sha256()
+        self._bytes = 0
+        self._cuerpo = 0
+        self._encontrado = False
+        self._parser = None
+        tipo, opciones = parse_options_header(content_type or "")
+        if tipo == b"multipart/form-data":
+            if b"boundary" not in opciones:
+                raise CuerpoInvalido("Falta el boundary del multipart")
+            self._en_campo = False
+            self._cabecera, self._valor, self._disposicion = b"", b"", b""
+            self._parser = MultipartParser(opciones[b"boundary"], {
+                "on_part_begin": self._inicio_parte,
+                "on_header_field": lambda d, i, f: self._acumular("_cabecera", d[i:f]),
+                "on_header_value": lambda d, i, f: self._acumular("_valor", d[i:f]),
+                "on_header_end": self._fin_cabecera,
+                "on_headers_finished": self._fin_cabeceras,
+                "on_part_data": lambda d, i, f: self._datos(d[i:f]) if self._en_campo else None,
+                "on_part_end": self._fin_parte,
+            })
+
+    def _acumular(self, atributo: str, datos: bytes):
+        setattr(self, atributo, getattr(self, atributo) + datos)
+
+    def _inicio_parte(self):
+        self._en_campo, self._disposicion = False, b""
+
+    def _fin_cabecera(self):
+        if self._cabecera.lower() == b"content-disposition":
+            self._disposicion = self._valor
+        self._cabecera, self._valor = b"", b""
+
+    def _fin_cabeceras(self):
+        # Solo el primer campo con ese nombre
+        self._en_campo = not self._encontrado and parse_options_header(self._disposicion)[1].get(b"name") == self.campo
+
+    def _fin_parte(self):
+        if self._en_campo:
+            self._encontrado, self._en_campo = True, False
+
+    def _datos(self, datos: bytes):
+        self._bytes += len(datos)
+        if self._bytes > self.max_bytes:
+            raise ArchivoDemasiadoGrande(f"El archivo supera {self.max_bytes} bytes")
+        self._h.update(datos)
+
+    def alimentar(self, bloque: bytes):
+        if self._parser is None:
+            self._encontrado = True
+            self._datos(bloque)
+            return
+        self._cuerpo += len(bloque)
+        if self._cuerpo > self.max_bytes + MARGEN_MULTIPART:
+            raise ArchivoDemasiadoGrande(f"La solicitud supera {self.max_bytes + MARGEN_MULTIPART} bytes")
+        try:
+            self._parser.write(bloque)
+        except MultipartParseError as e:
+            raise CuerpoInvalido(f"Multipart inválido: {e}") from e
+
+    def hexdigest(self) -> str:
+        if self._parser is not None:
+            try:
+                self._parser.finalize()
+            except MultipartParseError as e:
+                raise CuerpoInvalido(f"Multipart inválido: {e}") from e
+        if not self._encontrado:
+            raise CuerpoInvalido(f"Falta el campo '{self.campo.decode()}' con el archivo")
+        return self._h.hexdigest()
+
+def hash_archivo(ruta: Path) -> str:
+    with open(ruta, "rb", buffering=0) as f:
+        return hash_stream(f)
+
+def buscar_por_hash(conn, hashes: Iterable[str]) -> Dict[str, dict]:
+    """hash -> diploma; si un hash aparece más de una vez gana el VALIDO."""
+    hashes = list(dict.fromkeys(h.lower() for h in hashes))
+    encontrados: Dict[str, dict] = {}
+    cur = conn.cursor(dictionary=True)
+    try:
+        for i in range(0, len(hashes), LOTE_CONSULTA):
+            lote = hashes[i:i + LOTE_CONSULTA]
+            cur.execute(SQL_POR_HASH.format(marcadores=", ".join(["%s"] * len(lote))), lote)
+            for row in cur.fetchall():
+                previo = encontrados.get(row["hash_sha256"])
+                if previo is None or (previo["estado"] != "VALIDO" and row["estado"] == "VALIDO"):
+                    encontrados[row["hash_sha256"]] = row
+    finally:
+        cur.close()
+    return encontrados
+
+def dictamen(sha256: str, diploma: Optional[dict]) -> dict:
+    """Resultado público de la verificación de un archivo."""
+    if not diploma:
+        return {"sha256": sha256, "autentico": False, "mensaje": "El archivo no corresponde a ningún diploma emitido (o fue modificado)."}
+    return {
+        "sha256": sha256,
+        # Sin modificar y vigente
+        "autentico": diploma["estado"] == "VALIDO",
+        "estado": diploma["estado"],
+        "folio": diploma["folio"],
+        "alumno": diploma["alumno"],
+        "curso": diploma["curso"],
+        "escuela": diploma["escuela"],
+        "fecha_emision": diploma["fecha_emision"].isoformat() if diploma.get("fecha_emision") else None,
+    }
+
+def _archivos(rutas: List[str]) -> List[Path]:
+    salida = []
+    for r in rutas:
+        p = Path(r)
+        if p.is_dir():
+            salida.extend(sorted(x for x in p.rglob("*") if x.is_file() and x.suffix.lower() == ".pdf"))
+        elif p.is_file():
+            salida.append(p)
+        else:
+            print(f"⚠️ No existe: {r}", file=sys.stderr)
+    return salida
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica PDFs de diplomas contra hash_sha256")
+    parser.add_argument("rutas", nargs="+", help="Archivos PDF o carpetas")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Archivos que se hashean a la vez")
+    args = parser.parse_args()
+
+    archivos = _archivos(args.rutas)
+    if not archivos:
+        print("No hay PDFs que verificar.")
+        return 1
+    # hashlib libera el GIL con bloques grandes: los hilos sí hashean en paralelo
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        hashes = list(pool.map(hash_archivo, archivos))
+
+    conn = db_pool.get_connection()
+    try:
+        encontrados = buscar_por_hash(conn, hashes)
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+    autenticos = 0
+    for ruta, sha in zip(archivos, hashes):
+        r = dictamen(sha, encontrados.get(sha))
+        if r["autentico"]:
+            autenticos += 1
+            print(f"✅ {ruta}: auténtico · folio {r['folio']} · {r['alumno']}")
+        elif "estado" in r:
+            print(f"⚠️ {ruta}: diploma {r['estado']} · folio {r['folio']} · {r['alumno']}")
+        else:
+            print(f"❌ {ruta}: no coincide con ningún diploma emitido")
+    print(f"{autenticos}/{len(archivos)} archivo(s) auténticos.")
+    return 0 if autenticos == len(archivos) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Worker de generación de diplomas. Corre como proceso aparte de la API:
+
+    python worker_diplomas.py --concurrencia 2 --workers 4
+
+- Reclama trabajos PENDIENTE de `trabajo_generacion` y ejecuta varios cursos a la vez.
+- Reporta progreso (hechos/total) y latidos; atiende las solicitudes de cancelación.
+- Cada MANTENIMIENTO_SEGUNDOS renueva el latido de sus trabajos y devuelve a PENDIENTE los
+  que quedaron huérfanos (sin latido en TRABAJO_TIMEOUT), también los de una instancia
+  anterior de este mismo worker.
+- Reconcilia periódicamente las estadísticas del panel (ESTADISTICAS_RECONCILIAR).
+"""
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import trabajos
+import estadisticas
+import generar_diplomas as gen
+
+POLL_SEGUNDOS = 2.0
+# Mínimo de segundos entre escrituras de progreso / lecturas de cancelación
+INTERVALO_REPORTE = 1.0
+# Los pools de render se crean desde un proceso con varios hilos (cursos, subidas, pool de BD):
+# con "fork" un hijo podría heredar un lock tomado y quedarse colgado.
+CONTEXTO_POOL = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+# Cada cuántos segundos se renuevan los latidos propios y se recuperan los trabajos abandonados
+MANTENIMIENTO_SEGUNDOS = 30.0
+
+class EnCurso:
+    """Trabajos que este worker está ejecutando (para renovar su latido)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = set()
+
+    def agregar(self, trabajo_id: int):
+        with self._lock:
+            self._ids.add(trabajo_id)
+
+    def quitar(self, trabajo_id: int):
+        with self._lock:
+            self._ids.discard(trabajo_id)
+
+    def ids(self):
+        with self._lock:
+            return list(self._ids)
+
+def mantenimiento(conn, en_curso: EnCurso):
+    trabajos.latir(conn, en_curso.ids())
+    recuperados = trabajos.recuperar_abandonados(conn)
+    if recuperados:
+        print(f"[worker] {recuperados} trabajo(s) abandonados vueltos a PENDIENTE")
+
+def ejecutar_trabajo(trabajo: dict, workers: int):
+    trabajo_id, curso_id = trabajo["trabajo_id"], trabajo["curso_id"]
+    print(f"[worker] Trabajo {trabajo_id}: curso {curso_id}")
+    conn = trabajos.nueva_conexion()
+    estado = {"hechos": 0, "total": 0, "ultimo": 0.0, "cancelar": False}
+
+    def progreso(hechos: int, total: int):
+        estado["hechos"], estado["total"] = hechos, total
+        ahora = time.monotonic()
+        if hechos == 0 or hechos == total or ahora - estado["ultimo"] >= INTERVALO_REPORTE:
+            estado["ultimo"] = ahora
+            trabajos.actualizar_progreso(conn, trabajo_id, hechos, total)
+            estado["cancelar"] = trabajos.cancelacion_solicitada(conn, trabajo_id)
+
+    try:
+        resumen = gen.generar_diplomas_para_curso(curso_id, trabajo["fecha_emision"], workers=workers,
+                                                  contexto_pool=CONTEXTO_POOL, progreso=progreso, cancelado=lambda: estado["cancelar"])
+        # Los fallidos quedaron en la lista de reintentos del curso
+        trabajos.actualizar_progreso(conn, trabajo_id, estado["hechos"], estado["total"], resumen["fallidos"])
+        if resumen["total"] and resumen["fallidos"] == resumen["total"]:
+            # Ningún diploma salió: falla sistémica (plantilla, almacenamiento...), no un éxito
+            trabajos.finalizar(conn, trabajo_id, "FALLIDO",
+                               f"Fallaron los {resumen['total']} diploma(s); quedaron en la lista de reintentos")
+        else:
+            trabajos.finalizar(conn, trabajo_id, "COMPLETADO")
+    except gen.GeneracionCancelada:
+        trabajos.finalizar(conn, trabajo_id, "CANCELADO")
+    except gen.CursoOcupado as e:
+        # Otra corrida (CLI o cron) tiene el curso; esta no tocó nada
+        trabajos.finalizar(conn, trabajo_id, "FALLIDO", str(e))
+    except Exception as e:
+        # Solo se deshizo el bloque en curso; encolar de nuevo el curso reanuda desde su punto de control
+        trabajos.actualizar_progreso(conn, trabajo_id, estado["hechos"], estado["total"], estado["total"] - estado["hechos"])
+        trabajos.finalizar(conn, trabajo_id, "FALLIDO", str(e)[:2000])
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de generación de diplomas")
+    parser.add_argument("--concurrencia", type=int, default=1, help="Cursos que se generan a la vez")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos de render por curso")
+    parser.add_argument("--una-vez", action="store_true", help="Procesa lo pendiente y termina")
+    args = parser.parse_args()
+
+    if CONTEXTO_POOL == "forkserver":
+        # El servidor arranca con el módulo ya importado; cada pool solo hace fork de él
+        multiprocessing.set_forkserver_preload(["generar_diplomas"])
+    nombre = trabajos.nombre_worker()
+    conn = trabajos.nueva_conexion()
+    trabajos.asegurar_tabla(conn)
+    en_curso = EnCurso()
+    ultimo_mantenimiento = 0.0
+
+    cupos = threading.Semaphore(args.concurrencia)
+    print(f"[worker] {nombre} esperando trabajos (concurrencia={args.concurrencia}, workers={args.workers})")
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+        try:
+            while True:
+                if time.monotonic() - ultimo_mantenimiento >= MANTENIMIENTO_SEGUNDOS:
+                    ultimo_mantenimiento = time.monotonic()
+                    try:
+                        mantenimiento(conn, en_curso)
+                    except Exception as e:
+                        conn.rollback()
+                        print(f"[worker] Falló el mantenimiento de trabajos: {e}")
+                try:
+                    estadisticas.reconciliar_si_toca(conn)
+                except Exception as e:
+                    print(f"[worker] No se pudieron reconciliar las estadísticas: {e}")
+                if not cupos.acquire(timeout=POLL_SEGUNDOS):
+                    continue
+                trabajo = trabajos.reclamar_siguiente(conn, nombre)
+                if not trabajo:
+                    cupos.release()
+                    if args.una_vez:
+                        break
+                    time.sleep(POLL_SEGUNDOS)
+                    continue
+                en_curso.agregar(trabajo["trabajo_id"])
+                fut = pool.submit(ejecutar_trabajo, trabajo, args.workers)
+                fut.add_done_callback(lambda _, t=trabajo["trabajo_id"]: (en_curso.quitar(t), cupos.release()))
+        except KeyboardInterrupt:
+            print("[worker] Deteniendo; los trabajos en curso terminan antes de salir.")
+        finally:
+            if conn and conn.is_connected(): conn.close()
+
+if __name__ == "__main__":
+    main()
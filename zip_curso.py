@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+ZIP con los PDFs de los diplomas vigentes de un curso, generado por partes.
+- Cada PDF se descarga completo a un temporal (en memoria hasta SPOOL_BYTES) antes de
+  escribir su entrada, así una descarga que falla a la mitad no deja una entrada cortada;
+  el ZIP se entrega al vuelo y nunca queda completo en memoria.
+- Las entradas van sin comprimir (ZIP_STORED): los PDFs ya vienen comprimidos.
+- Los diplomas diferidos (sin PDF todavía) se renderizan al llegar a ellos.
+- Si falta algún PDF o no se pudo obtener (error de red o del almacenamiento), se lista
+  en FALTANTES.txt al final del ZIP.
+La API lo sirve en GET /admin/curso/{curso_id}/diplomas.zip; desde la terminal:
+
+    python zip_curso.py --curso_id 3 --salida curso3.zip
+"""
+import re
+import sys
+import argparse
+import zipfile
+import tempfile
+from typing import Iterator, List
+
+import db_pool
+import almacenamiento
+import diferido
+
+SQL_DIPLOMAS_ZIP = """
+  SELECT d.folio, d.fecha_emision, d.pdf_path, d.hash_sha256, a.nombre AS alumno
+  FROM diploma d
+  JOIN alumno a ON a.alumno_id = d.alumno_id
+  WHERE d.curso_id = %s AND d.estado = 'VALIDO'
+  ORDER BY a.nombre, d.folio
+"""
+
+# Un PDF descargado pasa de memoria a disco al superar este tamaño
+SPOOL_BYTES = 4 * 1024 * 1024
+
+class _Salida:
+    """Destino de escritura sin seek para ZipFile: acumula lo escrito hasta que se recoge."""
+    def __init__(self):
+        self._buf = bytearray()
+
+    def write(self, datos) -> int:
+        self._buf += datos
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def recoger(self) -> Iterator[bytes]:
+        """Entrega lo acumulado (nada si está vacío) y vacía el búfer."""
+        if self._buf:
+            datos = bytes(self._buf)
+            self._buf.clear()
+            yield datos
+
+def diplomas_curso(curso_id: int) -> List[dict]:
+    conn = db_pool.get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(SQL_DIPLOMAS_ZIP, (curso_id,))
+        filas = cur.fetchall()
+        cur.close()
+        return filas
+    finally:
+        if conn and conn.is_connected(): conn.close()
+
+def nombre_entrada(diploma: dict) -> str:
+    alumno = re.sub(r"[^\w\-]+", "_", diploma["alumno"]).strip("_") or "diploma"
+    return f"{alumno}_{diploma['folio']}.pdf"
+
+def _contenido(diploma: dict) -> Iterator[bytes]:
+    """Bloques del PDF; FileNotFoundError si no está en el almacenamiento."""
+    if not diploma["hash_sha256"]:
+        pdf = diferido.asegurar_pdf(diploma["folio"])
+        if pdf is None:
+            raise FileNotFoundError(diploma["folio"])
+        if pdf.pdf_bytes is not None:
+            return iter([pdf.pdf_bytes])
+        diploma = {**diploma, "pdf_path": pdf.pdf_path}
+    if not diploma["pdf_path"]:
+        raise FileNotFoundError(diploma["folio"])
+    return almacenamiento.get_almacenamiento().leer(diploma["pdf_path"])
+
+def _descargar(diploma: dict) -> tempfile.SpooledTemporaryFile:
+    """PDF completo del diploma en un temporal, listo para leer desde el inicio."""
+    copia = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    try:
+        for bloque in _contenido(diploma):
+            copia.write(bloque)
+    except BaseException:
+        copia.close()
+        raise
+    copia.seek(0)
+    return copia
+
+def zip_diplomas(diplomas: List[dict]) -> Iterator[bytes]:
+    """Iterador de bytes del ZIP; cada entrada se entrega por bloques en cuanto se escribe."""
+    salida = _Salida()
+    faltantes = []
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_STORED) as zf:
+        for diploma in diplomas:
+            try:
+                copia = _descargar(diploma)
+            except Exception as e:
+                # Cualquier fallo (no existe, red, almacenamiento) deja fuera solo este diploma
+                print(f"⚠️ [ZIP] Sin PDF para el folio {diploma['folio']}: {e}")
+                faltantes.append(diploma["folio"])
+                continue
+            info = zipfile.ZipInfo(nombre_entrada(diploma), date_time=diploma["fecha_emision"].timetuple()[:6])
+            with copia, zf.open(info, "w") as entrada:
+                for bloque in iter(lambda: copia.read(almacenamiento.TAMANO_BLOQUE), b""):
+                    entrada.write(bloque)
+                    yield from salida.recoger()
+            yield from salida.recoger()
+        if faltantes:
+            zf.writestr("FALTANTES.txt", "Folios cuyo PDF no se pudo obtener del almacenamiento:\n" + "\n".join(faltantes) + "\n")
+    yield from salida.recoger()
+
+def main():
+    parser = argparse.ArgumentParser(description="ZIP con los diplomas de un curso")
+    parser.add_argument("--curso_id", type=int, required=True)
+    parser.add_argument("--salida", help="Archivo de salida (por defecto, la salida estándar)")
+    args = parser.parse_args()
+
+    diplomas = diplomas_curso(args.curso_id)
+    if not diplomas:
+        print(f"El curso {args.curso_id} no tiene diplomas vigentes.", file=sys.stderr)
+        return 1
+    destino = open(args.salida, "wb") if args.salida else sys.stdout.buffer
+    try:
+        for bloque in zip_diplomas(diplomas):
+            destino.write(bloque)
+    finally:
+        if args.salida:
+            destino.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())